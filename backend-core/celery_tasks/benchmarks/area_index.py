@@ -0,0 +1,49 @@
+# python -m celery_tasks.benchmarks.area_index [peaks]
+# per-peak slice integration against AreaIndex lookups on a long trace
+import sys
+import time
+
+import numpy as np
+
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.peak_table import PeakTable
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 10  # ms
+LENGTH = 720000  # 2 hours
+
+
+def slice_areas(data: Trace, peaks: PeakTable) -> np.ndarray:
+    # the integration before the index: a slice, a line and a trapezoid per peak
+    areas = np.empty(len(peaks))
+    for row in range(len(peaks)):
+        data_slice = peaks.peak(row).get_data_slice(data)
+        values = data_slice.values - HPLCProcessing.baseline_lin(data_slice)
+        areas[row] = HPLCProcessing.area_peak(data_slice.with_values(values))
+    return areas
+
+
+def main(count: int):
+    rng = np.random.default_rng(0)
+    data = Trace.from_period(rng.normal(100, 5, LENGTH), PERIOD)
+    starts = rng.uniform(0, data.time(LENGTH - 1) - 1, count)
+    peaks = PeakTable.from_arrays(starts + 0.25, starts, starts + rng.uniform(0.05, 1, count))
+
+    started = time.perf_counter()
+    expected = slice_areas(data, peaks)
+    legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = AreaIndex(data)
+    built = time.perf_counter() - started
+    areas = index.area_peak_lin(peaks.start, peaks.end)
+    lookup = time.perf_counter() - started - built
+
+    print(f'{count} peaks on {LENGTH} samples')
+    print(f'slices {1000 * legacy:.1f} ms, index build {1000 * built:.1f} ms + lookups {1000 * lookup:.2f} ms, '
+          f'max difference {np.abs(areas - expected).max():.2e}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
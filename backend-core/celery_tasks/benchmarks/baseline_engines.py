@@ -0,0 +1,45 @@
+# python -m celery_tasks.benchmarks.baseline_engines [repeats]
+# runtime and error of the baseline engines against a known drifting baseline, for several trace lengths
+import sys
+import time
+
+import numpy as np
+
+from celery_tasks.hplc.baseline import ALS, ARPLS, AIRPLS, MORPHOLOGICAL
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+NOISE = 0.05  # mAU
+LENGTHS = (15, 60, 240)  # minutes
+
+
+def synthetic_run(minutes: int, seed: int = 0):
+    # wavy drifting baseline under a peak every 1.5 minutes on average, returns the trace and the baseline
+    rng = np.random.default_rng(seed)
+    x = np.arange(int(minutes * 60 * 1000 / PERIOD)) * PERIOD / 1000 / 60
+    baseline = 5 + 0.02 * x + 0.5 * np.sin(2 * np.pi * x / 40) + 0.3 * np.exp(-x / 3)
+    y = baseline + rng.normal(0, NOISE, len(x))
+    for center in rng.uniform(1, minutes - 1, int(minutes / 1.5)):
+        sigma = rng.uniform(0.03, 0.15)
+        y += rng.uniform(1, 200) * np.exp(-(x - center) ** 2 / (2 * sigma ** 2))
+    return Trace.from_period(y, PERIOD), baseline
+
+
+def main(repeats: int):
+    print(f'{"minutes":>8} {"engine":>14} {"ms":>8} {"rmse, noise":>12} {"p99 abs, noise":>15}')
+    for minutes in LENGTHS:
+        data, truth = synthetic_run(minutes)
+        data = HPLCProcessing.preprocess(data)
+        for engine in (ALS, ARPLS, AIRPLS, MORPHOLOGICAL):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                baseline = HPLCProcessing.get_baseline(data, engine=engine)
+            elapsed = (time.perf_counter() - started) / repeats
+            error = np.abs(baseline.values - truth) / NOISE
+            print(f'{minutes:>8} {engine:>14} {1000 * elapsed:>8.2f} {np.sqrt(np.mean(error ** 2)):>12.2f} '
+                  f'{np.quantile(error, 0.99):>15.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
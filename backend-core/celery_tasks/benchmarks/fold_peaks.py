@@ -0,0 +1,61 @@
+# python -m celery_tasks.benchmarks.fold_peaks [sizes...]
+import itertools
+import sys
+import timeit
+from typing import List
+
+import numpy as np
+
+from celery_tasks.hplc.peak_table import PeakTable
+from celery_tasks.hplc_processing import HPLCProcessing
+
+
+class LegacyPeak:
+    def __init__(self, apex, start, end):
+        self.apex = apex
+        self.start = start
+        self.end = end
+        self.peaks = []
+
+
+def legacy_fold_peaks(peaks: List[LegacyPeak]) -> List[LegacyPeak]:
+    for peak in peaks:
+        peak.peaks = list(filter(lambda o: o.start > peak.start and o.end < peak.end, peaks))
+        peak.peaks = sorted(peak.peaks, key=lambda o: o.apex)
+
+    all_folded_peaks = list(itertools.chain.from_iterable([peak.peaks for peak in peaks]))
+
+    return list(filter(lambda o: o not in all_folded_peaks, peaks))
+
+
+def synthetic_peaks(count: int, seed=0) -> PeakTable:
+    # apexes spread over a run long enough that roughly a third of the peaks overlap a neighbour
+    rng = np.random.default_rng(seed)
+    apexes = np.sort(rng.uniform(0, count * 0.5, count))
+    lefts = rng.uniform(0.05, 0.4, count)
+    rights = rng.uniform(0.05, 0.4, count)
+    return PeakTable.from_arrays(apexes, apexes - lefts, apexes + rights)
+
+
+def bench_legacy(count: int, repeat: int) -> float:
+    table = synthetic_peaks(count)
+    peaks = [LegacyPeak(*o) for o in zip(table.apex, table.start, table.end)]
+    return min(timeit.repeat(lambda: legacy_fold_peaks(peaks), number=1, repeat=repeat))
+
+
+def bench_sweep(count: int, repeat: int) -> float:
+    table = synthetic_peaks(count)
+    return min(timeit.repeat(lambda: HPLCProcessing.fold_peaks(table.take(np.arange(count))), number=1, repeat=repeat))
+
+
+def main(sizes):
+    print(f'{"peaks":>8} {"legacy, s":>12} {"sweep, s":>12} {"speedup":>9}')
+    for count in sizes:
+        repeat = 1 if count >= 5000 else 3
+        legacy = bench_legacy(count, repeat)
+        sweep = bench_sweep(count, repeat)
+        print(f'{count:>8} {legacy:>12.5f} {sweep:>12.5f} {legacy / sweep:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(o) for o in sys.argv[1:]] or [10, 100, 1000, 10000])
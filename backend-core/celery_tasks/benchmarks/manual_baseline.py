@@ -0,0 +1,50 @@
+# python -m celery_tasks.benchmarks.manual_baseline [points]
+# a manual baseline from user points on a 4 hour trace: the former reindex of a series onto every sample
+# against the knots and their interpolation onto the grid
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from celery_tasks.hplc.knots import BaselineKnots, LINEAR, PCHIP
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+LENGTH = 144000
+
+
+def reindexed(grid: Trace, times, values) -> pd.Series:
+    # the manual_baseline task before the knots
+    baseline = pd.Series(dict(zip(times, values)))
+    x = grid.times
+    return baseline.reindex(x, tolerance=x[1] - x[0], method='nearest').interpolate(limit_direction='both')
+
+
+def timed(func, *args, repeats=20):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = func(*args)
+    return 1000 * (time.perf_counter() - started) / repeats, result
+
+
+def main(points: int):
+    rng = np.random.default_rng(0)
+    grid = Trace.from_period(np.zeros(LENGTH), PERIOD)
+    # points dragged in the UI land anywhere, not on samples
+    times = np.sort(rng.uniform(0, grid.times[-1], points))
+    values = 5 + rng.normal(0, 1, points)
+    spacing = HPLCProcessing.knot_spacing(grid)
+
+    elapsed, series = timed(reindexed, grid, times, values)
+    print(f'reindex: {elapsed:.2f} ms, {series.count()} samples')
+    for mode in (LINEAR, PCHIP):
+        knots_elapsed, knots = timed(BaselineKnots.from_points, times, values, spacing, mode)
+        grid_elapsed, baseline = timed(knots.on_grid, grid)
+        print(f'{mode}: knots {knots_elapsed:.2f} ms ({len(knots)} knots), on the grid {grid_elapsed:.2f} ms, '
+              f'max difference to reindex {np.abs(baseline.values - series.values).max():.3f} mAU')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
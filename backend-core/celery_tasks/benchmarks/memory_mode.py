@@ -0,0 +1,50 @@
+# python -m celery_tasks.benchmarks.memory_mode [minutes] [period_ms]
+# peak traced memory of the default and the float32 in place modes on a long high rate trace
+import sys
+import time
+
+import numpy as np
+
+from celery_tasks.hplc.segments import SegmentExecutor
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+
+def synthetic_trace(minutes: float, period: float) -> np.ndarray:
+    # drifting baseline with a gaussian peak every minute, as raw integer samples like get_data_intarray()
+    rng = np.random.default_rng(0)
+    x = np.arange(int(minutes * 60000 / period)) * period / 1000 / 60
+    y = 500 + 20 * x + rng.normal(0, 5, len(x))
+    for center in np.arange(1, minutes, 1.):
+        y += rng.uniform(1000, 20000) * np.exp(-(x - center) ** 2 / (2 * rng.uniform(0.03, 0.1) ** 2))
+    return np.round(y).astype(np.int32)
+
+
+def run(y: np.ndarray, period: float, dtype, segments: bool):
+    # segments bound the float64 and index temporaries of scipy peak finding to one segment
+    data = Trace.from_period(y, period, dtype)
+    processing = HPLCProcessing(data, segment_executor=SegmentExecutor() if segments else None, dtype=dtype,
+                                overwrite_data=True, trace_memory=True)
+    started = time.perf_counter()
+    table, _ = processing.process()
+    return table, processing.peak_memory, time.perf_counter() - started
+
+
+def main(minutes: float, period: float):
+    y = synthetic_trace(minutes, period)
+    print(f'{len(y)} samples, raw int32 {y.nbytes / 2 ** 20:.1f} MiB')
+    print(f'{"dtype":>8} {"segments":>9} {"peak MiB":>9} {"bytes/sample":>13} {"s":>6} {"peaks":>6}')
+    tables = {}
+    for dtype in (np.float64, np.float32):
+        for segments in (False, True):
+            table, peak, elapsed = run(y, period, dtype, segments)
+            tables[dtype] = table
+            print(f'{np.dtype(dtype).name:>8} {str(segments):>9} {peak / 2 ** 20:>9.1f} {peak / len(y):>13.1f} '
+                  f'{elapsed:>6.2f} {len(table):>6}')
+    a, b = tables[np.float64], tables[np.float32]
+    if len(a) == len(b):
+        print(f'max relative area difference {np.nanmax(np.abs(a.area - b.area) / np.abs(a.area)):.2e}')
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 120, float(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -0,0 +1,77 @@
+# python -m celery_tasks.benchmarks.mixed_peak_fit [runs]
+# accuracy versus speed of the mixed peak engines on synthetic co-eluting clusters
+import sys
+import time
+
+import numpy as np
+from scipy import stats
+
+from celery_tasks.hplc.fitting import CURVE_FIT, NNLS, FitExecutor
+from celery_tasks.hplc.peak_table import FIT_CONVERGED
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+LENGTH = 30000
+
+
+def synthetic_run(seed: int):
+    # clusters of 2-3 slightly skewed peaks, 2.5-4 sigmas apart, returns the trace and (center, area) pairs
+    rng = np.random.default_rng(seed)
+    x = np.arange(LENGTH) * PERIOD / 1000 / 60
+    y = 5 + 0.1 * x + rng.normal(0, 0.05, LENGTH)
+    truth = []
+    for cluster_center in np.linspace(5, x[-1] - 5, 6):
+        center = cluster_center
+        for _ in range(rng.integers(2, 4)):
+            sigma = rng.uniform(0.04, 0.1)
+            area = rng.uniform(3, 20)
+            skew = rng.uniform(-1, 1)
+            y += area * stats.skewnorm.pdf(x, skew, center, sigma)
+            truth.append((center, area))
+            center += rng.uniform(2.5, 4) * sigma
+    return Trace.from_period(y, PERIOD), np.array(truth)
+
+
+def detect(data: Trace):
+    # the pipeline up to folding, shared by both engines
+    processing = HPLCProcessing(data)
+    data = processing.preprocess(processing.data)
+    data, _ = processing.correct_baseline(data)
+    return data, processing.detect_peaks(data, processing.find_threshold(data))
+
+
+def area_errors(peaks, truth) -> np.ndarray:
+    # relative errors of the fitted areas against the nearest true peak
+    rows = np.flatnonzero(peaks.fit_status == FIT_CONVERGED)
+    nearest = np.abs(truth[:, 0][None, :] - peaks.apex[rows][:, None]).argmin(axis=1)
+    return np.abs(peaks.area[rows] - truth[nearest, 1]) / truth[nearest, 1]
+
+
+def main(runs: int):
+    executor = FitExecutor()
+    results = {CURVE_FIT: ([], [], 0), NNLS: ([], [], 0)}
+    for seed in range(runs):
+        data, truth = synthetic_run(seed)
+        corrected, folded = detect(data)
+        for engine in (CURVE_FIT, NNLS):
+            peaks = folded.take(np.arange(len(folded)))
+            started = time.perf_counter()
+            peaks = HPLCProcessing.fit_peaks(corrected, peaks, executor, engine)
+            elapsed = time.perf_counter() - started
+            peaks = HPLCProcessing.set_area_peaks(corrected, peaks)
+
+            times, errors, failed = results[engine]
+            times.append(elapsed)
+            errors.extend(area_errors(peaks, truth))
+            failed += int((peaks.fit_status[peaks.mixed] != FIT_CONVERGED).sum())
+            results[engine] = (times, errors, failed)
+
+    print(f'{"engine":>10} {"fit, ms/run":>12} {"median err":>11} {"p95 err":>9} {"failed":>7}')
+    for engine, (times, errors, failed) in results.items():
+        print(f'{engine:>10} {1000 * np.mean(times):>12.2f} {np.median(errors):>10.2%} '
+              f'{np.quantile(errors, 0.95):>8.2%} {failed:>7}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,70 @@
+# python -m celery_tasks.benchmarks.multichannel [channels]
+# a DAD run processed channel by channel against MultiChannelProcessing
+import sys
+import time
+
+import numpy as np
+
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_multichannel import MultiChannelProcessing
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+LENGTH = 36000  # 1 hour
+PEAKS = [(5, 0.05), (12, 0.08), (20, 0.06), (31, 0.1), (44, 0.07), (52, 0.05)]  # center, sigma in minutes
+
+
+def synthetic_run(channels: int) -> np.ndarray:
+    # the same separated peaks with a spectrum per peak, samples x channels
+    rng = np.random.default_rng(0)
+    x = np.arange(LENGTH) * PERIOD / 1000 / 60
+    values = 5 + 0.1 * x[:, None] + rng.normal(0, 0.05, (LENGTH, channels))
+    for center, sigma in PEAKS:
+        values += np.exp(-(x - center) ** 2 / (2 * sigma ** 2))[:, None] * rng.uniform(5, 100, channels)
+    return values
+
+
+def single_stages(values: np.ndarray):
+    # the per channel work MultiChannelProcessing batches: preprocessing, baseline and threshold
+    for i in range(values.shape[1]):
+        data = HPLCProcessing.preprocess(Trace.from_period(values[:, i], PERIOD))
+        data, _ = HPLCProcessing.correct_baseline(data, HPLCProcessing.fit_baseline(data)[0])
+        HPLCProcessing.find_threshold(data)
+
+
+def multi_stages(values: np.ndarray):
+    processing = MultiChannelProcessing.from_period(values, PERIOD)
+    data = processing.preprocess(np.array(values.T, order='C'))
+    baselines = processing.fit_baselines(data)
+    np.minimum(data, baselines, out=baselines)
+    data -= baselines
+    processing.find_thresholds(data)
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main(channels: int):
+    values = synthetic_run(channels)
+    print(f'{channels} channels x {LENGTH} samples')
+    print(f'baselines and thresholds: channel by channel {1000 * timed(single_stages, values):.0f} ms, '
+          f'multi-channel {1000 * timed(multi_stages, values):.0f} ms')
+
+    started = time.perf_counter()
+    expected = [HPLCProcessing(Trace.from_period(values[:, i], PERIOD)).process()[0] for i in range(channels)]
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tables, _ = MultiChannelProcessing.from_period(values, PERIOD).process()
+    multi = time.perf_counter() - started
+
+    same = all(np.array_equal(a.apex, b.apex) and np.allclose(a.area, b.area) for a, b in zip(tables, expected))
+    print(f'whole runs, peak fits included: channel by channel {1000 * single:.0f} ms, '
+          f'multi-channel {1000 * multi:.0f} ms, same peaks: {same}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 32)
@@ -0,0 +1,47 @@
+# python -m celery_tasks.benchmarks.raw_peaks [regions]
+# manual integration of many regions of a 4 hour trace: calc_raw_peak region by region, as add_peak did,
+# against calc_raw_peaks on the whole trace
+import sys
+import time
+
+import numpy as np
+
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+LENGTH = 144000
+
+
+def one_by_one(data: Trace, starts, ends, start_maus, end_maus):
+    # a fresh index of each slice, every add_peak message decoded the trace anew
+    return [HPLCProcessing.calc_raw_peak(data.slice(start, end), {'time': start, 'mau': start_mau},
+                                         {'time': end, 'mau': end_mau})
+            for start, end, start_mau, end_mau in zip(starts, ends, start_maus, end_maus)]
+
+
+def timed(func, *args, repeats=20):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        result = func(*args)
+    return 1000 * (time.perf_counter() - started) / repeats, result
+
+
+def main(regions: int):
+    rng = np.random.default_rng(0)
+    data = Trace.from_period(rng.normal(5, 1, LENGTH), PERIOD)
+    starts = np.sort(rng.uniform(0, data.times[-1] - 1, regions))
+    ends = starts + rng.uniform(0.1, 1, regions)
+    start_maus, end_maus = rng.normal(5, 1, regions), rng.normal(5, 1, regions)
+
+    elapsed, peaks = timed(one_by_one, data, starts, ends, start_maus, end_maus)
+    print(f'calc_raw_peak: {elapsed:.2f} ms')
+    index_elapsed, index = timed(AreaIndex, data)
+    elapsed, table = timed(HPLCProcessing.calc_raw_peaks, data, starts, ends, start_maus, end_maus, index)
+    print(f'calc_raw_peaks: {elapsed:.2f} ms, area index {index_elapsed:.2f} ms once per trace, '
+          f'max area difference {np.abs(table.area - [o.area for o in peaks]).max():.2e}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
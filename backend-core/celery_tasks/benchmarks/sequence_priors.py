@@ -0,0 +1,78 @@
+# python -m celery_tasks.benchmarks.sequence_priors [injections]
+# a sequence of injections of one method processed cold against warm started from the previous injection
+import sys
+import time
+
+import numpy as np
+from scipy import stats
+
+from celery_tasks.hplc.peak_table import FIT_CONVERGED
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PERIOD = 100  # ms
+LENGTH = 30000
+DRIFT = 0.01  # retention drift between injections, minutes
+
+
+def method_peaks(seed: int = 0) -> np.ndarray:
+    # clusters of 2-3 co-eluting skewed peaks: center, area, sigma, skew
+    rng = np.random.default_rng(seed)
+    peaks = []
+    for center in np.linspace(5, LENGTH * PERIOD / 1000 / 60 - 5, 8):
+        for _ in range(rng.integers(2, 4)):
+            sigma = rng.uniform(0.04, 0.1)
+            peaks.append((center, rng.uniform(3, 20), sigma, rng.uniform(-1, 1)))
+            center += rng.uniform(2.5, 4) * sigma
+    return np.array(peaks)
+
+
+def injection(peaks: np.ndarray, seed: int):
+    # the method peaks with some retention drift, area scatter and fresh noise, returns the trace and
+    # (center, area) pairs
+    rng = np.random.default_rng(seed)
+    x = np.arange(LENGTH) * PERIOD / 1000 / 60
+    y = 5 + 0.1 * x + rng.normal(0, 0.05, LENGTH)
+    shift = rng.normal(0, DRIFT)
+    truth = []
+    for center, area, sigma, skew in peaks:
+        area *= rng.uniform(0.98, 1.02)
+        y += area * stats.skewnorm.pdf(x, skew, center + shift, sigma)
+        truth.append((center + shift, area))
+    return Trace.from_period(y, PERIOD), np.array(truth)
+
+
+def area_errors(peaks, truth) -> np.ndarray:
+    # relative errors of the fitted areas against the nearest true peak
+    rows = np.flatnonzero(peaks.fit_status == FIT_CONVERGED)
+    nearest = np.abs(truth[:, 0][None, :] - peaks.apex[rows][:, None]).argmin(axis=1)
+    return np.abs(peaks.area[rows] - truth[nearest, 1]) / truth[nearest, 1]
+
+
+def main(injections: int):
+    peaks = method_peaks()
+    runs, truths = zip(*(injection(peaks, seed) for seed in range(injections)))
+
+    started = time.perf_counter()
+    cold = [HPLCProcessing(data).process()[0] for data in runs]
+    cold_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    warm, prior = [], None
+    for data in runs:
+        processing = HPLCProcessing(data, sequence_prior=prior)
+        table, _ = processing.process()
+        prior = HPLCProcessing.sequence_prior(table, processing.baseline_prior)
+        warm.append(table)
+    warm_time = time.perf_counter() - started
+
+    for name, tables, elapsed in (('cold', cold, cold_time), ('warm', warm, warm_time)):
+        converged = sum(int((o.fit_status[o.mixed] == FIT_CONVERGED).sum()) for o in tables)
+        groups = sum(len(o.mixed) for o in tables)
+        errors = np.concatenate([area_errors(o, truth) for o, truth in zip(tables, truths)])
+        print(f'{name}: {1000 * elapsed / injections:.0f} ms/injection, {converged}/{groups} groups converged, '
+              f'median area error {np.median(errors):.2%}, p95 {np.quantile(errors, 0.95):.2%}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -16,6 +16,9 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+# tasks editing one measurement go to the worker holding its decoded trace, see routing.py
+app.conf.task_routes = ('celery_tasks.routing.route_by_measurement',)
+
 
 @app.task(bind=True)
 def debug_task(self):
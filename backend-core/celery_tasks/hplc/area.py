@@ -0,0 +1,55 @@
+from typing import Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.trace import Trace
+
+
+class AreaIndex:
+    # cumulative sums of a trace, trapezoid areas of any sample range [i, j] in O(1):
+    # dt * (sum(values[i:j + 1]) - (values[i] + values[j]) / 2), accumulated in float64.
+    # all methods take scalars or arrays, ranges with less than 2 samples have no area
+    __slots__ = ('data', 'cumsum')
+
+    def __init__(self, data: Trace):
+        self.data = data
+        self.cumsum = np.concatenate([[0.], np.cumsum(data.values, dtype=np.float64)])
+
+    def bounds(self, start, end) -> Tuple[np.ndarray, np.ndarray]:
+        # first and last sample within [start, end] in minutes, like Trace.slice
+        return self.data.index_left(start), self.data.index_right(end)
+
+    def _sums(self, i, j):
+        i, j = np.asarray(i), np.asarray(j)
+        count = j - i + 1
+        valid = count >= 2
+        i, j = np.where(valid, i, 0), np.where(valid, j, 0)
+        values = self.data.values
+        ends = values[i].astype(np.float64) + values[j]
+        return self.cumsum[j + 1] - self.cumsum[i], ends, count, valid
+
+    def trapezoid(self, i, j):
+        sums, ends, _, valid = self._sums(i, j)
+        return np.where(valid, self.data.dt * (sums - ends / 2), 0.)
+
+    def area_lin(self, i, j):
+        # above the straight line between the first and the last sample, the line is n - 1 steps wide
+        sums, ends, count, valid = self._sums(i, j)
+        return np.where(valid, self.data.dt * (sums - count * ends / 2), 0.)
+
+    def area_above_line(self, i, j, line_i, line_j, value_i, value_j):
+        # above the line through (line_i, value_i) and (line_j, value_j) in samples, over [i, j]
+        i, j, line_i, line_j = np.asarray(i), np.asarray(j), np.asarray(line_i), np.asarray(line_j)
+        slope = (np.asarray(value_j, dtype=float) - value_i) / np.maximum(line_j - line_i, 1)
+        line_ends = 2 * np.asarray(value_i, dtype=float) + slope * (i + j - 2 * line_i)
+        return self.trapezoid(i, j) - np.where(j > i, self.data.dt * (j - i) * line_ends / 2, 0.)
+
+    def area(self, start, end):
+        return self.trapezoid(*self.bounds(start, end))
+
+    def area_peak_lin(self, start, end):
+        return self.area_lin(*self.bounds(start, end))
+
+    def area_manual(self, start, end, start_mau, end_mau):
+        # under the trace minus the trapezoid of the manual baseline between the peak bounds
+        return self.area(start, end) - (np.asarray(end) - start) * (np.asarray(start_mau) + end_mau) / 2
@@ -0,0 +1,198 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+from scipy import linalg, ndimage, special
+
+# baseline engines
+ALS = 'als'  # asymmetric least squares
+ARPLS = 'arpls'  # asymmetrically reweighted penalized least squares
+AIRPLS = 'airpls'  # adaptive iteratively reweighted penalized least squares
+MORPHOLOGICAL = 'morphological'  # smoothed rolling-minimum opening, no solve
+
+AIRPLS_STOP = 1e-3  # of the total absolute signal below the baseline
+
+SECOND_DIFF = np.array([1., -2., 1.])
+
+
+@lru_cache(maxsize=16)
+def penalty_bands(length: int, lam: float) -> np.ndarray:
+    # lam * D * D.T of the second-difference operator, in upper banded form for solveh_banded
+    bands = np.zeros((3, length))
+    if length >= 3:
+        inner = length - 2
+        for k in range(3):
+            bands[2, k:k + inner] += SECOND_DIFF[k] ** 2
+        for k in range(2):
+            bands[1, k + 1:k + 1 + inner] += SECOND_DIFF[k] * SECOND_DIFF[k + 1]
+        bands[0, 2:] += SECOND_DIFF[0] * SECOND_DIFF[2]
+    bands *= lam
+    bands.flags.writeable = False
+    return bands
+
+
+class ALSResult(NamedTuple):
+    baseline: np.ndarray
+    weights: np.ndarray
+    niter: int  # iterations actually run
+
+
+def als_weights(y: np.ndarray, z: np.ndarray, p) -> np.ndarray:
+    return p * (y > z) + (1 - p) * (y < z)
+
+
+def noise_level(y: np.ndarray) -> float:
+    # robust sigma of white noise from the MAD of first differences
+    if len(y) < 2:
+        return 0.
+    return float(np.median(np.abs(np.diff(y)))) / (0.6745 * np.sqrt(2))
+
+
+def als_warm_weights(y: np.ndarray, prior: np.ndarray, p, band=0.) -> np.ndarray:
+    # points within the noise band above a prior baseline are treated as baseline points
+    below = y <= prior + band
+    return p * ~below + (1 - p) * below
+
+
+def _reweighted_pls(y: np.ndarray, lam, niter, tol, weights, reweight) -> ALSResult:
+    # penalized least squares iterations of als() with the weights of the next iteration from
+    # reweight(residual, iteration), None once it considers the baseline final
+    assert (niter > 0)
+    y = np.asarray(y, dtype=float)
+    penalty = penalty_bands(len(y), float(lam))
+    if weights is None or np.count_nonzero(weights) < 3:
+        weights = np.ones(len(y))
+    w = np.asarray(weights, dtype=float)
+    z: np.ndarray = None
+    i = 0
+    while i < niter:
+        ab = penalty.copy()
+        ab[2] += w
+        try:
+            z_next = linalg.solveh_banded(ab, w * y, overwrite_ab=True, overwrite_b=True, check_finite=False)
+        except linalg.LinAlgError:
+            # too few weighted points left to pin the baseline, keep the last solution
+            if z is None:
+                raise
+            break
+        i += 1
+        w_next = reweight(y - z_next, i)
+        converged = w_next is None or tol is not None and z is not None and \
+            np.linalg.norm(z_next - z) <= tol * np.linalg.norm(z)
+        z = z_next
+        if w_next is not None:
+            w = w_next
+        if converged:
+            break
+    return ALSResult(z, w, i)
+
+
+def als(y: np.ndarray, lam, p, niter, tol=None, weights: np.ndarray = None) -> ALSResult:
+    # asymmetric least squares, (W + lam * D * D.T) is pentadiagonal and SPD, so each
+    # iteration is a banded Cholesky solve.
+    # tol - stop once the relative change of the baseline drops below it
+    # weights - warm start instead of uniform weights
+    return _reweighted_pls(y, lam, niter, tol, weights, lambda d, _: p * (d > 0) + (1 - p) * (d < 0))
+
+
+def als_batch(y: np.ndarray, lam, p, niter, tol=None, weights: np.ndarray = None) -> ALSResult:
+    # als() of every row of y at once. the rows are the blocks of one block-diagonal banded system, the
+    # padding of penalty_bands keeps them apart, so each iteration is a single solve over the rows still
+    # iterating. niter - one for all rows or per row, the result has the iterations run per row
+    y = np.asarray(y, dtype=float)
+    rows, length = y.shape
+    niter = np.broadcast_to(niter, rows)
+    assert (niter > 0).all()
+    penalty = penalty_bands(length, float(lam))
+    w = np.ones(y.shape) if weights is None else np.array(weights, dtype=float)
+    w[np.count_nonzero(w, axis=1) < 3] = 1
+    z = np.empty(y.shape)
+    counts = np.zeros(rows, dtype=int)
+    active = np.arange(rows)
+    while len(active):
+        ab = np.tile(penalty, len(active))
+        ab[2] += w[active].ravel()
+        try:
+            z_next = linalg.solveh_banded(ab, (w[active] * y[active]).ravel(), overwrite_ab=True, overwrite_b=True,
+                                          check_finite=False).reshape(len(active), length)
+        except linalg.LinAlgError:
+            # a singular block, the remaining iterations row by row
+            for row in active:
+                try:
+                    result = als(y[row], lam, p, niter[row] - counts[row], tol, w[row])
+                except linalg.LinAlgError:
+                    if counts[row] == 0:
+                        raise
+                    continue
+                z[row], w[row] = result.baseline, result.weights
+                counts[row] += result.niter
+            break
+        w[active] = als_weights(y[active], z_next, p)
+        if tol is None:
+            converged = np.zeros(len(active), dtype=bool)
+        else:
+            change = np.linalg.norm(z_next - z[active], axis=1)
+            converged = (counts[active] > 0) & (change <= tol * np.linalg.norm(z[active], axis=1))
+        z[active] = z_next
+        counts[active] += 1
+        active = active[~converged & (counts[active] < niter[active])]
+    return ALSResult(z, w, counts)
+
+
+def _arpls_weights(d: np.ndarray, _) -> np.ndarray:
+    # logistic in the residual, centered 2 sigmas of the negative residuals above their mean
+    negative = d[d < 0]
+    if len(negative) < 2 or negative.std() == 0:
+        return None
+    m, s = negative.mean(), negative.std()
+    return special.expit(-2 * (d - (2 * s - m)) / s)
+
+
+def arpls(y: np.ndarray, lam, niter, tol=None, weights: np.ndarray = None) -> ALSResult:
+    # arPLS (Baek et al. 2015): points above the baseline keep a weight while they are within the noise
+    # of the points below it, no asymmetry parameter
+    return _reweighted_pls(y, lam, niter, tol, weights, _arpls_weights)
+
+
+def _airpls_weights(d: np.ndarray, i: int, total: float) -> np.ndarray:
+    below = d < 0
+    dssn = -d[below].sum()
+    if not below.any() or dssn < AIRPLS_STOP * total:
+        return None
+    w = np.where(below, np.exp(i * np.abs(d) / dssn), 0.)
+    w[0] = w[-1] = np.exp(i * d[below].max() / dssn)
+    return w
+
+
+def airpls(y: np.ndarray, lam, niter, tol=None, weights: np.ndarray = None) -> ALSResult:
+    # airPLS (Zhang et al. 2010): points above the baseline get no weight, the ones below a weight growing
+    # with their distance and the iteration. stops once little signal is left below the baseline
+    total = float(np.abs(y).sum())
+    return _reweighted_pls(y, lam, niter, tol, weights, lambda d, i: _airpls_weights(d, i, total))
+
+
+def morphological(y: np.ndarray, window: int, niter=1, tol=None, weights: np.ndarray = None) -> ALSResult:
+    # opening (rolling minimum, then rolling maximum) smoothed by a moving average, O(n) for any window.
+    # the opening follows the lower envelope of the noise, it is lifted by the median residual of the
+    # points within the noise band of it. niter, tol and weights are not used, there is nothing to iterate
+    y = np.asarray(y, dtype=float)
+    window = max(int(window), 1)
+    z = ndimage.maximum_filter1d(ndimage.minimum_filter1d(y, window, mode='nearest'), window, mode='nearest')
+    # within half a window of the ends the rolling maximum lags a drift, it is continued from inside instead
+    half = window // 2
+    if half and len(z) > 3 * half:
+        steps = np.arange(1, half + 1)
+        z[:half] = z[half] - (z[2 * half] - z[half]) / half * steps[::-1]
+        z[-half:] = z[-half - 1] + (z[-half - 1] - z[-2 * half - 1]) / half * steps
+    # odd reflection keeps the drift straight through the moving average
+    z = np.pad(z, window, mode='reflect', reflect_type='odd')
+    z = ndimage.uniform_filter1d(z, window)[window:window + len(y)]
+    d = y - z
+    near = d < 4 * noise_level(y)
+    if near.any():
+        z += np.median(d[near])
+    return ALSResult(z, near.astype(float), 1)
+
+
+def als_baseline(y: np.ndarray, lam, p, niter) -> np.ndarray:
+    return als(y, lam, p, niter).baseline
@@ -0,0 +1,150 @@
+import time
+from functools import lru_cache, partial
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from scipy import optimize
+
+from celery_tasks.hplc.peak_table import FIT_PARAMS_COUNT, FIT_CONVERGED, FIT_FALLBACK, FIT_TIMEOUT
+from celery_tasks.hplc.pool import TracePool, SERIAL
+from celery_tasks.hplc.skew_gaussian import skew_gaussian, skew_gaussian_sum, skew_gaussian_jac
+from celery_tasks.hplc.trace import Trace
+
+# mixed peak engines
+CURVE_FIT = 'curve_fit'  # nonlinear skew gaussian fit
+NNLS = 'nnls'  # fixed gaussian shapes from the detected widths, areas by non-negative least squares
+HWHM_TO_SIGMA = np.sqrt(2 * np.log(2))
+
+FIT_MAX_NFEV = 400  # model evaluations per group
+FIT_GROUP_BUDGET = 5  # seconds per group
+FIT_RUN_BUDGET = 60  # seconds for all groups of a run
+
+
+class FitTask(NamedTuple):
+    start: int  # sample range [start, stop) of the group in the trace
+    stop: int
+    p0: List[float]  # baseline followed by 4 params per component
+    lower: List[float]  # bounds of p0
+    upper: List[float]
+
+
+class FitBudget(NamedTuple):
+    max_nfev: int
+    group_seconds: float
+    run_deadline: float  # time.monotonic() value
+
+
+class FitResult(NamedTuple):
+    params: Optional[np.ndarray]  # None unless converged
+    status: int
+
+
+class FitTimeout(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def gen_fit_func(peaks_count: int):
+    def fit_func(x, baseline, *args):
+        assert len(args) == peaks_count * FIT_PARAMS_COUNT
+        return skew_gaussian_sum(x, baseline, args)
+
+    return fit_func
+
+
+@lru_cache(maxsize=None)
+def gen_fit_jac(peaks_count: int):
+    def fit_jac(x, baseline, *args):
+        assert len(args) == peaks_count * FIT_PARAMS_COUNT
+        return skew_gaussian_jac(x, baseline, args)
+
+    return fit_jac
+
+
+def _with_deadline(func, deadline: float):
+    def wrapped(*args):
+        if time.monotonic() > deadline:
+            raise FitTimeout()
+        return func(*args)
+
+    return wrapped
+
+
+def fit_group(data: Trace, task: FitTask, budget: FitBudget) -> FitResult:
+    deadline = min(time.monotonic() + budget.group_seconds, budget.run_deadline)
+    if time.monotonic() > deadline:
+        return FitResult(None, FIT_TIMEOUT)
+
+    data_slice = data[task.start:task.stop]
+    peaks_count = (len(task.p0) - 1) // FIT_PARAMS_COUNT
+    try:
+        params, _ = optimize.curve_fit(_with_deadline(gen_fit_func(peaks_count), deadline), data_slice.times,
+                                       data_slice.values, p0=task.p0, bounds=(task.lower, task.upper),
+                                       jac=_with_deadline(gen_fit_jac(peaks_count), deadline),
+                                       max_nfev=budget.max_nfev)
+    except FitTimeout:
+        return FitResult(None, FIT_TIMEOUT)
+    except (RuntimeError, ValueError, np.linalg.LinAlgError):
+        # evaluation cap reached, or the model went non-finite
+        return FitResult(None, FIT_FALLBACK)
+    if not np.isfinite(params).all():
+        return FitResult(None, FIT_FALLBACK)
+    return FitResult(params, FIT_CONVERGED)
+
+
+def half_height_sigmas(data: Trace, centers: np.ndarray, default: np.ndarray) -> np.ndarray:
+    # gaussian sigma from the half height width on the side of each apex that is free of neighbours,
+    # the side facing a co-eluting peak is always the wider one
+    values = data.values
+    apexes = np.clip(np.round(data.index(centers)).astype(int), 0, len(values) - 1)
+    sigmas = np.array(default, dtype=float)
+    for i, apex in enumerate(apexes):
+        below = values < values[apex] / 2
+        left = np.flatnonzero(below[:apex])
+        right = np.flatnonzero(below[apex:])
+        sides = [apex - left[-1]] if len(left) else []
+        sides += [right[0]] if len(right) else []
+        if sides:
+            sigmas[i] = min(sides) * data.dt / HWHM_TO_SIGMA
+    return sigmas
+
+
+def fit_group_nnls(data: Trace, task: FitTask, budget: FitBudget) -> FitResult:
+    # gaussian shapes are fixed at the apexes, all areas and the baseline come from one bounded linear solve
+    data_slice = data[task.start:task.stop]
+    params = np.array(task.p0[1:], dtype=float).reshape(-1, FIT_PARAMS_COUNT)
+    params[:, 0] = 1
+    params[:, 1] = 0
+    params[:, 3] = half_height_sigmas(data_slice, params[:, 2], params[:, 3])
+    basis = np.column_stack([np.ones(len(data_slice)), skew_gaussian(data_slice.times, params)])
+    try:
+        coefficients, _ = optimize.nnls(basis, data_slice.values)
+    except RuntimeError:
+        return FitResult(None, FIT_FALLBACK)
+    params[:, 0] = coefficients[1:]
+    return FitResult(np.concatenate([coefficients[:1], params.ravel()]), FIT_CONVERGED)
+
+
+FIT_ENGINES = {CURVE_FIT: fit_group, NNLS: fit_group_nnls}
+
+
+class FitExecutor(TracePool):
+    # runs independent group fits within the evaluation and time budgets
+    def __init__(self, mode: str = SERIAL, max_workers: int = None, max_nfev: int = FIT_MAX_NFEV,
+                 group_budget: float = FIT_GROUP_BUDGET, run_budget: float = FIT_RUN_BUDGET):
+        super().__init__(mode, max_workers)
+        self.max_nfev = max_nfev
+        self.group_budget = group_budget  # seconds
+        self.run_budget = run_budget
+        self.run_deadline = None  # time.monotonic() value shared by several map calls, see serial()
+
+    def serial(self) -> 'FitExecutor':
+        # same budgets without a pool, e.g. inside pool workers, the run budget starts now for all of them
+        executor = FitExecutor(SERIAL, None, self.max_nfev, self.group_budget, self.run_budget)
+        executor.run_deadline = time.monotonic() + self.run_budget
+        return executor
+
+    def map(self, data: Trace, tasks: List[FitTask], engine: str = CURVE_FIT) -> List[FitResult]:
+        deadline = self.run_deadline if self.run_deadline is not None else time.monotonic() + self.run_budget
+        budget = FitBudget(self.max_nfev, self.group_budget, deadline)
+        return self._map(partial(FIT_ENGINES[engine], budget=budget), data, tasks)
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def fold_groups(starts, ends, apexes):
+    # returns (order, parent, group_bounds): rows in fold order where every group starts with its widest peak
+    # followed by the rest sorted by apex, the parent position of each row (-1 for heads) and the union
+    # [start, end] of every group
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    apexes = np.asarray(apexes, dtype=float)
+    count = len(starts)
+    if count == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty((0, 2))
+
+    by_start = np.argsort(starts, kind='stable')
+    reach = np.maximum.accumulate(ends[by_start])
+    new_group = np.empty(count, dtype=bool)
+    new_group[0] = True
+    new_group[1:] = starts[by_start][1:] >= reach[:-1]
+    group = np.empty(count, dtype=np.intp)
+    group[by_start] = np.cumsum(new_group) - 1
+    group_first = np.flatnonzero(new_group)
+
+    # head: the widest peak, the earliest starting one on ties
+    rank = np.empty(count, dtype=np.intp)
+    rank[by_start] = np.arange(count)
+    by_width = np.lexsort((rank, starts - ends, group))
+    heads = by_width[np.searchsorted(group[by_width], np.arange(len(group_first)))]
+    is_head = np.zeros(count, dtype=bool)
+    is_head[heads] = True
+
+    order = np.lexsort((apexes, ~is_head, group))
+    group_pos = np.searchsorted(group[order], np.arange(len(group_first)))
+    parent = np.where(is_head[order], -1, group_pos[group[order]])
+
+    bounds = np.column_stack([np.minimum.reduceat(starts[by_start], group_first),
+                              np.maximum.reduceat(ends[by_start], group_first)])
+    return order, parent, bounds
@@ -0,0 +1,77 @@
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import interpolate
+
+from celery_tasks.hplc.memory import interp_into
+from celery_tasks.hplc.trace import Trace
+
+# manual baseline modes, between two user points
+LINEAR = 'linear'
+PCHIP = 'pchip'  # monotone cubic, never overshoots the points
+MANUAL_MODES = (LINEAR, PCHIP)
+
+
+class BaselineKnots:
+    # piecewise linear baseline, knots (times in minutes, values in mAU) sorted by time and held flat past
+    # the first and the last one. the form baselines are fitted, cached and drawn in, set_baseline still gets
+    # one value per sample, see HPLCProcessing.stored_baseline()
+    __slots__ = ('times', 'values')
+
+    def __init__(self, times: np.ndarray, values: np.ndarray):
+        times = np.asarray(times, dtype=float)
+        order = np.argsort(times, kind='stable')
+        self.times = times[order]
+        self.values = np.asarray(values, dtype=float)[order]
+
+    @classmethod
+    def from_points(cls, times, values, spacing: float, mode: str = LINEAR,
+                    segment_modes: Sequence[str] = None) -> 'BaselineKnots':
+        # manual baseline through user points. segment_modes[i], when given and not None, overrides mode for the
+        # segment from the i-th point to the next one in time. linear segments need no knots but their ends,
+        # curved ones are sampled every spacing minutes. of points at the same time the last one is kept
+        times = np.asarray(times, dtype=float)
+        if not len(times):
+            raise ValueError('a manual baseline needs at least one point')
+        modes = np.full(len(times), mode, dtype=object)
+        if segment_modes is not None:
+            given = np.array([o is not None for o in segment_modes], dtype=bool)
+            modes[given] = np.asarray(segment_modes, dtype=object)[given]
+        assert set(modes) <= set(MANUAL_MODES)
+        order = np.argsort(times, kind='stable')
+        times, values, modes = times[order], np.asarray(values, dtype=float)[order], modes[order]
+        last = np.append(times[1:] != times[:-1], True)
+        times, values, modes = times[last], values[last], modes[last]
+
+        curved = modes[:-1] == PCHIP
+        if not curved.any():
+            return cls(times, values)
+        grid = np.arange(times[0], times[-1], spacing)
+        segment = np.searchsorted(times, grid, side='right') - 1
+        grid = grid[curved[segment] & (grid > times[segment])]
+        knots = np.concatenate([times, grid])
+        return cls(knots, np.concatenate([values, interpolate.PchipInterpolator(times, values)(grid)]))
+
+    @classmethod
+    def from_trace(cls, trace: Trace) -> 'BaselineKnots':
+        return cls(trace.times, trace.values)
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> 'BaselineKnots':
+        series = series.dropna()
+        return cls(series.index.to_numpy(dtype=float), series.to_numpy(dtype=float))
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.values, index=self.times)
+
+    def __len__(self):
+        return len(self.times)
+
+    def interp(self, times) -> np.ndarray:
+        return np.interp(times, self.times, self.values)
+
+    def on_grid(self, data: Trace, out: np.ndarray = None) -> Trace:
+        # values at the samples of data, into out when given
+        out = np.empty(len(data)) if out is None else out
+        return data.with_values(interp_into(out, data.t0, data.dt, self.times, self.values))
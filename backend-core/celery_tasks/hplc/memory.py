@@ -0,0 +1,41 @@
+import tracemalloc
+
+import numpy as np
+
+INTERP_BLOCK = 1 << 16  # samples per np.interp call
+
+
+def interp_into(out: np.ndarray, t0: float, dt: float, xp: np.ndarray, fp: np.ndarray,
+                block: int = INTERP_BLOCK) -> np.ndarray:
+    # np.interp onto the grid t0 + i * dt written into out blockwise, without full size float64 temporaries
+    for start in range(0, len(out), block):
+        stop = min(start + block, len(out))
+        out[start:stop] = np.interp(t0 + np.arange(start, stop) * dt, xp, fp)
+    return out
+
+
+class PeakMemory:
+    # peak of the memory traced within the block, numpy buffers included, in bytes.
+    # allocations of pool worker processes are not seen
+    def __init__(self):
+        self.peak = None
+        self._started = False
+        self._base = 0
+
+    def __enter__(self) -> 'PeakMemory':
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        self._base = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        self.peak = tracemalloc.get_traced_memory()[1] - self._base
+        if self._started:
+            tracemalloc.stop()
+
+    @property
+    def mib(self) -> float:
+        return self.peak / 2 ** 20
@@ -0,0 +1,71 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.peak_table import PeakTable
+
+# stored columns of a peak, in the order of PeakModel.create
+PEAK_FIELDS = ('start', 'apex', 'end', 'area', 'start_mau', 'end_mau')
+# stored and new values equal to this many decimals are the same, a rounding miss only rewrites the row
+PEAK_DIFF_DECIMALS = 6
+
+
+def peak_values(peaks: PeakTable, row: int) -> Tuple[Optional[float], ...]:
+    # PEAK_FIELDS of a row as stored, nan as None
+    values = (getattr(peaks, name)[row] for name in PEAK_FIELDS)
+    return tuple(None if np.isnan(value) else float(value) for value in values)
+
+
+def _key(values) -> tuple:
+    return tuple(None if value is None or np.isnan(value) else round(float(value), PEAK_DIFF_DECIMALS)
+                 for value in values)
+
+
+class PeakDiff:
+    # the writes turning the stored peaks of a measurement into a PeakTable: delete the rows of stored ids,
+    # insert the table rows, top level peaks first. a child is inserted under the stored id in parent_ids, or
+    # under the inserted row of its table parent
+    __slots__ = ('keep', 'delete', 'insert', 'parent_ids')
+
+    def __init__(self, keep: List, delete: List, insert: List[int], parent_ids: Dict[int, object]):
+        self.keep = keep
+        self.delete = delete
+        self.insert = insert
+        self.parent_ids = parent_ids
+
+    def __len__(self):  # rows written
+        return len(self.delete) + len(self.insert)
+
+
+def diff_peaks(peaks: PeakTable, stored: Iterable[tuple] = ()) -> PeakDiff:
+    # stored: (id, parent_id, *PEAK_FIELDS) of the stored peaks, parent_id None for top level ones.
+    # a stored peak is kept when a table row has the same values and, for children, a kept parent
+    stored = list(stored)
+    by_parent = defaultdict(lambda: defaultdict(list))
+    for peak_id, parent_id, *values in stored:
+        by_parent[parent_id][_key(values)].append(peak_id)
+
+    def match(parent_id, row):
+        ids = by_parent[parent_id].get(_key(peak_values(peaks, row)))
+        return ids.pop() if ids else None
+
+    keep, roots, children, parent_ids = [], [], [], {}
+    for row in peaks.roots:
+        peak_id = match(None, row)
+        if peak_id is None:
+            roots.append(row)
+            children.extend(peaks.children(row))
+            continue
+        keep.append(peak_id)
+        for child in peaks.children(row):
+            child_id = match(peak_id, child)
+            if child_id is None:
+                children.append(child)
+                parent_ids[int(child)] = peak_id
+            else:
+                keep.append(child_id)
+
+    kept = set(keep)
+    delete = [peak_id for peak_id, *_ in stored if peak_id not in kept]
+    return PeakDiff(keep, delete, [int(row) for row in roots + children], parent_ids)
@@ -0,0 +1,190 @@
+from typing import List, Optional
+
+import numpy as np
+
+from celery_tasks.hplc.trace import Trace
+
+FIT_PARAMS_COUNT = 4  # skew gaussian: h, a, b, c
+
+# fit_status of mixed peaks and their children
+FIT_NONE = 0  # not a mixed peak
+FIT_CONVERGED = 1
+FIT_FALLBACK = 2  # the fit failed or hit its evaluation cap, drop-line areas are used
+FIT_TIMEOUT = 3  # the group or run time budget ran out, drop-line areas are used
+FIT_UNRESOLVED = 4  # not fitted, e.g. in a preview, drop-line areas are used
+FIT_STATUS_NAMES = {FIT_NONE: None, FIT_CONVERGED: 'converged', FIT_FALLBACK: 'fallback', FIT_TIMEOUT: 'timeout',
+                    FIT_UNRESOLVED: 'unresolved'}
+
+
+class PeakTable:
+    # columnar storage of peaks, bounds and width in minutes, *_mau in mAU.
+    # parent is the row of the mixed peak the row is folded into, -1 for top level peaks
+    FLOAT_COLUMNS = ('apex', 'start', 'end', 'width', 'start_mau', 'end_mau', 'baseline', 'area')
+    INT_COLUMNS = {'parent': -1, 'fit_status': FIT_NONE}
+
+    def __init__(self, size: int = 0):
+        for name in self.FLOAT_COLUMNS:
+            setattr(self, name, np.full(size, np.nan))
+        for name, default in self.INT_COLUMNS.items():
+            setattr(self, name, np.full(size, default, dtype=np.intp))
+        self.params = np.full((size, FIT_PARAMS_COUNT), np.nan)
+
+    @classmethod
+    def from_arrays(cls, apex, start, end, start_mau=None, end_mau=None, width=None) -> 'PeakTable':
+        table = cls(len(apex))
+        table.apex[:] = apex
+        table.start[:] = start
+        table.end[:] = end
+        if width is not None:
+            table.width[:] = width
+        if start_mau is not None:
+            table.start_mau[:] = start_mau
+        if end_mau is not None:
+            table.end_mau[:] = end_mau
+        return table
+
+    @classmethod
+    def concat(cls, tables: List['PeakTable']) -> 'PeakTable':
+        table = cls(0)
+        offset = 0
+        parents = []
+        for other in tables:
+            parents.append(np.where(other.parent >= 0, other.parent + offset, -1))
+            offset += len(other)
+        for name in cls.FLOAT_COLUMNS:
+            setattr(table, name, np.concatenate([getattr(o, name) for o in tables] or [np.empty(0)]))
+        table.fit_status = np.concatenate([o.fit_status for o in tables] or [np.empty(0, dtype=np.intp)])
+        table.parent = np.concatenate(parents or [np.empty(0, dtype=np.intp)])
+        table.params = np.concatenate([o.params for o in tables] or [np.empty((0, FIT_PARAMS_COUNT))])
+        return table
+
+    def __len__(self):
+        return len(self.apex)
+
+    def take(self, rows: np.ndarray) -> 'PeakTable':
+        # rows reordered or filtered, parent links are remapped to the new positions
+        rows = np.asarray(rows, dtype=np.intp)
+        table = PeakTable(0)
+        for name in self.FLOAT_COLUMNS:
+            setattr(table, name, getattr(self, name)[rows])
+        table.fit_status = self.fit_status[rows]
+        table.params = self.params[rows]
+        position = np.full(len(self) + 1, -1, dtype=np.intp)
+        position[rows] = np.arange(len(rows))
+        table.parent = position[self.parent[rows]]  # parent -1 maps to position[-1] == -1
+        return table
+
+    @property
+    def roots(self) -> np.ndarray:  # rows of top level peaks
+        return np.flatnonzero(self.parent < 0)
+
+    @property
+    def mixed(self) -> np.ndarray:  # rows of top level peaks having children
+        return np.unique(self.parent[self.parent >= 0])
+
+    @property
+    def is_manual(self) -> np.ndarray:
+        return ~np.isnan(self.start_mau) & ~np.isnan(self.end_mau)
+
+    def children(self, row: int) -> np.ndarray:
+        rows = np.flatnonzero(self.parent == row)
+        return rows[np.argsort(self.apex[rows], kind='stable')]
+
+    def peak(self, row: int) -> 'Peak':
+        return Peak(table=self, row=row)
+
+    def peaks(self) -> List['Peak']:  # top level peaks
+        return [self.peak(row) for row in self.roots]
+
+    def to_dict(self) -> dict:
+        result = {name: getattr(self, name).tolist() for name in self.FLOAT_COLUMNS}
+        for name in self.INT_COLUMNS:
+            result[name] = getattr(self, name).tolist()
+        result['params'] = self.params.tolist()
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'PeakTable':
+        table = cls(len(data['apex']))
+        for name in cls.FLOAT_COLUMNS:
+            getattr(table, name)[:] = np.asarray(data[name], dtype=float)
+        for name in cls.INT_COLUMNS:
+            getattr(table, name)[:] = data[name]
+        table.params[:] = np.asarray(data['params'], dtype=float).reshape(-1, FIT_PARAMS_COUNT)
+        return table
+
+
+class _Column:
+    # float column of the peak row, NaN is exposed as None
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, peak: 'Peak', owner):
+        if peak is None:
+            return self
+        value = getattr(peak.table, self.name)[peak.row]
+        return None if np.isnan(value) else float(value)
+
+    def __set__(self, peak: 'Peak', value):
+        getattr(peak.table, self.name)[peak.row] = np.nan if value is None else value
+
+
+class Peak:
+    # view of a PeakTable row, standalone peaks get their own one-row table
+    apex = _Column('apex')  # extreamum in minutes
+
+    start = _Column('start')  # left right bounds in minutes
+    end = _Column('end')
+
+    width = _Column('width')  # detected width in minutes
+
+    start_mau = _Column('start_mau')  # left right bounds in mau
+    end_mau = _Column('end_mau')
+
+    # for mixed peaks
+    baseline = _Column('baseline')  # mAU height digit
+    # final params
+    area = _Column('area')
+
+    def __init__(self, apex=None, start=None, end=None, start_mau=None, end_mau=None, table: PeakTable = None,
+                 row: int = 0):
+        if table is None:
+            table = PeakTable(1)
+            self.table, self.row = table, 0
+            self.apex, self.start, self.end, self.start_mau, self.end_mau = apex, start, end, start_mau, end_mau
+        self.table = table
+        self.row = int(row)
+
+    def __eq__(self, other):
+        return isinstance(other, Peak) and self.table is other.table and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.table), self.row))
+
+    @property
+    def peaks(self) -> List['Peak']:  # child peaks
+        return [self.table.peak(row) for row in self.table.children(self.row)]
+
+    @property
+    def gaussian_params(self) -> Optional[np.ndarray]:
+        params = self.table.params[self.row]
+        return None if np.isnan(params).all() else params
+
+    @gaussian_params.setter
+    def gaussian_params(self, value):
+        self.table.params[self.row] = np.nan if value is None else value
+
+    @property
+    def fit_status(self) -> Optional[str]:
+        return FIT_STATUS_NAMES[int(self.table.fit_status[self.row])]
+
+    @property
+    def is_mixed_peak(self):
+        return bool((self.table.parent == self.row).any())
+
+    @property
+    def is_manual_peak(self):
+        return self.start_mau is not None and self.end_mau is not None
+
+    def get_data_slice(self, data: Trace) -> Trace:  # slice data for peak
+        return data.slice(self.start, self.end)
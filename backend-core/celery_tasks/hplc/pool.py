@@ -0,0 +1,57 @@
+import itertools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from celery_tasks.hplc.trace import Trace
+
+SERIAL = 'serial'
+THREAD = 'thread'
+PROCESS = 'process'
+
+# trace of the current process pool, sent once per worker instead of with every task
+_shared_data: Optional[Trace] = None
+
+
+def _init_shared_data(values, t0, dt):
+    global _shared_data
+    _shared_data = Trace(values, t0, dt)
+
+
+def _call_shared(func: Callable, task):
+    return func(_shared_data, task)
+
+
+class TracePool:
+    # runs func(data, task) for independent tasks on one trace serially or on a thread/process pool,
+    # results keep the order of tasks. func must be picklable for the process mode
+    def __init__(self, mode: str = SERIAL, max_workers: int = None):
+        assert mode in (SERIAL, THREAD, PROCESS)
+        self.mode = mode
+        self.max_workers = max_workers
+
+    def _map(self, func: Callable, data: Trace, tasks: list) -> list:
+        if self.mode == SERIAL or len(tasks) < 2:
+            return [func(data, task) for task in tasks]
+        try:
+            pool = self._create_pool(data)
+        except (AssertionError, OSError, BrokenProcessPool):
+            # e.g. daemonic prefork celery workers can not start child processes
+            return [func(data, task) for task in tasks]
+        with pool:
+            if self.mode == PROCESS:
+                return list(pool.map(_call_shared, itertools.repeat(func), tasks))
+            return list(pool.map(lambda task: func(data, task), tasks))
+
+    def _create_pool(self, data: Trace) -> Executor:
+        if self.mode == PROCESS:
+            pool = ProcessPoolExecutor(self.max_workers, initializer=_init_shared_data,
+                                       initargs=(data.values, data.t0, data.dt))
+            try:
+                # fail early here rather than on the first task
+                pool.submit(int).result()
+            except BaseException:
+                pool.shutdown(wait=False)
+                raise
+            return pool
+        return ThreadPoolExecutor(self.max_workers)
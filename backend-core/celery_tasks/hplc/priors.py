@@ -0,0 +1,100 @@
+import hashlib
+from typing import Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.knots import BaselineKnots
+from celery_tasks.hplc.peak_table import PeakTable, FIT_PARAMS_COUNT, FIT_CONVERGED
+from celery_tasks.hplc.trace import Trace
+
+# half of the minimum peak distance, a detected apex matches at most one prior component
+PRIOR_APEX_TOLERANCE = 2.5 / 60  # minutes
+
+
+class BaselinePrior:
+    # an automatic baseline fit, the only kind of baseline a fit is warm started from: the knots engine fitted
+    # with params on the downscaled data of digest. a manual or stored baseline carries none of these
+    __slots__ = ('knots', 'engine', 'params', 'digest')
+
+    def __init__(self, knots: BaselineKnots, engine: str, params: dict, digest: str):
+        self.knots = knots
+        self.engine = engine
+        self.params = params
+        self.digest = digest
+
+    @classmethod
+    def data_digest(cls, data: Trace) -> str:
+        hasher = hashlib.sha256()
+        hasher.update(f'{data.values.dtype.str}{len(data)}{data.t0!r}{data.dt!r}'.encode())
+        hasher.update(np.ascontiguousarray(data.values).tobytes())
+        return hasher.hexdigest()
+
+    def matches(self, engine: str, params: dict) -> bool:
+        return self.engine == engine and self.params == params
+
+    def to_dict(self) -> dict:
+        return {'times': self.knots.times.tolist(), 'values': self.knots.values.tolist(), 'engine': self.engine,
+                'params': self.params, 'digest': self.digest}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BaselinePrior':
+        return cls(BaselineKnots(data['times'], data['values']), data['engine'], data['params'], data['digest'])
+
+
+class SequencePrior:
+    # results of the previous injection of a sequence: the converged skew gaussian components sorted by apex,
+    # the baseline of the group each of them was fitted in, and the baseline of the trace
+    __slots__ = ('apex', 'params', 'group_baseline', 'baseline')
+
+    def __init__(self, apex: np.ndarray, params: np.ndarray, group_baseline: np.ndarray,
+                 baseline: BaselinePrior = None):
+        order = np.argsort(apex, kind='stable')
+        self.apex = np.asarray(apex, dtype=float)[order]
+        self.params = np.asarray(params, dtype=float).reshape(-1, FIT_PARAMS_COUNT)[order]
+        self.group_baseline = np.asarray(group_baseline, dtype=float)[order]
+        self.baseline = baseline
+
+    @classmethod
+    def from_results(cls, peaks: PeakTable, baseline: BaselinePrior = None) -> 'SequencePrior':
+        rows = np.flatnonzero((peaks.fit_status == FIT_CONVERGED) & ~np.isnan(peaks.params[:, 0]))
+        return cls(peaks.apex[rows], peaks.params[rows], peaks.baseline[rows], baseline)
+
+    def __len__(self):
+        return len(self.apex)
+
+    def match(self, apexes) -> np.ndarray:
+        # nearest prior component of every apex, -1 when none is within PRIOR_APEX_TOLERANCE
+        apexes = np.asarray(apexes, dtype=float)
+        if len(self.apex) == 0:
+            return np.full(len(apexes), -1, dtype=np.intp)
+        position = np.searchsorted(self.apex, apexes)
+        left, right = np.maximum(position - 1, 0), np.minimum(position, len(self.apex) - 1)
+        nearest = np.where(np.abs(self.apex[left] - apexes) <= np.abs(self.apex[right] - apexes), left, right)
+        return np.where(np.abs(self.apex[nearest] - apexes) <= PRIOR_APEX_TOLERANCE, nearest, -1)
+
+    def seed(self, apexes) -> Tuple[float, np.ndarray]:
+        # group baseline and params of components at the given apexes, centers shifted by the retention drift.
+        # NaN where there is no match
+        apexes = np.asarray(apexes, dtype=float)
+        matched = self.match(apexes)
+        found = matched >= 0
+        params = np.full((len(apexes), FIT_PARAMS_COUNT), np.nan)
+        params[found] = self.params[matched[found]]
+        params[found, 2] += apexes[found] - self.apex[matched[found]]
+        baseline = float(np.mean(self.group_baseline[matched[found]])) if found.any() else np.nan
+        return baseline, params
+
+    def to_dict(self) -> dict:
+        result = {'apex': self.apex.tolist(), 'params': self.params.tolist(),
+                  'group_baseline': self.group_baseline.tolist()}
+        if self.baseline is not None:
+            result['baseline'] = self.baseline.to_dict()
+        return result
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'SequencePrior':
+        baseline = data.get('baseline')
+        if baseline is not None:
+            baseline = BaselinePrior.from_dict(baseline)
+        return cls(np.asarray(data['apex'], dtype=float), np.asarray(data['params'], dtype=float),
+                   np.asarray(data['group_baseline'], dtype=float), baseline)
@@ -0,0 +1,99 @@
+import numpy as np
+
+DEFAULT_RESOLUTION = 0.01  # mAU
+DEFAULT_LINEAR_LIMIT = 10  # mAU, bins are linear below it, thresholds of corrected traces are well below
+
+
+class QuantileSketch:
+    # mergeable histogram: bins of fixed resolution on [-linear_limit, linear_limit), beyond it bins growing by
+    # resolution / linear_limit relative to their bound, so a value range of one more decade costs about
+    # 2300 bins and no finite float64 value needs more than about 1.4 million of them in all.
+    # quantiles are within one bin of the exact ones
+    def __init__(self, resolution: float = DEFAULT_RESOLUTION, linear_limit: float = DEFAULT_LINEAR_LIMIT):
+        self.resolution = resolution
+        self.linear_limit = linear_limit
+        self._linear_bins = int(round(linear_limit / resolution))  # on each side of 0
+        self._growth = np.log1p(resolution / linear_limit)  # log of the ratio of neighbouring log bin bounds
+        self.offset = 0  # bin number of counts[0]
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, resolution: float = DEFAULT_RESOLUTION,
+                    linear_limit: float = DEFAULT_LINEAR_LIMIT) -> 'QuantileSketch':
+        sketch = cls(resolution, linear_limit)
+        sketch.update(values)
+        return sketch
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def _add_counts(self, offset: int, counts: np.ndarray):
+        if len(counts) == 0:
+            return
+        if len(self.counts) == 0:
+            self.offset, self.counts = offset, counts.astype(np.int64)
+            return
+        lo = min(self.offset, offset)
+        hi = max(self.offset + len(self.counts), offset + len(counts))
+        if lo != self.offset or hi != self.offset + len(self.counts):
+            grown = np.zeros(hi - lo, dtype=np.int64)
+            grown[self.offset - lo:self.offset - lo + len(self.counts)] = self.counts
+            self.offset, self.counts = lo, grown
+        self.counts[offset - lo:offset - lo + len(counts)] += counts
+
+    def _bins(self, values: np.ndarray) -> np.ndarray:
+        bins = np.floor(values / self.resolution)
+        scaled = np.abs(values) / self.linear_limit
+        outer = scaled >= 1
+        steps = np.floor(np.log(scaled[outer]) / self._growth)
+        bins[outer] = np.where(values[outer] > 0, self._linear_bins + steps, -self._linear_bins - 1 - steps)
+        return bins.astype(np.int64)
+
+    def _bounds(self, bins: np.ndarray):
+        # lower and upper bound of bins
+        bins = np.asarray(bins, dtype=float)
+        lower = bins * self.resolution
+        upper = lower + self.resolution
+        above, below = bins >= self._linear_bins, bins < -self._linear_bins
+        steps = bins[above] - self._linear_bins
+        lower[above] = self.linear_limit * np.exp(steps * self._growth)
+        upper[above] = self.linear_limit * np.exp((steps + 1) * self._growth)
+        steps = -self._linear_bins - 1 - bins[below]
+        lower[below] = -self.linear_limit * np.exp((steps + 1) * self._growth)
+        upper[below] = -self.linear_limit * np.exp(steps * self._growth)
+        return lower, upper
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        bins = self._bins(values)
+        lo = int(bins.min())
+        self._add_counts(lo, np.bincount(bins - lo))
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        assert self.resolution == other.resolution and self.linear_limit == other.linear_limit
+        self._add_counts(other.offset, other.counts)
+        return self
+
+    def _order_statistic(self, k: np.ndarray) -> np.ndarray:
+        # k-th smallest value, samples are assumed evenly spread inside a bin
+        cumulative = np.cumsum(self.counts)
+        bins = np.searchsorted(cumulative, k, side='right')
+        before = cumulative[bins] - self.counts[bins]
+        inside = (k - before + 0.5) / self.counts[bins]
+        lower, upper = self._bounds(self.offset + bins)
+        return lower + (upper - lower) * inside
+
+    def quantile(self, q) -> np.ndarray:
+        # same interpolation between order statistics as np.quantile(..., method='linear')
+        count = self.count
+        assert count > 0
+        position = (count - 1) * np.asarray(q, dtype=float)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, count - 1)
+        fraction = position - below
+        lower, upper = self._order_statistic(below), self._order_statistic(above)
+        return lower + (upper - lower) * fraction
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+import numpy as np
+
+# part of every key, bump it whenever processing results change for the same input, older entries are
+# never looked up again and age out of the cache
+ALGORITHM_VERSION = 2
+
+RESULT_CACHE_MAX_BYTES = 1 << 30  # disk
+RESULT_CACHE_MAX_ENTRIES = 10000  # redis
+
+
+def _update(hasher, value):
+    # arrays by dtype, shape and bytes, containers item by item, anything else by its JSON
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        hasher.update(f'{value.dtype.str}{value.shape}'.encode())
+        hasher.update(value.tobytes())
+    elif isinstance(value, dict):
+        hasher.update(b'{')
+        for name in sorted(value):
+            hasher.update(json.dumps(str(name)).encode())
+            _update(hasher, value[name])
+        hasher.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        hasher.update(b'[')
+        for item in value:
+            _update(hasher, item)
+        hasher.update(b']')
+    else:
+        hasher.update(json.dumps(value, default=str).encode())
+
+
+def result_key(kind: str, values: np.ndarray, period, **params) -> str:
+    # sha256 of everything the result of kind depends on: the raw values, the period, ALGORITHM_VERSION and
+    # the processing parameters
+    hasher = hashlib.sha256()
+    _update(hasher, [ALGORITHM_VERSION, kind, np.asarray(values), period, params])
+    return hasher.hexdigest()
+
+
+class ResultCache(ABC):
+    # results by key, least recently used entries are evicted. values are pickled
+    def get(self, key: str) -> Optional[Any]:
+        data = self._get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key: str, value):
+        self._set(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, data: bytes):
+        pass
+
+
+class DiskResultCache(ResultCache):
+    # one file per entry, the modification time is the last use. the oldest files go once the directory
+    # holds more than max_bytes
+    def __init__(self, directory: str, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted meanwhile by another worker
+            return None
+        return data
+
+    def _set(self, key: str, data: bytes):
+        # written aside and renamed, readers never see a partial entry
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(o[1] for o in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+
+class RedisResultCache(ResultCache):
+    # entries under prefix + key, a sorted set of keys by last use keeps at most max_entries of them
+    def __init__(self, client, max_entries: int = RESULT_CACHE_MAX_ENTRIES, prefix: str = 'hplc-result-'):
+        self.client = client  # redis.Redis
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.lru = prefix + 'lru'
+
+    def _get(self, key: str) -> Optional[bytes]:
+        data = self.client.get(self.prefix + key)
+        if data is not None:
+            self.client.zadd(self.lru, {key: time.time()})
+        return data
+
+    def _set(self, key: str, data: bytes):
+        pipeline = self.client.pipeline()
+        pipeline.set(self.prefix + key, data)
+        pipeline.zadd(self.lru, {key: time.time()})
+        pipeline.zcard(self.lru)
+        count = pipeline.execute()[-1]
+        if count > self.max_entries:
+            evicted = self.client.zrange(self.lru, 0, count - self.max_entries - 1)
+            if evicted:
+                pipeline = self.client.pipeline()
+                pipeline.delete(*(self.prefix + (o.decode() if isinstance(o, bytes) else o) for o in evicted))
+                pipeline.zrem(self.lru, *evicted)
+                pipeline.execute()
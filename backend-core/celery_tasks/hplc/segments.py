@@ -0,0 +1,71 @@
+from functools import partial
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.pool import TracePool, SERIAL
+from celery_tasks.hplc.trace import Trace
+
+SEGMENT_GAP_SECONDS = 30  # min length of a flat stretch between independent segments
+SEGMENT_MAX_NOISE_SECONDS = 1  # longest excursion above the threshold still counted as flat
+
+
+def find_segments(data: Trace, level: float, min_gap: int, max_excursion: int = 1, margin: int = 0,
+                  open_end: bool = False) -> List[Tuple[int, int]]:
+    # sample ranges covering the trace, cut in every run of at least min_gap samples below level that has
+    # signal on both sides. noise above level for less than max_excursion samples does not break a run.
+    # the cut is the lowest sample at least margin samples away from any sample above level, neighbouring
+    # segments share it. with open_end the trace is still growing, a gap at its end closes the segment before it
+    values = data.values
+    quiet = values < level
+    cuts = [0]
+    if len(quiet):
+        bounds = np.concatenate([[0], np.flatnonzero(quiet[1:] != quiet[:-1]) + 1, [len(quiet)]])
+        # short runs above level join the quiet runs around them
+        calm = quiet[bounds[:-1]] | (np.diff(bounds) < max_excursion)
+        firsts = np.concatenate([[0], np.flatnonzero(calm[1:] != calm[:-1]) + 1])
+        starts, stops = bounds[firsts], bounds[np.append(firsts[1:], len(calm))]
+        gaps = calm[firsts] & (starts > 0) & ((stops < len(quiet)) | open_end) & (stops - starts >= max(min_gap, 1))
+        for start, stop in zip(starts[gaps], stops[gaps]):
+            cut = _find_cut(values, start, stop, level, margin, open_end)
+            if cut is not None:
+                cuts.append(cut)
+    cuts.append(len(quiet) - 1)
+    return [(start, stop + 1) for start, stop in zip(cuts[:-1], cuts[1:])]
+
+
+def _find_cut(values: np.ndarray, start: int, stop: int, level: float, margin: int,
+              open_end: bool = False) -> Optional[int]:
+    candidates = np.arange(start, stop)
+    lo = max(start - margin, 0)
+    loud = np.flatnonzero(values[lo:stop + margin] >= level) + lo
+    if open_end and stop == len(values):
+        loud = np.append(loud, stop)  # the next samples may be signal
+    if len(loud):
+        right = np.minimum(np.searchsorted(loud, candidates), len(loud) - 1)
+        left = np.maximum(right - 1, 0)
+        distance = np.minimum(np.abs(candidates - loud[left]), np.abs(loud[right] - candidates))
+        candidates = candidates[distance > margin]
+    if not len(candidates):
+        return None
+    return int(candidates[np.argmin(values[candidates])])
+
+
+def _process_segment(data: Trace, segment: Tuple[int, int], func: Callable):
+    start, stop = segment
+    return func(data[start:stop])
+
+
+class SegmentExecutor(TracePool):
+    # runs func(segment trace) for the segments of a trace, results keep the order of segments
+    def __init__(self, mode: str = SERIAL, max_workers: int = None, min_gap_seconds: float = SEGMENT_GAP_SECONDS):
+        super().__init__(mode, max_workers)
+        self.min_gap_seconds = min_gap_seconds
+
+    def segments(self, data: Trace, level: float, margin: int = 0, open_end: bool = False) -> List[Tuple[int, int]]:
+        # margin: samples around a cut without peaks, e.g. the min peak distance
+        return find_segments(data, level, int(np.ceil(self.min_gap_seconds * data.mps)),
+                             int(np.ceil(SEGMENT_MAX_NOISE_SECONDS * data.mps)), margin, open_end)
+
+    def map(self, data: Trace, segments: List[Tuple[int, int]], func: Callable) -> list:
+        return self._map(partial(_process_segment, func=func), data, segments)
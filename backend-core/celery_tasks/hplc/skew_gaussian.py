@@ -0,0 +1,44 @@
+# Sum of skew gaussian components h * skewnorm.pdf(x, -a, b, c) written out in closed form,
+# every component is evaluated in one broadcast over a (samples, components) grid
+import numpy as np
+from scipy import special
+
+from celery_tasks.hplc.peak_table import FIT_PARAMS_COUNT
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def _terms(x: np.ndarray, params: np.ndarray):
+    x = np.asarray(x, dtype=float)[:, None]
+    h, a, b, c = np.asarray(params, dtype=float).reshape(-1, FIT_PARAMS_COUNT).T
+    c = np.where(c > 0, c, np.nan)  # like scipy, the scale has to be positive
+    s = -a
+    z = (x - b) / c
+    pdf = np.exp(-z**2 / 2) / SQRT_2PI
+    sz = s * z
+    return h, c, s, z, pdf, special.ndtr(sz), np.exp(-sz**2 / 2) / SQRT_2PI
+
+
+def skew_gaussian(x: np.ndarray, params: np.ndarray) -> np.ndarray:
+    # components, shape (len(x), len(params) // 4)
+    h, c, _, _, pdf, cdf, _ = _terms(x, params)
+    return h * 2 / c * pdf * cdf
+
+
+def skew_gaussian_sum(x: np.ndarray, baseline: float, params: np.ndarray) -> np.ndarray:
+    return skew_gaussian(x, params).sum(axis=1) + baseline
+
+
+def skew_gaussian_jac(x: np.ndarray, baseline: float, params: np.ndarray) -> np.ndarray:
+    # d/d(baseline, h1, a1, b1, c1, h2, ...), shape (len(x), 1 + len(params))
+    h, c, s, z, pdf, cdf, pdf_sz = _terms(x, params)
+    shape = pdf * cdf
+    dshape_dz = -z * shape + s * pdf * pdf_sz
+
+    jac = np.empty((len(z), 1 + z.shape[1] * FIT_PARAMS_COUNT))
+    jac[:, 0] = 1
+    jac[:, 1::4] = 2 / c * shape
+    jac[:, 2::4] = -2 * h / c * pdf * pdf_sz * z
+    jac[:, 3::4] = -2 * h / c**2 * dshape_dz
+    jac[:, 4::4] = -2 * h / c**2 * (shape + z * dshape_dz)
+    return jac
@@ -0,0 +1,83 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+# tolerance in samples when converting times to indices
+INDEX_EPS = 1e-6
+
+
+class Trace:
+    # signal on a uniform time grid: values[i] is sampled at t0 + i * dt (minutes)
+    __slots__ = ('values', 't0', 'dt')
+
+    def __init__(self, values: np.ndarray, t0: float = 0., dt: float = 1., dtype=None):
+        # float32 and float64 values are kept as they are unless dtype is given, anything else becomes float64
+        values = np.asarray(values, dtype=dtype)
+        self.values = values if values.dtype.kind == 'f' else values.astype(float)
+        self.t0 = float(t0)
+        self.dt = float(dt)
+
+    @classmethod
+    def from_period(cls, values, period, dtype=None) -> 'Trace':  # period in ms
+        return cls(values, 0., period / 1000 / 60, dtype)
+
+    @classmethod
+    def from_series(cls, series: pd.Series, dtype=None) -> 'Trace':
+        # the index is assumed to be uniform
+        t = series.index.to_numpy(dtype=float)
+        dt = (t[-1] - t[0]) / (len(t) - 1) if len(t) > 1 else 1.
+        t0 = t[0] if len(t) > 0 else 0.
+        return cls(series.to_numpy(dtype=dtype or float), t0, dt)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.values, index=self.times)
+
+    def copy(self, dtype=None) -> 'Trace':
+        return Trace(np.array(self.values, dtype=dtype), self.t0, self.dt)
+
+    def with_values(self, values: np.ndarray) -> 'Trace':
+        return Trace(values, self.t0, self.dt)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.values if dtype is None else self.values.astype(dtype)
+
+    def __getitem__(self, item: slice) -> 'Trace':  # positional slice, shares memory
+        start, _, step = item.indices(len(self.values))
+        return Trace(self.values[item], self.time(start), self.dt * step)
+
+    @property
+    def times(self) -> np.ndarray:
+        return self.t0 + np.arange(len(self.values)) * self.dt
+
+    @property
+    def mps(self) -> float:  # measurements per second
+        return 1 / (self.dt * 60)
+
+    def time(self, index):
+        return self.t0 + np.asarray(index) * self.dt
+
+    def index(self, time) -> np.ndarray:  # fractional position of a time
+        return (np.asarray(time, dtype=float) - self.t0) / self.dt
+
+    def index_left(self, time):  # first sample at or after time
+        return np.maximum(np.ceil(self.index(time) - INDEX_EPS), 0).astype(int)
+
+    def index_right(self, time):  # last sample at or before time
+        return np.minimum(np.floor(self.index(time) + INDEX_EPS), len(self.values) - 1).astype(int)
+
+    def bounds(self, start: float, end: float) -> Tuple[int, int]:
+        # positional [i_start, i_stop) of the samples within [start, end]
+        i_start = int(self.index_left(start))
+        return i_start, max(int(self.index_right(end)) + 1, i_start)
+
+    def slice(self, start: float, end: float) -> 'Trace':
+        # same samples as Series.loc[start:end] on the time index
+        i_start, i_stop = self.bounds(start, end)
+        return self[i_start:i_stop]
+
+    def value(self, time) -> float:  # value at the nearest sample
+        return self.values[int(np.clip(np.round(self.index(time)), 0, len(self.values) - 1))]
@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+import numpy as np
+
+from celery_tasks.hplc.trace import Trace
+
+TRACE_CACHE_MAX_BYTES = 256 << 20
+# seconds without a read after which the version token of a trace expires, the workers then decode it again
+TRACE_TOKEN_TIMEOUT = 60 * 60
+
+
+def _nbytes(value, seen: set) -> int:
+    # bytes of the numpy arrays reachable through the attributes of value, each array counted once
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(o, seen) for o in value)
+    if isinstance(value, dict):
+        return sum(_nbytes(o, seen) for o in value.values())
+    names = getattr(type(value), '__slots__', None) or getattr(value, '__dict__', {}).keys()
+    return sum(_nbytes(getattr(value, name, None), seen) for name in names)
+
+
+class _Entry:
+    __slots__ = ('token', 'data', 'derived', 'nbytes')
+
+    def __init__(self, token, data: Trace):
+        self.token = token
+        self.data = data
+        self.derived = {}
+        self.nbytes = _nbytes(data, set())
+
+
+class TraceCache:
+    # worker resident LRU of decoded traces and of objects derived from them, e.g. an AreaIndex, bounded by
+    # the bytes of their numpy arrays. token is the version of the stored trace, an entry with another token
+    # is loaded again
+    def __init__(self, max_bytes: int = TRACE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def trace(self, key: Hashable, token, load: Callable[[], Trace]) -> Trace:
+        return self._entry(key, token, load).data
+
+    def derived(self, key: Hashable, token, load: Callable[[], Trace], name: str,
+                compute: Callable[[Trace], Any]) -> Any:
+        # compute(trace) once per version of the trace
+        entry = self._entry(key, token, load)
+        if name not in entry.derived:
+            value = compute(entry.data)
+            with self._lock:
+                if name not in entry.derived:
+                    entry.derived[name] = value
+                    nbytes = _nbytes(value, {id(entry.data), id(entry.data.values)})
+                    entry.nbytes += nbytes
+                    if self._entries.get(key) is entry:
+                        self.nbytes += nbytes
+                    self._evict()
+        return entry.derived[name]
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.nbytes -= entry.nbytes
+
+    def _entry(self, key: Hashable, token, load: Callable[[], Trace]) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.token == token:
+                self._entries.move_to_end(key)
+                return entry
+        # loaded outside the lock, other measurements are served meanwhile
+        entry = _Entry(token, load())
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def _evict(self):
+        # the most recent entry stays even when it alone is over the limit
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
@@ -0,0 +1,101 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.baseline import als_batch
+from celery_tasks.hplc.fitting import FitExecutor, CURVE_FIT
+from celery_tasks.hplc.memory import interp_into
+from celery_tasks.hplc.peak_table import PeakTable
+from celery_tasks.hplc.priors import BaselinePrior
+from celery_tasks.hplc.segments import SegmentExecutor
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing, ALS_LAM, ALS_MAX_ITER, ALS_P, ALS_TOL, THRESHOLD_QUANTILES
+
+
+class MultiChannelProcessing:
+    # HPLCProcessing.process() of every channel of a multi-wavelength detector. the channels share the time grid,
+    # preprocessing, the ALS baselines and the thresholds are computed for all of them at once, peaks per channel
+    def __init__(self, values: np.ndarray, t0: float = 0., dt: float = 1.,
+                 prior_baselines: Sequence[Optional[BaselinePrior]] = None,
+                 fit_executor: FitExecutor = None,
+                 fit_engine: str = CURVE_FIT, segment_executor: SegmentExecutor = None, dtype=None):
+        self.values = np.asarray(values)  # samples x channels in mAU, as the detector delivers them
+        assert self.values.ndim == 2
+        self.t0 = float(t0)
+        self.dt = float(dt)  # minutes
+        self.prior_baselines = prior_baselines  # automatic ALS fits per channel, see HPLCProcessing
+        self.fit_executor = fit_executor
+        self.fit_engine = fit_engine
+        self.segment_executor = segment_executor
+        self.dtype = dtype  # of the working buffers, see HPLCProcessing
+        self.corrected_data = None  # channels x samples
+        self.baselines = None
+        self.baseline_niter = None  # per channel
+
+    @classmethod
+    def from_period(cls, values: np.ndarray, period, **kwargs) -> 'MultiChannelProcessing':  # period in ms
+        return cls(values, 0., period / 1000 / 60, **kwargs)
+
+    @property
+    def channels(self) -> int:
+        return self.values.shape[1]
+
+    def channel(self, values: np.ndarray) -> Trace:
+        return Trace(values, self.t0, self.dt)
+
+    def process(self) -> Tuple[List[PeakTable], List[Trace]]:
+        # channels x samples, rows are contiguous for the per channel stages
+        data = self.preprocess(np.array(self.values.T, dtype=self.dtype or float, order='C'))
+
+        baselines = self.fit_baselines(data)
+        np.minimum(data, baselines, out=baselines)
+        data -= baselines
+        self.corrected_data, self.baselines = data, baselines
+
+        tables = []
+        for values, threshold in zip(data, self.find_thresholds(data)):
+            trace = self.channel(values)
+            if self.segment_executor is None:
+                tables.append(HPLCProcessing.process_segment(trace, threshold, self.fit_executor, self.fit_engine))
+            else:
+                tables.append(HPLCProcessing.process_segments(trace, threshold, self.segment_executor,
+                                                              self.fit_executor, self.fit_engine))
+        return tables, [self.channel(values) for values in baselines]
+
+    @classmethod
+    def preprocess(cls, data: np.ndarray) -> np.ndarray:
+        # HPLCProcessing.preprocess() of every row, in place
+        median = np.median(data, axis=1)
+        data += np.where(median < 0, np.abs(median), 0)[:, None]
+        return np.abs(data, out=data)
+
+    def fit_baselines(self, data: np.ndarray) -> np.ndarray:
+        # HPLCProcessing.fit_baseline() of every row with one banded solve per iteration for all of them
+        grid = self.channel(data[0])
+        step = HPLCProcessing.downscale_step(grid)
+        d_grid = grid[::step]
+        d_data = data[:, ::step]
+        # channels whose prior is the fit of their data reuse it, the others are fitted cold, see WARM_START_ENGINES
+        fitted = np.array([HPLCProcessing.prior_fits(d_grid.with_values(values), self._prior(channel))
+                           for channel, values in enumerate(d_data)], dtype=bool)
+        d_baselines = np.array([self._prior(channel).knots.values if reused else values
+                                for channel, (reused, values) in enumerate(zip(fitted, d_data))], dtype=float)
+        self.baseline_niter = np.zeros(len(d_data), dtype=int)
+        if not fitted.all():
+            result = als_batch(d_data[~fitted], ALS_LAM, ALS_P, ALS_MAX_ITER, ALS_TOL)
+            d_baselines[~fitted] = result.baseline
+            self.baseline_niter[~fitted] = result.niter
+
+        baselines = np.empty_like(data)
+        for out, values in zip(baselines, d_baselines):
+            interp_into(out, grid.t0, grid.dt, d_grid.times, values)
+        return baselines
+
+    def _prior(self, channel: int) -> Optional[BaselinePrior]:
+        return self.prior_baselines[channel] if self.prior_baselines else None
+
+    @classmethod
+    def find_thresholds(cls, data: np.ndarray) -> np.ndarray:
+        # one quantile call over all rows
+        quantiles = np.quantile(data, THRESHOLD_QUANTILES, axis=1)
+        return np.array([HPLCProcessing._threshold_from_quantiles(o) for o in quantiles.T])
@@ -1,176 +1,294 @@
 import itertools
+from functools import partial
 
-from scipy import signal, sparse, stats, optimize
-from scipy.sparse import linalg
+from scipy import signal
 import numpy as np
 import pandas as pd
-from typing import List, Tuple, Dict, Any
+from typing import Callable, List, Tuple, Optional, Union
+
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.baseline import als, arpls, airpls, morphological, als_baseline, als_warm_weights, noise_level, \
+    ALSResult, ALS, ARPLS, AIRPLS, MORPHOLOGICAL
+from celery_tasks.hplc.fitting import FitExecutor, FitTask, gen_fit_func, gen_fit_jac, CURVE_FIT, NNLS
+from celery_tasks.hplc.folding import fold_groups
+from celery_tasks.hplc.knots import BaselineKnots
+from celery_tasks.hplc.memory import PeakMemory
+from celery_tasks.hplc.peak_table import Peak, PeakTable, FIT_PARAMS_COUNT, FIT_FALLBACK, FIT_TIMEOUT, FIT_UNRESOLVED
+from celery_tasks.hplc.pool import SERIAL
+from celery_tasks.hplc.priors import BaselinePrior, SequencePrior
+from celery_tasks.hplc.quantile import QuantileSketch
+from celery_tasks.hplc.segments import SegmentExecutor
+from celery_tasks.hplc.trace import Trace
 
 QUANTILE_MAX_DIFF = 0.3
+THRESHOLD_QUANTILES = np.linspace(0.5, 1, 100)
 MIN_SECONDS_PER_PEAK = 5
+# Prepared constant for MPS == 0.5
+ALS_LAM = 167
+ALS_P = 0
+ALS_MAX_ITER = 10
+ALS_TOL = 1e-3  # relative baseline change to stop iterating, p=0 ALS never gets there and always runs ALS_MAX_ITER
+ALS_WARM_NOISE_BAND = 3  # in noise sigmas above the prior baseline
+# engines warm started from the fit of other data, they converge to ALS_TOL. the default ALS engine is not one of
+# them: p=0 ALS has no fixed point, its baseline keeps sinking until too few weights are left, so where it stops
+# sets the result. it always runs ALS_MAX_ITER from uniform weights, its only saving is prior_fits()
+WARM_START_ENGINES = (ARPLS, AIRPLS)
+ARPLS_LAM = 1e4
+AIRPLS_LAM = 1e5
+MORPHOLOGICAL_WINDOW = 120  # samples, 4 minutes, wider than clusters of peaks
+# (y, niter, tol, weights) -> ALSResult on the downscaled trace, the same warm start for all of them
+BASELINE_ENGINES = {ALS: partial(als, lam=ALS_LAM, p=ALS_P), ARPLS: partial(arpls, lam=ARPLS_LAM),
+                    AIRPLS: partial(airpls, lam=AIRPLS_LAM),
+                    MORPHOLOGICAL: partial(morphological, window=MORPHOLOGICAL_WINDOW)}
+FIT_MAX_SKEW = 10
+WIDTH_TO_SIGMA = 2 * np.sqrt(2 * np.log(100))  # gaussian width at 1% of the height (rel_height=0.99)
 
 
-def _1skew_gaussian(x, h, a, b, c):
-    return h * stats.skewnorm.pdf(x, -a, b, c)
+class HPLCProcessing:
+    def __init__(self, data: Union[Trace, pd.Series], prior_baseline: BaselinePrior = None,
+                 fit_executor: FitExecutor = None, fit_engine: str = CURVE_FIT,
+                 segment_executor: SegmentExecutor = None, dtype=None, overwrite_data: bool = False,
+                 trace_memory: bool = False, sequence_prior: SequencePrior = None, baseline_engine: str = ALS,
+                 checkpoint: Callable[[], None] = None):
+        self.data = self._as_trace(data)  # raw values in mAU on a time grid in minutes
+        # results of the previous injection of the sequence, seed the fits and the baseline
+        self.prior = sequence_prior
+        # the last automatic fit of the measurement, else the one of the sequence prior. used only when fitted by the
+        # same engine with the same parameters: reused as it is on the same data, else see WARM_START_ENGINES
+        self.prior_baseline = prior_baseline
+        if self.prior_baseline is None and sequence_prior is not None:
+            self.prior_baseline = sequence_prior.baseline
+        self.fit_executor = fit_executor  # serial when not set
+        self.fit_engine = fit_engine  # CURVE_FIT or NNLS for mixed peaks
+        self.segment_executor = segment_executor  # the whole trace at once when not set
+        self.baseline_engine = baseline_engine  # see BASELINE_ENGINES
+        self.dtype = dtype  # of the working buffers, np.float32 halves them, sums are accumulated in float64
+        self.overwrite_data = overwrite_data  # work in the buffer of data instead of a copy
+        self.trace_memory = trace_memory
+        self.checkpoint = checkpoint  # called between stages, raises to stop the run, e.g. when superseded
+        self.peak_memory = None  # bytes allocated at most during the last run, when trace_memory
+        self.corrected_data = None
+        self.baseline = None
+        self.baseline_knots = None  # the fitted baseline
+        self.baseline_prior = None  # the fit as a warm start of the next one
+        self.baseline_niter = None  # ALS iterations actually used
 
+    # Main pipeline
+    # threshold - min peak height
+    def process(self) -> Tuple[PeakTable, Trace]:
+        return self._traced(self._process)
 
-class Peak:
-    def __init__(self, apex, start=None, end=None, start_mau=None, end_mau=None):
-        self.apex = apex  # extreamum in minutes
+    def _process(self) -> Tuple[PeakTable, Trace]:
+        data = self.correct_data()
 
-        self.start = start  # left right bounds in minutes
-        self.end = end
+        threshold = self.find_threshold(data)
+        if self.segment_executor is None:
+            peaks = self.process_segment(data, threshold, self.fit_executor, self.fit_engine, self.prior)
+        else:
+            peaks = self.process_segments(data, threshold, self.segment_executor, self.fit_executor,
+                                          self.fit_engine, self.prior)
 
-        self.start_mau = start_mau  # left right bounds in mau
-        self.end_mau = end_mau
+        return peaks, self.baseline
 
-        self.peaks: List[Peak] = []  # child peaks
+    def preview(self) -> Tuple[PeakTable, Trace]:
+        # no fitting, mixed peaks are left unresolved with drop-line areas.
+        # the baseline is fitted on the downscaled trace and warm started from the prior as in process()
+        return self._traced(self._preview)
 
-        # for mixed peaks
-        self.gaussian_params = None
-        self.baseline = None  # mAU height digit
-        # final params
-        self.area = None
+    def _preview(self) -> Tuple[PeakTable, Trace]:
+        data = self.correct_data()
 
-    @property
-    def is_mixed_peak(self):
-        return len(self.peaks) > 0
+        peaks = self.detect_peaks(data, self.find_threshold(data))
+        grouped = peaks.parent >= 0
+        grouped[peaks.mixed] = True
+        peaks.fit_status[grouped] = FIT_UNRESOLVED
 
-    @property
-    def is_manual_peak(self):
-        return self.start_mau is not None and self.end_mau is not None
+        peaks = self.set_area_peaks(data, peaks)
 
-    def get_data_slice(self, data: pd.Series) -> pd.Series:  # slice data for peak
-        return data.loc[self.start:self.end]
+        return peaks, self.baseline
 
+    def correct_data(self) -> Trace:
+        # the preprocessed trace corrected by its fitted baseline, the stages before peak detection
+        data = self.preprocess(self._working_data(), in_place=True)
+        self._checkpoint()
 
-class HPLCProcessing:
-    def __init__(self, data: pd.Series):
-        self.data = data  # raw values {min: mAU}
-        self.corrected_data = None
-        self.baseline = None
+        baseline = self._fit_baseline(data)
+        data, self.baseline = self.correct_baseline(data, baseline, in_place=True)
+        self.corrected_data = data
+        self._checkpoint()
+        return data
 
-    # Main pipeline
-    # threshold - min peak height
-    def process(self) -> Tuple[List[Peak], Any]:
-        data: pd.Series = self.data.copy()
+    @classmethod
+    def process_segment(cls, data: Trace, threshold: float, fit_executor: FitExecutor = None,
+                        fit_engine: str = CURVE_FIT, prior: SequencePrior = None) -> PeakTable:
+        peaks = cls.detect_peaks(data, threshold)
 
-        data = self.preprocess(data)
+        peaks = cls.fit_peaks(data, peaks, fit_executor, fit_engine, prior)
 
-        data, self.baseline = self.correct_baseline(data)
-        self.corrected_data = data
+        peaks = cls.set_area_peaks(data, peaks)
 
-        threshold = self.find_threshold(data)
+        return peaks
+
+    @classmethod
+    def detect_peaks(cls, data: Trace, threshold: float) -> PeakTable:
         # find only extremum
-        peak_indices = self.find_peaks(data, threshold)
+        peak_indices = cls.find_peaks(data, threshold)
 
         # positions in series of starts and ends peaks
-        widths_sizes, widths_starts, widths_ends = self.define_peak_widths(data, peak_indices)
+        widths_sizes, widths_starts, widths_ends = cls.define_peak_widths(data, peak_indices)
 
         peak_indices, widths_sizes, widths_starts, widths_ends = \
-            self.filter_peaks(data, peak_indices, widths_sizes, widths_starts, widths_ends)
+            cls.filter_peaks(data, peak_indices, widths_sizes, widths_starts, widths_ends)
 
-        peaks = self.create_peaks(data, peak_indices, widths_starts, widths_ends)
+        peaks = cls.create_peaks(data, peak_indices, widths_starts, widths_ends, widths_sizes)
 
-        peaks = self.fold_peaks(peaks)
+        peaks = cls.fold_peaks(peaks)
 
-        peaks = self.fit_peaks(data, peaks)
+        return peaks
 
-        peaks = self.set_area_peaks(data, peaks)
+    @classmethod
+    def process_segments(cls, data: Trace, threshold: float, executor: SegmentExecutor,
+                         fit_executor: FitExecutor = None, fit_engine: str = CURVE_FIT,
+                         prior: SequencePrior = None) -> PeakTable:
+        # peaks never cross a long stretch below the threshold, the segments between them are independent
+        segments = executor.segments(data, threshold, int(np.ceil(cls._get_mps(data) * MIN_SECONDS_PER_PEAK)))
+        if executor.mode != SERIAL:
+            fit_executor = (fit_executor or FitExecutor()).serial()
+        tables = executor.map(data, segments, partial(cls.process_segment, threshold=threshold,
+                                                      fit_executor=fit_executor, fit_engine=fit_engine,
+                                                      prior=prior))
+        # segments are in time order, so is the merged table
+        return PeakTable.concat(tables)
+
+    def process_baseline(self) -> Trace:
+        return self._traced(lambda: self._fit_baseline(self.preprocess(self._working_data(), in_place=True)))
+
+    def _checkpoint(self):
+        if self.checkpoint is not None:
+            self.checkpoint()
+
+    def _traced(self, func):
+        if not self.trace_memory:
+            return func()
+        with PeakMemory() as memory:
+            result = func()
+        self.peak_memory = memory.peak
+        return result
 
-        return peaks, self.baseline
+    def _working_data(self) -> Trace:
+        # the only full size copy of the trace, later stages work in it and in the baseline buffer
+        if self.overwrite_data and (self.dtype is None or self.data.values.dtype == self.dtype):
+            return self.data
+        return self.data.copy(self.dtype)
 
-    def process_baseline(self):
-        data: pd.Series = self.data.copy()
-        data = self.preprocess(data)
-        return self.get_baseline(data)
+    def _fit_baseline(self, data: Trace) -> Trace:
+        self.baseline_prior, result = self.fit_baseline_prior(data, self.prior_baseline, self.baseline_engine)
+        self.baseline_knots = self.baseline_prior.knots
+        self.baseline_niter = result.niter
+        return self.baseline_knots.on_grid(data, np.empty_like(data.values))
 
     @classmethod
-    def calc_raw_peak(cls, data: pd.Series, start: dict, end: dict) -> Peak:
-        data: pd.Series = data.copy()
-
+    def calc_raw_peak(cls, data: Trace, start: dict, end: dict, index: AreaIndex = None) -> Peak:
+        # index - of data or of the whole trace data is sliced from
         apex_ind = cls.find_peak(data)
 
         peak = cls.create_peak(data, apex_ind, start['time'], end['time'], start['mau'], end['mau'])
 
-        peak = cls.set_area_peak(data, peak)
+        peak = cls.set_area_peak(data, peak, index)
 
         return peak
 
+    @classmethod
+    def calc_raw_peaks(cls, data: Trace, starts, ends, start_maus, end_maus, index: AreaIndex = None) -> PeakTable:
+        # calc_raw_peak of many manual regions of the whole trace at once, regions without samples get a nan apex
+        if index is None:
+            index = AreaIndex(data)
+        i_start, i_stop = index.bounds(starts, ends)
+        i_stop = np.maximum(i_stop + 1, i_start)
+        apex = np.full(len(i_start), np.nan)
+        found = i_stop > i_start
+        apex[found] = data.time(cls.find_peak_indices(data, i_start[found], i_stop[found]))
+        peaks = PeakTable.from_arrays(apex, starts, ends, start_maus, end_maus)
+        peaks.area[:] = index.area_manual(peaks.start, peaks.end, peaks.start_mau, peaks.end_mau)
+        return peaks
+
     ###############
 
     @classmethod
-    def find_peaks(cls, data: pd.Series, threshold: float) -> np.ndarray:
+    def sequence_prior(cls, peaks: PeakTable, baseline: BaselinePrior) -> SequencePrior:
+        # prior for the next injection
+        return SequencePrior.from_results(peaks, baseline)
+
+    @classmethod
+    def find_peaks(cls, data: Trace, threshold: float) -> np.ndarray:
         mps = cls._get_mps(data)
         distance = mps * MIN_SECONDS_PER_PEAK
-        peaks_indices, _ = signal.find_peaks(data, height=threshold, distance=distance)
+        peaks_indices, _ = signal.find_peaks(data.values, height=threshold, distance=distance)
         return peaks_indices
 
     @classmethod
-    def find_peak(cls, data: pd.Series) -> int:
+    def find_peak(cls, data: Trace) -> int:
         return data.values.argmax()
 
     @classmethod
-    def create_peak(cls, data, apex_ind, l_bound, r_bound, l_bound_mau=None, r_bound_mau=None) -> Peak:
-        apex = data.index[apex_ind]
-        return Peak(apex, l_bound, r_bound, l_bound_mau, r_bound_mau)
+    def find_peak_indices(cls, data: Trace, i_start: np.ndarray, i_stop: np.ndarray) -> np.ndarray:
+        # find_peak of each non empty range [i_start, i_stop) of samples, the first maximum like argmax
+        counts = i_stop - i_start
+        if not len(counts):
+            return np.zeros(0, dtype=int)
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        region = np.repeat(np.arange(len(counts)), counts)
+        positions = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(i_start, counts)
+        values = data.values[positions]
+        hits = np.flatnonzero(values == np.maximum.reduceat(values, offsets)[region])
+        _, first = np.unique(region[hits], return_index=True)
+        return positions[hits[first]]
 
     @classmethod
-    def create_peaks(cls, data: pd.Series, peak_indices: np.ndarray, widths_starts: pd.Series,
-                     widths_ends: pd.Series) -> List[Peak]:
-        peaks_count = len(peak_indices)
-        peaks: List[Peak] = []
-        for i in range(peaks_count):
-            apex_ind = peak_indices[i]
-            l_bound = widths_starts.index[i]
-            r_bound = widths_ends.index[i]
-
-            peak = cls.create_peak(data, apex_ind, l_bound, r_bound)
-            peaks.append(peak)
-        return peaks
+    def create_peak(cls, data: Trace, apex_ind, l_bound, r_bound, l_bound_mau=None, r_bound_mau=None) -> Peak:
+        apex = data.time(apex_ind)
+        return Peak(apex, l_bound, r_bound, l_bound_mau, r_bound_mau)
 
-    # todo: need optimizations, not effective algorithm
     @classmethod
-    def fold_peaks(cls, peaks: List[Peak]) -> List[Peak]:
-        # sorted_peaks = sorted(peaks, key=lambda o: o.r_bound - o.l_bound)
-        # todo: fold peaks like [1, 3] [2, 4]
-        for peak in peaks:
-            peak.peaks = list(filter(lambda o: o.start > peak.start and o.end < peak.end, peaks))
-            peak.peaks = sorted(peak.peaks, key=lambda o: o.apex)
-
-        all_folded_peaks = list(itertools.chain.from_iterable([peak.peaks for peak in peaks]))
-
-        peaks = list(filter(lambda o: o not in all_folded_peaks, peaks))
-
-        # for peak in peaks:
-        #     peak.peaks = list(filter(lambda o: peak.start < o.start < peak.end < o.end, peaks))
-        #     peak.peaks = sorted(peak.peaks, key=lambda o: o.apex_ind)
-        #
-        # all_mixed_peaks = list(itertools.chain.from_iterable([peak.peaks for peak in peaks]))
-        #
-        # peaks = list(filter(lambda o: o not in all_mixed_peaks, peaks))
+    def create_peaks(cls, data: Trace, peak_indices: np.ndarray, widths_starts: np.ndarray,
+                     widths_ends: np.ndarray, widths_sizes: np.ndarray = None) -> PeakTable:
+        width = None if widths_sizes is None else widths_sizes * data.dt
+        return PeakTable.from_arrays(data.time(peak_indices), widths_starts, widths_ends, width=width)
 
+    @classmethod
+    def fold_peaks(cls, peaks: PeakTable) -> PeakTable:
+        # overlapping peaks form one group, the widest one carries the fit of the whole group
+        order, parent, bounds = fold_groups(peaks.start, peaks.end, peaks.apex)
+
+        peaks = peaks.take(order)
+        peaks.parent = parent
+        heads = parent < 0
+        peaks.start[heads], peaks.end[heads] = bounds[:, 0], bounds[:, 1]
         return peaks
 
     @classmethod
-    def fit_peaks(cls, data: pd.Series, peaks: List[Peak]) -> List[Peak]:
-        for peak in peaks:
-            if peak.is_mixed_peak:
-                data_slice = peak.get_data_slice(data)
-
-                initial_p = cls.get_fit_func_params(data, peak)
-                curve_func = cls.gen_fit_func(len(peak.peaks) + 1)
-
-                # todo: check fail in fitting
-                params, _ = optimize.curve_fit(curve_func, data_slice.index, data_slice, p0=initial_p)
-
-                peak.baseline, params = params[0], params[1:]
-                peak.gaussian_params, params = params[:4], params[4:]
-
-                for i, inner_peak in enumerate(peak.peaks):
-                    start_i = i * 4
-                    inner_peak.baseline = peak.baseline
-                    inner_peak.gaussian_params = params[start_i:start_i + 4]
+    def fit_peaks(cls, data: Trace, peaks: PeakTable, executor: FitExecutor = None,
+                  engine: str = CURVE_FIT, prior: SequencePrior = None) -> PeakTable:
+        # curve fits start from the matching components of the prior when there is one
+        executor = executor or FitExecutor()
+        mixed_rows = peaks.mixed
+        tasks = []
+        for row in mixed_rows:
+            peak = peaks.peak(row)
+            start, stop = data.bounds(peak.start, peak.end)
+            lower, upper = cls.get_fit_func_bounds(data, peak)
+            if engine == NNLS:
+                initial_p = cls.get_nnls_params(data, peak)
+            else:
+                initial_p = np.clip(cls.get_fit_func_params(data, peak, prior), lower, upper)
+            tasks.append(FitTask(start, stop, initial_p, lower, upper))
+
+        for row, result in zip(mixed_rows, executor.map(data, tasks, engine)):
+            rows = np.concatenate([[row], peaks.children(row)])
+            peaks.fit_status[rows] = result.status
+            if result.params is not None:
+                peaks.baseline[rows] = result.params[0]
+                peaks.params[rows] = result.params[1:].reshape(-1, FIT_PARAMS_COUNT)
 
         return peaks
 
@@ -187,146 +305,298 @@ class HPLCProcessing:
         return peak_indices, widths_sizes, widths_starts, widths_ends
 
     @classmethod
-    def set_area_peak(cls, data, peak):
+    def set_area_peak(cls, data, peak, index: AreaIndex = None):
         if peak.is_mixed_peak:
             peak.area = cls._area_mixed_peak(data, peak)
             for inner_peak in peak.peaks:
                 inner_peak.area = cls._area_mixed_peak(data, inner_peak)
-        elif peak.is_manual_peak:
-            peak.area = cls.area_manual_peak(data, peak)
+            return peak
+        if index is None:
+            index = AreaIndex(peak.get_data_slice(data))
+        if peak.is_manual_peak:
+            peak.area = cls.area_manual_peak(data, peak, index)
         else:
-            data_slice = peak.get_data_slice(data)
-            data_slice -= cls.baseline_lin(data_slice)
-            peak.area = cls.area_peak(data_slice)
+            peak.area = float(index.area_peak_lin(peak.start, peak.end))
         return peak
 
     @classmethod
-    def set_area_peaks(cls, data: pd.Series, peaks: List[Peak]) -> List[Peak]:
-        for peak in peaks:
-            cls.set_area_peak(data, peak)
+    def set_area_peaks(cls, data: Trace, peaks: PeakTable) -> PeakTable:
+        index = AreaIndex(data)
+        fitted = ~np.isnan(peaks.params[:, 0])
+        peaks.area[fitted] = peaks.params[fitted, 0]
+
+        failed = np.isin(peaks.fit_status, (FIT_FALLBACK, FIT_TIMEOUT, FIT_UNRESOLVED))
+        for row in peaks.mixed:
+            if failed[row]:
+                rows = np.concatenate([[row], peaks.children(row)])
+                peaks.area[rows] = cls.area_drop_lines(data, peaks.start[row], peaks.end[row], peaks.apex[rows],
+                                                       index)
+
+        rows = ~fitted & ~failed
+        manual = rows & peaks.is_manual
+        rows &= ~manual
+        peaks.area[rows] = index.area_peak_lin(peaks.start[rows], peaks.end[rows])
+        peaks.area[manual] = index.area_manual(peaks.start[manual], peaks.end[manual], peaks.start_mau[manual],
+                                               peaks.end_mau[manual])
         return peaks
 
     @classmethod
-    def _area_mixed_peak(cls, data: pd.Series, peak: Peak) -> float:
+    def _area_mixed_peak(cls, data: Trace, peak: Peak) -> float:
         return peak.gaussian_params[0]
 
     @classmethod
-    def area_manual_peak(cls, data: pd.Series, peak: Peak) -> float:
-        trapezoid_area = (peak.end - peak.start) * (peak.start_mau + peak.end_mau) / 2
-        peak_area = cls.area_peak(data)
-        return peak_area - trapezoid_area
+    def area_drop_lines(cls, data: Trace, start: float, end: float, apexes: np.ndarray,
+                        index: AreaIndex = None) -> np.ndarray:
+        # areas of co-eluting peaks split by vertical lines at the minimum between neighbouring apexes,
+        # above the straight line joining the bounds of the whole group
+        if index is None:
+            index = AreaIndex(data.slice(start, end))
+        first, last = (int(o) for o in index.bounds(start, end))
+        values = index.data.values
+        first_value, last_value = float(values[first]), float(values[last])
+        slope = (last_value - first_value) / max(last - first, 1)
+        apex_indices = np.clip(np.round(index.data.index(apexes)).astype(int), first, last)
+        order = np.argsort(apex_indices, kind='stable')
+        sorted_indices = apex_indices[order]
+
+        cuts = [first]
+        for left, right in zip(sorted_indices[:-1], sorted_indices[1:]):
+            line = first_value + slope * (np.arange(left, right + 1) - first)
+            cuts.append(left + int(np.argmin(values[left:right + 1] - line)))
+        cuts.append(last)
+
+        areas = np.empty(len(apexes))
+        areas[order] = index.area_above_line(cuts[:-1], cuts[1:], first, last, first_value, last_value)
+        return areas
 
     @classmethod
-    def area_peak(cls, data: pd.Series) -> float:
-        return np.trapz(data, data.index)
+    def area_manual_peak(cls, data: Trace, peak: Peak, index: AreaIndex = None) -> float:
+        if index is None:
+            index = AreaIndex(data)
+        return float(index.area_manual(peak.start, peak.end, peak.start_mau, peak.end_mau))
 
     @classmethod
-    def define_peak_widths(cls, data: pd.Series, peak_indices: np.ndarray) -> Tuple[np.ndarray, pd.Series, pd.Series]:
-        ind_widths = signal.peak_widths(data, peak_indices, rel_height=0.99)
+    def area_peak(cls, data: Trace) -> float:
+        # trapezoid rule on the uniform grid
+        values = data.values
+        if len(values) < 2:
+            return 0.
+        return data.dt * (values.sum(dtype=np.float64) - (float(values[0]) + float(values[-1])) / 2)
 
-        widths_sizes, widths_starts, widths_ends = ind_widths[0], data.iloc[ind_widths[2]], data.iloc[ind_widths[3]]
+    @classmethod
+    def define_peak_widths(cls, data: Trace, peak_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        ind_widths = signal.peak_widths(data.values, peak_indices, rel_height=0.99)
+
+        # bounds are snapped to the sample at or before the interpolated position
+        widths_sizes = ind_widths[0]
+        widths_starts = data.time(np.floor(ind_widths[2]).astype(int))
+        widths_ends = data.time(np.floor(ind_widths[3]).astype(int))
 
         return widths_sizes, widths_starts, widths_ends
 
     @classmethod
-    def _get_mps(cls, data: pd.Series) -> float:
-        last_x = data.index.values[-1]  # Last value of a time
-        return (len(data) - 1) / last_x / 60
+    def _get_mps(cls, data: Trace) -> float:
+        return data.mps
 
     @classmethod
-    def _absolute_values(cls, data: pd.Series) -> pd.Series:
-        return data.abs()
+    def _as_trace(cls, data: Union[Trace, pd.Series, None]) -> Optional[Trace]:
+        if isinstance(data, pd.Series):
+            return Trace.from_series(data)
+        return data
 
     @classmethod
-    def preprocess(cls, data: pd.Series) -> pd.Series:
-        median = data.median()
+    def _absolute_values(cls, data: Trace, in_place: bool = False) -> Trace:
+        return data.with_values(np.abs(data.values, out=data.values if in_place else None))
+
+    @classmethod
+    def preprocess(cls, data: Trace, in_place: bool = False) -> Trace:
+        values = data.values if in_place else data.values.copy()
+        median = np.median(values)
         # print(f'median {median}')
         if median < 0:
-            median = abs(median)
-            data = data.apply(lambda o: o + median)
-        data = cls._absolute_values(data)
+            values += abs(median)
+        data = cls._absolute_values(data.with_values(values), in_place=True)
         return data
 
     @classmethod
-    def downscale_data(cls, data: pd.Series) -> pd.Series:
+    def downscale_data(cls, data: Trace) -> Trace:
+        return data[::cls.downscale_step(data)]
+
+    @classmethod
+    def downscale_step(cls, data: Trace) -> int:
         MPS_GOAL = 0.5
         mps = cls._get_mps(data)
         # print(f'mps {mps}')
         scale = int(np.round(mps / MPS_GOAL))
         # print(f'scale {scale}')
-        return data.iloc[::scale]
+        return scale
 
     @classmethod
-    def find_threshold(cls, data: pd.Series) -> float:
-        lsp = np.linspace(0.5, 1, 100)
-        quantiles = pd.Series([(np.quantile(data, i)) for i in lsp], index=lsp)
-        quantiles_diffs = quantiles.values[1:] - quantiles.values[:-1]
+    def knot_spacing(cls, data: Trace) -> float:
+        # minutes between the knots of fitted baselines
+        return cls.downscale_step(data) * data.dt
+
+    @classmethod
+    def find_threshold(cls, data: Trace) -> float:
+        # one multi-quantile call, a single partition of the trace
+        return cls._threshold_from_quantiles(np.quantile(data.values, THRESHOLD_QUANTILES))
+
+    @classmethod
+    def find_threshold_sketch(cls, sketch: QuantileSketch) -> float:
+        # approximate threshold kept up to date on chunked data
+        return cls._threshold_from_quantiles(sketch.quantile(THRESHOLD_QUANTILES))
+
+    @classmethod
+    def _threshold_from_quantiles(cls, quantiles: np.ndarray) -> float:
+        quantiles_diffs = quantiles[1:] - quantiles[:-1]
         index = np.argmax(quantiles_diffs > QUANTILE_MAX_DIFF)
-        return quantiles.iloc[index]
+        return quantiles[index]
 
     @classmethod
     def baseline_als(cls, y: np.ndarray, lam, p, niter) -> np.ndarray:
-        assert (niter > 0)
-        length = len(y)
-        D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(length, length - 2))
-        D = lam * D.dot(D.transpose())
-        w = np.ones(length)
-        W = sparse.spdiags(w, 0, length, length)
-        z: np.ndarray = None
-        for i in range(niter):
-            W.setdiag(w)
-            Z = W + D
-            z: np.ndarray = linalg.spsolve(Z, w * y)
-            w = p * (y > z) + (1 - p) * (y < z)
-        return z
-
-    @classmethod
-    def baseline_lin(cls, data: pd.Series):
+        return als_baseline(y, lam, p, niter)
+
+    @classmethod
+    def baseline_lin(cls, data: Trace):
         length = len(data)
-        first_val = data.iloc[0]
-        last_val = data.iloc[-1]
+        first_val = data.values[0]
+        last_val = data.values[-1]
         return np.linspace(first_val, last_val, length, endpoint=True)
 
     @classmethod
-    def get_baseline(cls, data: pd.Series) -> pd.Series:
-        # Prepared constant for MPS == 0.5
-        LAM = 167
+    def get_baseline(cls, data: Trace, prior: BaselinePrior = None, engine: str = ALS) -> Trace:
+        return cls.fit_baseline(data, prior, engine=engine)[0]
+
+    @classmethod
+    def fit_baseline(cls, data: Trace, prior: BaselinePrior = None, out: np.ndarray = None,
+                     engine: str = ALS) -> Tuple[Trace, ALSResult]:
+        knots, result = cls.fit_baseline_knots(data, prior, engine)
+        return knots.on_grid(data, out), result
+
+    @classmethod
+    def fit_baseline_knots(cls, data: Trace, prior: BaselinePrior = None,
+                           engine: str = ALS) -> Tuple[BaselineKnots, ALSResult]:
+        # the baseline at the samples of the downscaled trace it is fitted on
+        fit, result = cls.fit_baseline_prior(data, prior, engine)
+        return fit.knots, result
+
+    @classmethod
+    def fit_baseline_prior(cls, data: Trace, prior: BaselinePrior = None,
+                           engine: str = ALS) -> Tuple[BaselinePrior, ALSResult]:
+        # fit_baseline_knots() along with what a later fit needs to warm start from it
         d_data = cls.downscale_data(data)
-        result = cls.baseline_als(d_data.to_numpy(), LAM, 0, 10)
-        result = pd.Series(result, index=d_data.index)
-        result = result.reindex(data.index).interpolate('index')
-        return result
+        if cls.prior_fits(d_data, prior, engine):
+            # the fit of the same data, iterating again would only drift away from the cold result
+            return prior, ALSResult(prior.knots.values, None, 0)
+        weights = cls.baseline_start(d_data, prior, engine)
+        result = BASELINE_ENGINES[engine](d_data.values, niter=ALS_MAX_ITER, tol=ALS_TOL, weights=weights)
+        knots = BaselineKnots(d_data.times, result.baseline)
+        return BaselinePrior(knots, engine, cls.baseline_params(engine), BaselinePrior.data_digest(d_data)), result
+
+    @classmethod
+    def prior_fits(cls, d_data: Trace, prior: BaselinePrior = None, engine: str = ALS) -> bool:
+        # the prior is the fit of engine on the downscaled data itself, reprocessing reuses it as it is
+        return prior is not None and prior.matches(engine, cls.baseline_params(engine)) and \
+            prior.digest == BaselinePrior.data_digest(d_data)
 
     @classmethod
-    def correct_baseline(cls, data: pd.Series) -> pd.Series:
-        baseline = cls.get_baseline(data)
-        baseline = pd.concat([data, baseline], axis=1).min(axis=1)
-        result = data - baseline
+    def baseline_params(cls, engine: str) -> dict:
+        # everything the fit of engine depends on but the data, a prior fitted with other params is not used
+        return dict(BASELINE_ENGINES[engine].keywords, niter=ALS_MAX_ITER, tol=ALS_TOL,
+                    noise_band=ALS_WARM_NOISE_BAND)
+
+    @classmethod
+    def baseline_start(cls, d_data: Trace, prior: BaselinePrior = None, engine: str = ALS) -> Optional[np.ndarray]:
+        # weights on the downscaled data warm started from a prior fit of engine, None for a cold start
+        if engine not in WARM_START_ENGINES or prior is None or len(prior.knots) == 0 or \
+                not prior.matches(engine, cls.baseline_params(engine)):
+            return None
+        y = d_data.values
+        prior = prior.knots.interp(d_data.times)
+        return als_warm_weights(y, prior, ALS_P, ALS_WARM_NOISE_BAND * noise_level(y))
+
+    @classmethod
+    def correct_baseline(cls, data: Trace, baseline: Trace = None, in_place: bool = False) -> Tuple[Trace, Trace]:
+        if baseline is None:
+            baseline = cls.get_baseline(data)
+        if in_place:
+            # the baseline buffer gets min(data, baseline), the data buffer the corrected trace
+            np.minimum(data.values, baseline.values, out=baseline.values)
+            np.subtract(data.values, baseline.values, out=data.values)
+            return data, baseline
+        baseline = data.with_values(np.minimum(data.values, baseline.values))
+        result = data.with_values(data.values - baseline.values)
         return result, baseline
 
     @classmethod
-    def correct_baseline_manual(cls, data: pd.Series, start: dict, end: dict) -> pd.Series:
+    def stored_baseline(cls, data: Trace, baseline: BaselineKnots, clip: bool = False) -> Trace:
+        # one value per sample of the raw data, the form set_baseline has always stored. clip: min(data, baseline)
+        # as process() returns it
+        baseline = baseline.on_grid(data)
+        if clip:
+            _, baseline = cls.correct_baseline(cls.preprocess(data), baseline, in_place=True)
+        return baseline
+
+    @classmethod
+    def correct_baseline_manual(cls, data: Trace, start: dict, end: dict) -> Trace:
         return data
 
     ################
     @classmethod
-    def _get_fit_func_param(cls, data: pd.Series, peak: Peak):
-        height = data.loc[peak.apex]
+    def _get_fit_func_param(cls, data: Trace, peak: Peak):
+        height = data.value(peak.apex)
         center = peak.apex
 
         return [height / 10, 1, center, 0.1]
 
     @classmethod
-    def get_fit_func_params(cls, data: pd.Series, peak: Peak) -> List[float]:
+    def _get_peak_width(cls, data: Trace, peak: Peak) -> float:
+        width = peak.width if peak.width is not None else peak.end - peak.start
+        return max(width, 2 * data.dt)
+
+    @classmethod
+    def _get_fit_func_bound(cls, data: Trace, peak: Peak) -> Tuple[List[float], List[float]]:
+        # the center stays inside the detected width, the scale is below it
+        width = cls._get_peak_width(data, peak)
+        lower = [0, -FIT_MAX_SKEW, peak.apex - width / 2, data.dt]
+        upper = [np.inf, FIT_MAX_SKEW, peak.apex + width / 2, width]
+        return lower, upper
+
+    @classmethod
+    def get_fit_func_bounds(cls, data: Trace, peak: Peak) -> Tuple[List[float], List[float]]:
+        bounds = [cls._get_fit_func_bound(data, o) for o in [peak] + peak.peaks]
+        lower = [-np.inf] + list(itertools.chain.from_iterable(o[0] for o in bounds))
+        upper = [np.inf] + list(itertools.chain.from_iterable(o[1] for o in bounds))
+        return lower, upper
+
+    @classmethod
+    def get_fit_func_params(cls, data: Trace, peak: Peak, prior: SequencePrior = None) -> List[float]:
         peak_data_slice = peak.get_data_slice(data)
         sub_peaks = (cls._get_fit_func_param(data, sub_peak) for sub_peak in peak.peaks)
-        return [peak_data_slice.min()] + cls._get_fit_func_param(data, peak) + list(
+        params = [peak_data_slice.values.min()] + cls._get_fit_func_param(data, peak) + list(
             itertools.chain.from_iterable(sub_peaks))
+        if prior is None or len(prior) == 0:
+            return params
+        # components found in the prior start from its fit, the others from the fixed guess
+        baseline, seeded = prior.seed([o.apex for o in [peak] + peak.peaks])
+        params = np.array(params)
+        components = params[1:].reshape(-1, FIT_PARAMS_COUNT)
+        found = ~np.isnan(seeded[:, 0])
+        components[found] = seeded[found]
+        if found.any():
+            params[0] = baseline
+        return params.tolist()
+
+    @classmethod
+    def get_nnls_params(cls, data: Trace, peak: Peak) -> List[float]:
+        # gaussian at every apex with the sigma of its detected width
+        shapes = ([0, 0, o.apex, cls._get_peak_width(data, o) / WIDTH_TO_SIGMA] for o in [peak] + peak.peaks)
+        return [0] + list(itertools.chain.from_iterable(shapes))
 
     @classmethod
     def gen_fit_func(cls, peaks_count: int):
-        def fit_func(x, baseline, *args):
-            assert len(args) == peaks_count * 4
-            return sum((_1skew_gaussian(x, *args[i:i + 4]) for i in range(0, peaks_count * 4, 4))) + baseline
+        return gen_fit_func(peaks_count)
 
-        return fit_func
+    @classmethod
+    def gen_fit_jac(cls, peaks_count: int):
+        return gen_fit_jac(peaks_count)
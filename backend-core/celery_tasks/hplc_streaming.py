@@ -0,0 +1,143 @@
+from functools import partial
+from typing import Tuple
+
+import numpy as np
+
+from celery_tasks.hplc.fitting import FitExecutor, CURVE_FIT
+from celery_tasks.hplc.memory import interp_into
+from celery_tasks.hplc.peak_table import PeakTable
+from celery_tasks.hplc.pool import SERIAL
+from celery_tasks.hplc.priors import BaselinePrior
+from celery_tasks.hplc.quantile import QuantileSketch
+from celery_tasks.hplc.segments import SegmentExecutor
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing, MIN_SECONDS_PER_PEAK
+
+STREAM_REFIT_SECONDS = 30  # of new data between rolling baseline fits
+STREAM_WARMUP_SECONDS = 120  # of data before the first confirmation, the threshold needs a baseline stretch
+STREAM_INITIAL_CAPACITY = 1 << 16  # samples
+# mAU, the most the corrected values of a confirmed segment may move in the batch pass for finish() to keep
+# its peaks, about the noise of a UV detector
+STREAM_TOLERANCE = 0.05
+
+
+class StreamingProcessor:
+    # processing of a trace while it is acquired. feed() takes chunks of raw values and returns the peaks
+    # confirmed by them: peaks of segments followed by a flat gap, see SegmentExecutor, detected with a rolling
+    # baseline and the threshold of a quantile sketch. finish() runs the batch pass on the whole trace, its results
+    # are those of HPLCProcessing.process() with the same arguments up to STREAM_TOLERANCE
+    def __init__(self, period: float, prior_baseline: BaselinePrior = None,
+                 fit_executor: FitExecutor = None, fit_engine: str = CURVE_FIT,
+                 segment_executor: SegmentExecutor = None, refit_seconds: float = STREAM_REFIT_SECONDS,
+                 warmup_seconds: float = STREAM_WARMUP_SECONDS, tolerance: float = STREAM_TOLERANCE):
+        self.period = period  # ms
+        self.prior_baseline = prior_baseline
+        self.fit_executor = fit_executor
+        self.fit_engine = fit_engine
+        self.segment_executor = segment_executor
+        self.segmenter = segment_executor or SegmentExecutor()
+        self.refit_seconds = refit_seconds
+        self.warmup_seconds = warmup_seconds
+        self.tolerance = tolerance
+
+        self._values = np.empty(STREAM_INITIAL_CAPACITY)
+        self._size = 0
+        self.baseline = None  # rolling estimate
+        self._baseline_size = 0  # samples covered by the last baseline fit
+        self._shift = 0.  # of preprocess(), from the median at the last baseline fit
+        self.sketch = QuantileSketch()  # of the corrected values, rebuilt with every baseline fit
+        self.confirmed = 0  # samples before this position belong to confirmed segments
+        self.peaks = PeakTable()  # confirmed so far
+        # (start, stop) -> (threshold, corrected values, peaks) of every confirmed segment, for finish()
+        self._segments = {}
+        self.reused_segments = None  # confirmed segments whose peaks the last finish() kept
+
+    @property
+    def data(self) -> Trace:
+        return Trace.from_period(self._values[:self._size], self.period)
+
+    def feed(self, chunk) -> PeakTable:
+        self._append(np.asarray(chunk, dtype=float))
+        data = self.data
+        if self.baseline is None or (self._size - self._baseline_size) * data.dt * 60 >= self.refit_seconds:
+            self._fit_baseline()
+            self.sketch = QuantileSketch.from_values(self._corrected(0).values)
+        else:
+            self.sketch.update(self._corrected(self._size - len(chunk)).values)
+        return self._confirm()
+
+    def finish(self) -> Tuple[PeakTable, Trace]:
+        # the baseline, the threshold and the segments of the whole trace. confirmed segments that come out the same
+        # keep their peaks, the others and the open tail are processed again
+        processing = HPLCProcessing(self.data, self.prior_baseline, self.fit_executor, self.fit_engine,
+                                    self.segment_executor)
+        data = processing.correct_data()
+        threshold = HPLCProcessing.find_threshold(data)
+        margin = int(np.ceil(data.mps * MIN_SECONDS_PER_PEAK))
+        kept, stale = [], []
+        for start, stop in self.segmenter.segments(data, threshold, margin):
+            segment = self._segments.get((start, stop))
+            if segment is not None and self._unchanged(data[start:stop], threshold, *segment[:2]):
+                kept.append((start, segment[2]))
+            else:
+                stale.append((start, stop))
+        fit_executor = self.fit_executor
+        if self.segmenter.mode != SERIAL:
+            fit_executor = (fit_executor or FitExecutor()).serial()
+        tables = self.segmenter.map(data, stale, partial(HPLCProcessing.process_segment, threshold=threshold,
+                                                         fit_executor=fit_executor, fit_engine=self.fit_engine))
+        self.reused_segments = len(kept)
+        # segments are in time order, so are the peaks of each of them
+        tables = sorted(kept + [(start, table) for (start, _), table in zip(stale, tables)], key=lambda o: o[0])
+        return PeakTable.concat([table for _, table in tables]), processing.baseline
+
+    def _unchanged(self, data: Trace, threshold: float, segment_threshold: float, values: np.ndarray) -> bool:
+        # the corrected values of a confirmed segment moved by at most tolerance and the other threshold
+        # detects the same apexes in it
+        return np.abs(data.values - values).max(initial=0) <= self.tolerance and \
+            np.array_equal(HPLCProcessing.find_peaks(data, threshold),
+                           HPLCProcessing.find_peaks(data, segment_threshold))
+
+    def _append(self, chunk: np.ndarray):
+        if self._size + len(chunk) > len(self._values):
+            values = np.empty(max(2 * len(self._values), self._size + len(chunk)))
+            values[:self._size] = self._values[:self._size]
+            self._values = values
+        self._values[self._size:self._size + len(chunk)] = chunk
+        self._size += len(chunk)
+
+    def _fit_baseline(self):
+        median = np.median(self.data.values)
+        self._shift = abs(median) if median < 0 else 0.
+        # warm starts from the previous rolling fit would compound, only the given prior is used
+        self.baseline, _ = HPLCProcessing.fit_baseline(self._preprocessed(0), self.prior_baseline)
+        self._baseline_size = self._size
+
+    def _preprocessed(self, start: int) -> Trace:
+        # preprocess() of the samples from start on, without the median of the whole trace
+        data = self.data[start:]
+        values = data.values + self._shift
+        return data.with_values(np.abs(values, out=values))
+
+    def _corrected(self, start: int) -> Trace:
+        # samples from start on, corrected by the rolling baseline held flat past its end
+        data = self._preprocessed(start)
+        baseline = interp_into(np.empty(len(data)), data.t0, data.dt, self.baseline.times, self.baseline.values)
+        return HPLCProcessing.correct_baseline(data, data.with_values(baseline), in_place=True)[0]
+
+    def _confirm(self) -> PeakTable:
+        # segments closed by a gap are final for the stream, the last one may still grow
+        data = self._corrected(self.confirmed)
+        threshold = HPLCProcessing.find_threshold_sketch(self.sketch)
+        segments = self.segmenter.segments(data, threshold, int(np.ceil(data.mps * MIN_SECONDS_PER_PEAK)), True)
+        if len(segments) < 2 or self._size * data.dt * 60 < self.warmup_seconds:
+            return PeakTable()
+        tables = [HPLCProcessing.process_segment(data[start:stop], threshold, self.fit_executor, self.fit_engine)
+                  for start, stop in segments[:-1]]
+        for (start, stop), table in zip(segments[:-1], tables):
+            self._segments[self.confirmed + start, self.confirmed + stop] = \
+                threshold, data.values[start:stop].copy(), table
+        peaks = PeakTable.concat(tables)
+        self.confirmed += segments[-1][0]
+        self.peaks = PeakTable.concat([self.peaks, peaks])
+        return peaks
@@ -0,0 +1,75 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+JOB_TOKEN_TIMEOUT = 24 * 60 * 60  # seconds
+JOB_LOCK_TIMEOUT = 10 * 60  # seconds, longer than any run, frees the lock of a killed worker
+JOB_LOCK_POLL = 0.1  # seconds
+
+# kinds of jobs, named after their tasks
+PROCESS_PEAKS = 'process_peaks'
+PREVIEW_PEAKS = 'preview_peaks'
+FIND_BASELINE = 'find_baseline'
+MANUAL_BASELINE = 'manual_baseline'
+# the queued and running jobs of the measurement a new one supersedes: those whose results it replaces.
+# nothing supersedes process_peaks but itself, the peaks of a measurement are never dropped for a baseline
+SUPERSEDES = {
+    PROCESS_PEAKS: (PROCESS_PEAKS, PREVIEW_PEAKS, FIND_BASELINE),
+    PREVIEW_PEAKS: (PREVIEW_PEAKS,),
+    FIND_BASELINE: (FIND_BASELINE,),
+    MANUAL_BASELINE: (MANUAL_BASELINE, FIND_BASELINE),
+}
+
+
+class Superseded(Exception):
+    # a newer job replacing the results of this one was submitted, it stops without writing
+    pass
+
+
+def _token_key(measurement_id, kind: str) -> str:
+    return f'hplc-job-{measurement_id}-{kind}'
+
+
+def submit_job(cache, measurement_id, kind: str) -> str:
+    # the token of a new job of kind, the jobs of the measurement it supersedes submitted before it stop
+    token = uuid.uuid4().hex
+    cache.set_many({_token_key(measurement_id, o): token for o in SUPERSEDES[kind]}, JOB_TOKEN_TIMEOUT)
+    return token
+
+
+class MeasurementJob:
+    # one processing request of a measurement. cache is shared by all workers, e.g. the django cache.
+    # the jobs of a measurement run one at a time under its lock and a superseded one does not go on:
+    # queued ones stop as soon as they start, a running one at its next check()
+    def __init__(self, cache, measurement_id, kind: str, token: str = None, lock_timeout: float = JOB_LOCK_TIMEOUT):
+        self.cache = cache
+        self.measurement_id = measurement_id
+        self.kind = kind  # see SUPERSEDES
+        # a job run without a token, e.g. called directly, supersedes the queued ones
+        self.token = submit_job(cache, measurement_id, kind) if token is None else token
+        self.lock_timeout = lock_timeout
+
+    @property
+    def latest(self) -> bool:
+        # a lost token, e.g. evicted, lets the job run
+        latest = self.cache.get(_token_key(self.measurement_id, self.kind))
+        return latest is None or latest == self.token
+
+    def check(self):
+        # at stage boundaries and before writing results
+        if not self.latest:
+            raise Superseded(f'{self.kind} of measurement {self.measurement_id}')
+
+    @contextmanager
+    def locked(self):
+        # waits for the running job of the measurement, gives up as soon as this one is superseded
+        key = f'hplc-job-lock-{self.measurement_id}'
+        while not self.cache.add(key, self.token, self.lock_timeout):
+            self.check()
+            time.sleep(JOB_LOCK_POLL)
+        try:
+            self.check()
+            yield self
+        finally:
+            if self.cache.get(key) == self.token:
+                self.cache.delete(key)
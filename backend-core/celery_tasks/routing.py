@@ -0,0 +1,18 @@
+from django.conf import settings
+
+# interactive edits of one measurement, served from the trace cache of the worker that saw it last
+MEASUREMENT_TASKS = {'celery_tasks.tasks.peak_processing.add_peak', 'celery_tasks.tasks.peak_processing.add_peaks',
+                     'celery_tasks.tasks.peak_processing.manual_baseline'}
+
+
+def measurement_queue(measurement_id) -> str:
+    return f'hplc-trace-{int(measurement_id) % settings.HPLC_TRACE_SHARDS}'
+
+
+def route_by_measurement(name, args, kwargs, options, task=None, **kw):
+    # HPLC_TRACE_SHARDS: number of hplc-trace-<n> queues, each consumed by one worker process,
+    # unset to leave the routing of these tasks as it is
+    if name not in MEASUREMENT_TASKS or not getattr(settings, 'HPLC_TRACE_SHARDS', None):
+        return None
+    measurement_id = args[0] if args else kwargs['measurement_id']
+    return {'queue': measurement_queue(measurement_id)}
@@ -1,4 +1,5 @@
 from .device import check_online, check_update_not_started
 from .mail import send_recovery_mail, send_welcome_mail, send_request_notification_mail, send_request_confirmation_mail
-from .peak_processing import send_measurement, add_peak, process_peaks, find_baseline, manual_baseline
+from .peak_processing import send_measurement, add_peak, add_peaks, process_peaks, preview_peaks, find_baseline, \
+    manual_baseline
 from .events import measurement_event
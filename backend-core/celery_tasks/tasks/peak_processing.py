@@ -1,12 +1,213 @@
-import pandas as pd
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 
 from celery_tasks.celery import app
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.baseline import ALS
+from celery_tasks.hplc.fitting import FitExecutor, CURVE_FIT
+from celery_tasks.hplc.knots import BaselineKnots, LINEAR
+from celery_tasks.hplc.peak_diff import PEAK_FIELDS, diff_peaks, peak_values
+from celery_tasks.hplc.peak_table import PeakTable, FIT_TIMEOUT
+from celery_tasks.hplc.pool import SERIAL
+from celery_tasks.hplc.priors import BaselinePrior, SequencePrior
+from celery_tasks.hplc.result_cache import ResultCache, DiskResultCache, RedisResultCache, result_key, \
+    RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES
+from celery_tasks.hplc.segments import SegmentExecutor
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc.trace_cache import TraceCache, TRACE_CACHE_MAX_BYTES, TRACE_TOKEN_TIMEOUT
 from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.jobs import MeasurementJob, Superseded, submit_job, JOB_LOCK_TIMEOUT, PROCESS_PEAKS, \
+    PREVIEW_PEAKS, FIND_BASELINE, MANUAL_BASELINE
 from siebox.consumer.channel_layer import ChannelUtils
 from siebox.model.measurement import Measurement
 from siebox.model.peak import Peak as PeakModel
 
 
+def get_fit_executor() -> FitExecutor:
+    # HPLC_FIT_MODE: serial, thread or process
+    return FitExecutor(getattr(settings, 'HPLC_FIT_MODE', SERIAL), getattr(settings, 'HPLC_FIT_WORKERS', None))
+
+
+def get_segment_executor() -> Optional[SegmentExecutor]:
+    # HPLC_SEGMENT_MODE: serial, thread or process, unset to process the whole trace at once
+    mode = getattr(settings, 'HPLC_SEGMENT_MODE', None)
+    if mode is None:
+        return None
+    return SegmentExecutor(mode, getattr(settings, 'HPLC_SEGMENT_WORKERS', None))
+
+
+def get_processing(y: np.ndarray, period, **kwargs) -> HPLCProcessing:
+    # HPLC_DTYPE: 'float32' halves the working buffers, HPLC_TRACE_MEMORY: report the peak memory of a run
+    dtype = getattr(settings, 'HPLC_DTYPE', None)
+    data = Trace.from_period(y, period, dtype)
+    # the pipeline works in the trace buffer only when it is a converted copy, never in the caller's y
+    return HPLCProcessing(data, dtype=dtype, overwrite_data=not np.shares_memory(data.values, y),
+                          trace_memory=getattr(settings, 'HPLC_TRACE_MEMORY', False), **kwargs)
+
+
+def get_sequence_prior(sequence) -> Optional[SequencePrior]:
+    # results of the last processed injection of the sequence, e.g. of the same method
+    if sequence is None:
+        return None
+    data = cache.get(f'hplc-sequence-prior-{sequence}')
+    return None if data is None else SequencePrior.from_dict(data)
+
+
+def set_sequence_prior(sequence, prior: SequencePrior):
+    # HPLC_SEQUENCE_PRIOR_TIMEOUT: seconds a prior is kept for the next injection
+    if sequence is not None:
+        cache.set(f'hplc-sequence-prior-{sequence}', prior.to_dict(),
+                  getattr(settings, 'HPLC_SEQUENCE_PRIOR_TIMEOUT', 24 * 60 * 60))
+
+
+def get_baseline_prior(measurement_id) -> Optional[BaselinePrior]:
+    # the last automatic baseline fit of the measurement, never the stored baseline: that may be drawn by hand
+    data = cache.get(f'hplc-baseline-prior-{measurement_id}')
+    return None if data is None else BaselinePrior.from_dict(data)
+
+
+def set_baseline_prior(measurement_id, prior: BaselinePrior):
+    # HPLC_BASELINE_PRIOR_TIMEOUT: seconds a fit is kept to warm start the next one of the measurement
+    cache.set(f'hplc-baseline-prior-{measurement_id}', prior.to_dict(),
+              getattr(settings, 'HPLC_BASELINE_PRIOR_TIMEOUT', 24 * 60 * 60))
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    # HPLC_RESULT_CACHE: 'redis' at HPLC_RESULT_CACHE_URL or 'disk' in HPLC_RESULT_CACHE_DIR, unset for none
+    backend = getattr(settings, 'HPLC_RESULT_CACHE', None)
+    if backend == 'redis':
+        return RedisResultCache(redis.Redis.from_url(settings.HPLC_RESULT_CACHE_URL),
+                                getattr(settings, 'HPLC_RESULT_CACHE_MAX_ENTRIES', RESULT_CACHE_MAX_ENTRIES))
+    if backend == 'disk':
+        return DiskResultCache(settings.HPLC_RESULT_CACHE_DIR,
+                               getattr(settings, 'HPLC_RESULT_CACHE_MAX_BYTES', RESULT_CACHE_MAX_BYTES))
+    return None
+
+
+def cached_result(kind: str, y, period, compute: Callable[[], dict], **params) -> dict:
+    # compute() served from the result cache when the raw data, the period and params are those of a stored
+    # result. warm starts, the stored baseline and the sequence prior, are not part of the key: they only move
+    # where the iterations start, and every run stores a new baseline, so retriggers would never hit
+    cache = get_result_cache()
+    if cache is None:
+        return compute()
+    key = result_key(kind, y, period, dtype=getattr(settings, 'HPLC_DTYPE', None), **params)
+    result = cache.get(key)
+    if result is not None:
+        print(f'Result cache hit: {kind}', flush=True)
+        return result
+    result = compute()
+    peaks = result.get('peaks')
+    # a rerun may have the time to finish the fits
+    if peaks is None or not (peaks.fit_status == FIT_TIMEOUT).any():
+        cache.set(key, result)
+    return result
+
+
+_trace_cache: Optional[TraceCache] = None
+
+
+def get_trace_cache() -> TraceCache:
+    # HPLC_TRACE_CACHE_BYTES: decoded traces kept by each worker process
+    global _trace_cache
+    if _trace_cache is None:
+        _trace_cache = TraceCache(getattr(settings, 'HPLC_TRACE_CACHE_BYTES', TRACE_CACHE_MAX_BYTES))
+    return _trace_cache
+
+
+def get_trace_token(measurement_id) -> str:
+    # version of the stored raw data shared by all workers, a new one is drawn when it is missing, e.g. expired
+    # or evicted, so a stale worker entry never matches.
+    # HPLC_TRACE_TOKEN_TIMEOUT: seconds, a token not read for this long expires, each read extends it
+    key = f'hplc-trace-token-{measurement_id}'
+    timeout = getattr(settings, 'HPLC_TRACE_TOKEN_TIMEOUT', TRACE_TOKEN_TIMEOUT)
+    token = uuid.uuid4().hex
+    if not cache.add(key, token, timeout):
+        # expired right after the add, this run goes on with its own
+        token = cache.get(key) or token
+        cache.touch(key, timeout)
+    return token
+
+
+def touch_trace(measurement_id):
+    # to be called by the save path of the raw data. the trace cache holds nothing derived from the baseline,
+    # saving one leaves it alone
+    cache.set(f'hplc-trace-token-{measurement_id}', uuid.uuid4().hex,
+              getattr(settings, 'HPLC_TRACE_TOKEN_TIMEOUT', TRACE_TOKEN_TIMEOUT))
+    get_trace_cache().invalidate(measurement_id)
+
+
+class MeasurementTask(app.Task):
+    # tasks processing a whole measurement, each one sent supersedes the jobs of the measurement sent before it
+    # as given by SUPERSEDES, a superseded one ends quietly
+    @property
+    def kind(self) -> str:
+        return self.name.rsplit('.', 1)[-1]
+
+    def apply_async(self, args=None, kwargs=None, **options):
+        kwargs = dict(kwargs or {})
+        if kwargs.get('job') is None:
+            kwargs['job'] = submit_job(cache, args[0] if args else kwargs['measurement_id'], self.kind)
+        return super().apply_async(args, kwargs, **options)
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return super().__call__(*args, **kwargs)
+        except Superseded as e:
+            print(f'Superseded: {e}', flush=True)
+
+
+@contextmanager
+def measurement_job(measurement_id, kind: str, token: str = None) -> Iterator[MeasurementJob]:
+    # the job of token under the lock of the measurement. HPLC_JOB_LOCK_TIMEOUT: seconds, longer than any run
+    job = MeasurementJob(cache, measurement_id, kind, token,
+                         getattr(settings, 'HPLC_JOB_LOCK_TIMEOUT', JOB_LOCK_TIMEOUT))
+    with job.locked():
+        yield job
+
+
+def print_peak_memory(processing: HPLCProcessing):
+    if processing.peak_memory is not None:
+        print(f'Peak memory: {processing.peak_memory / 2 ** 20:.1f} MiB', flush=True)
+
+
+def peak_model(m: Measurement, peaks: PeakTable, row: int) -> PeakModel:
+    return PeakModel.create(m, *peak_values(peaks, row))
+
+
+def save_peaks(m: Measurement, peaks: PeakTable):
+    # one transaction: deletes, top level peaks in one bulk insert, their children in another.
+    # HPLC_PEAK_DIFF: leave the stored peaks that did not change, or False to rewrite all of them
+    with transaction.atomic():
+        if getattr(settings, 'HPLC_PEAK_DIFF', True):
+            stored = PeakModel.objects.filter(measurement=m).values_list('id', 'parent_id', *PEAK_FIELDS)
+            diff = diff_peaks(peaks, stored)
+            if diff.delete:
+                PeakModel.objects.filter(pk__in=diff.delete).delete()
+        else:
+            PeakModel.clear_for_measurement(m)
+            diff = diff_peaks(peaks)
+
+        roots = [row for row in diff.insert if peaks.parent[row] < 0]
+        models = dict(zip(roots, PeakModel.objects.bulk_create([peak_model(m, peaks, row) for row in roots])))
+        children = []
+        for row in diff.insert[len(roots):]:
+            child = peak_model(m, peaks, row)
+            child.parent_id = diff.parent_ids[row] if row in diff.parent_ids else models[peaks.parent[row]].pk
+            children.append(child)
+        PeakModel.objects.bulk_create(children)
+
+    print(f'Peaks kept: {len(diff.keep)}, deleted: {len(diff.delete)}, inserted: {len(diff.insert)}', flush=True)
+
+
 @app.task()
 def send_measurement(_, channel, injection_id):
     if channel is not None and injection_id is not None:
@@ -15,104 +216,190 @@ def send_measurement(_, channel, injection_id):
             channel_utils_method(injection_id)
 
 
+def get_trace(m: Measurement) -> Tuple[Trace, AreaIndex]:
+    # the decoded trace and its area index stay with the worker for the next edits of the measurement
+    trace_cache = get_trace_cache()
+    token = get_trace_token(m.pk)
+
+    def load() -> Trace:
+        return Trace.from_period(m.get_data_intarray(), m.period)
+
+    return trace_cache.trace(m.pk, token, load), trace_cache.derived(m.pk, token, load, 'area_index', AreaIndex)
+
+
 @app.task()
 def add_peak(measurement_id: int, start: dict, end: dict):
     m = Measurement.objects.get(pk=measurement_id)
 
-    data = m.get_data_series().loc[start['time']:end['time']]
+    full, index = get_trace(m)
+    data = full.slice(start['time'], end['time'])
 
-    peak = HPLCProcessing.calc_raw_peak(data, start, end)
+    peak = HPLCProcessing.calc_raw_peak(data, start, end, index)
 
     peak_model = PeakModel.create(m, peak.start, peak.apex, peak.end, peak.area, peak.start_mau, peak.end_mau)
     peak_model.save()
 
 
 @app.task()
-def manual_baseline(measurement_id: int, points):
-    # print('Started')
-    # print(points)
+def add_peaks(measurement_id: int, regions: List[Tuple[dict, dict]]):
+    # add_peak of many (start, end) regions, e.g. an integration template applied to each injection of a
+    # sequence: one fetch, one decode and one insert for all of them
     m = Measurement.objects.get(pk=measurement_id)
 
-    baseline = {point['time']: point['mau'] for point in points}
-    baseline = pd.Series(baseline)
+    data, index = get_trace(m)
+    starts, ends = [start for start, _ in regions], [end for _, end in regions]
+    peaks = HPLCProcessing.calc_raw_peaks(data, [o['time'] for o in starts], [o['time'] for o in ends],
+                                          [o['mau'] for o in starts], [o['mau'] for o in ends], index)
 
-    # print(baseline)
+    rows = np.flatnonzero(~np.isnan(peaks.apex))
+    if len(rows) < len(peaks):
+        print(f'Regions without samples skipped: {len(peaks) - len(rows)}', flush=True)
+    PeakModel.objects.bulk_create([peak_model(m, peaks, row) for row in rows])
 
-    period = m.period
-    y = m.get_data_intarray()
-    x = [(i * period) / 1000 / 60 for i in range(len(y))]
 
-    baseline = baseline.reindex(x, tolerance=x[1] - x[0], method='nearest').interpolate(limit_direction='both')
+@app.task(base=MeasurementTask)
+def manual_baseline(measurement_id: int, points, mode=LINEAR, job=None):
+    # print('Started')
+    # print(points)
+    if not points:
+        print(f'No baseline points: measurement {measurement_id}', flush=True)
+        return
+    with measurement_job(measurement_id, MANUAL_BASELINE, job) as job:
+        m = Measurement.objects.get(pk=measurement_id)
 
-    # print(baseline)
-    m.set_baseline(baseline)
+        # linear or pchip between the points, or the 'mode' of a point for the segment that starts at it,
+        # flat past the outer ones
+        data, _ = get_trace(m)
+        baseline = BaselineKnots.from_points([point['time'] for point in points], [point['mau'] for point in points],
+                                             HPLCProcessing.knot_spacing(data), mode,
+                                             [point.get('mode') for point in points])
+        baseline = HPLCProcessing.stored_baseline(data, baseline).to_series()
 
+        # print(baseline)
+        job.check()
+        m.set_baseline(baseline)
 
-@app.task()
-def find_baseline(measurement_id):
+
+@app.task(base=MeasurementTask)
+def find_baseline(measurement_id, baseline_engine=ALS, job=None):
     print('Started')
-    m = Measurement.objects.get(pk=measurement_id)
-    m.start_processing()
-    try:
-        period = m.period
-        y = m.get_data_intarray()
-        x = [(i * period) / 1000 / 60 for i in range(len(y))]
-        data = pd.Series(y, index=x)
-        baseline = HPLCProcessing(data).process_baseline()
-        print(f'Baseline: {baseline}')
+    with measurement_job(measurement_id, FIND_BASELINE, job) as job:
+        m = Measurement.objects.get(pk=measurement_id)
+        m.start_processing()
+        try:
+            y = m.get_data_intarray()
 
-        m.set_baseline(baseline)
-    finally:
-        m.finish_processing()
+            def compute() -> dict:
+                processing = get_processing(y, m.period, prior_baseline=get_baseline_prior(measurement_id),
+                                            baseline_engine=baseline_engine)
+                processing.process_baseline()
+                print_peak_memory(processing)
+                return {'baseline': processing.baseline_prior, 'niter': processing.baseline_niter}
 
+            job.check()
+            result = cached_result('baseline', y, m.period, compute, baseline_engine=baseline_engine)
+            baseline = HPLCProcessing.stored_baseline(Trace.from_period(y, m.period),
+                                                      result['baseline'].knots).to_series()
+            print(f'Baseline: {baseline}')
+            print(f'Baseline iterations: {result["niter"]}')
 
-@app.task()
-def process_peaks(measurement_id):
+            job.check()
+            set_baseline_prior(measurement_id, result['baseline'])
+            m.set_baseline(baseline)
+        finally:
+            m.finish_processing()
+
+
+@app.task(base=MeasurementTask)
+def process_peaks(measurement_id, fit_engine=CURVE_FIT, sequence=None, baseline_engine=ALS, job=None):
+    # sequence: key shared by consecutive injections, their fits start from the results of the previous one
     print('Started', flush=True)
-    m = Measurement.objects.get(pk=measurement_id)
-    m.start_processing()
-    try:
-        period = m.period
-        print('period ' + str(period), flush=True)
-        y = m.get_data_intarray()
-        print(f'{y}', flush=True)
-        x = [(i * period) / 1000 / 60 for i in range(len(y))]
-        data = pd.Series(y, index=x)
-        processing = HPLCProcessing(data)
-        peaks, baseline = processing.process()
-        print(f'Peaks count: {len(peaks)}', flush=True)
-        print(f'Baseline: {baseline}', flush=True)
+    with measurement_job(measurement_id, PROCESS_PEAKS, job) as job:
+        m = Measurement.objects.get(pk=measurement_id)
+        m.start_processing()
+        try:
+            period = m.period
+            print('period ' + str(period), flush=True)
+            y = m.get_data_intarray()
+            print(f'{y}', flush=True)
 
-        m.set_baseline(baseline)
+            def compute() -> dict:
+                processing = get_processing(y, period, prior_baseline=get_baseline_prior(measurement_id),
+                                            fit_executor=get_fit_executor(), fit_engine=fit_engine,
+                                            segment_executor=get_segment_executor(),
+                                            sequence_prior=get_sequence_prior(sequence),
+                                            baseline_engine=baseline_engine, checkpoint=job.check)
+                peak_table, _ = processing.process()
+                print_peak_memory(processing)
+                return {'peaks': peak_table, 'baseline': processing.baseline_prior,
+                        'niter': processing.baseline_niter}
+
+            job.check()
+            result = cached_result('peaks', y, period, compute, fit_engine=fit_engine,
+                                   baseline_engine=baseline_engine,
+                                   segments=getattr(settings, 'HPLC_SEGMENT_MODE', None) is not None)
+            peak_table = result['peaks']
+            peaks = peak_table.peaks()
+            baseline = HPLCProcessing.stored_baseline(Trace.from_period(y, period), result['baseline'].knots,
+                                                      clip=True).to_series()
+            print(f'Peaks count: {len(peaks)}', flush=True)
+            print(f'Baseline: {baseline}', flush=True)
+            print(f'Baseline iterations: {result["niter"]}', flush=True)
+
+            job.check()
+            set_sequence_prior(sequence, HPLCProcessing.sequence_prior(peak_table, result['baseline']))
+            set_baseline_prior(measurement_id, result['baseline'])
+            m.set_baseline(baseline)
+
+            save_peaks(m, peak_table)
+
+            for i, peak in enumerate(peaks):
+                print(f'- Peak N {i}')
+                print(f'  Bounds: [{peak.start}, {peak.end}]')
+                print(f'  Center index: {peak.apex}')
+                print(f'  Area: {peak.area}')
+                if peak.is_mixed_peak:
+                    print(f'  Baseline: {peak.baseline}')
+                    print(f'  Params: {peak.gaussian_params}')
+                    for j, subpeak in enumerate(peak.peaks):
+                        print(f'  - Subpeak N {j}')
+                        print(f'    Bounds: [{subpeak.start}, {subpeak.end}]')
+                        print(f'    Center index: {subpeak.apex}')
+                        print(f'    Baseline: {subpeak.baseline}')
+                        print(f'    Area: {subpeak.area}')
+                        print(f'    Params: {subpeak.gaussian_params}')
+        finally:
+            m.finish_processing()
+
+
+@app.task(base=MeasurementTask)
+def preview_peaks(measurement_id, refine=True, fit_engine=CURVE_FIT, sequence=None, baseline_engine=ALS, job=None):
+    # quick peaks without fitting, mixed peaks are reported as unresolved until process_peaks refines them
+    with measurement_job(measurement_id, PREVIEW_PEAKS, job) as job:
+        m = Measurement.objects.get(pk=measurement_id)
+        m.start_processing()
+        try:
+            started = time.perf_counter()
+            y = m.get_data_intarray()
+            processing = get_processing(y, m.period, prior_baseline=get_baseline_prior(measurement_id),
+                                        sequence_prior=get_sequence_prior(sequence), baseline_engine=baseline_engine,
+                                        checkpoint=job.check)
+            peak_table, _ = processing.preview()
+            peaks = peak_table.peaks()
+            baseline = HPLCProcessing.stored_baseline(Trace.from_period(y, m.period), processing.baseline_knots,
+                                                      clip=True).to_series()
+            print(f'Preview peaks count: {len(peaks)}, unresolved groups: {len(peak_table.mixed)}, '
+                  f'{1000 * (time.perf_counter() - started):.1f} ms', flush=True)
+            print_peak_memory(processing)
+
+            job.check()
+            # process_peaks of the same data takes this fit as it is
+            set_baseline_prior(measurement_id, processing.baseline_prior)
+            # the peaks saved are measured against this baseline, refined or not
+            m.set_baseline(baseline)
+            save_peaks(m, peak_table)
+        finally:
+            m.finish_processing()
 
-        PeakModel.clear_for_measurement(m)
-
-        print('cleared', flush=True)
-
-        for peak in peaks:
-            peak_model = PeakModel.create(m, peak.start, peak.apex, peak.end, peak.area)
-            peak_model.save()
-            if peak.is_mixed_peak:
-                pass
-                # for subpeak in peak.peaks:
-                #     subpeak_model = PeakModel.create(m, subpeak.start, subpeak.apex, subpeak.end, subpeak.area,
-                #                                      peak_model.id)
-                #     subpeak_model.save()
-
-        for i, peak in enumerate(peaks):
-            print(f'- Peak N {i}')
-            print(f'  Bounds: [{peak.start}, {peak.end}]')
-            print(f'  Center index: {peak.apex}')
-            print(f'  Area: {peak.area}')
-            if peak.is_mixed_peak:
-                print(f'  Baseline: {peak.baseline}')
-                print(f'  Params: {peak.gaussian_params}')
-                for j, subpeak in enumerate(peak.peaks):
-                    print(f'  - Subpeak N {j}')
-                    print(f'    Bounds: [{subpeak.start}, {subpeak.end}]')
-                    print(f'    Center index: {subpeak.apex}')
-                    print(f'    Baseline: {subpeak.baseline}')
-                    print(f'    Area: {subpeak.area}')
-                    print(f'    Params: {subpeak.gaussian_params}')
-    finally:
-        m.finish_processing()
+    if refine:
+        process_peaks.delay(measurement_id, fit_engine, sequence, baseline_engine)
@@ -0,0 +1,30 @@
+# synthetic traces shared by the tests
+import numpy as np
+
+from celery_tasks.hplc.trace import Trace
+
+PERIOD = 100  # ms
+# (center, height, sigma), minutes and mAU
+PEAKS = [(6.67, 100, 0.05), (13.33, 80, 0.08), (23.33, 120, 0.1)]  # well separated
+MIXED_PEAKS = [(13.333, 80, 0.08), (13.583, 50, 0.06)]  # one mixed peak
+CLUSTERED_PEAKS = [(6.667, 100, 0.05), (13.333, 80, 0.08), (13.583, 50, 0.06), (23.333, 120, 0.1),
+                   (23.683, 60, 0.1)]  # two mixed clusters
+
+
+def chromatogram(peaks, length=20000, seed=0) -> Trace:
+    rng = np.random.default_rng(seed)
+    x = np.arange(length) * PERIOD / 1000 / 60
+    y = 5 + 0.2 * x + rng.normal(0, 0.05, length)
+    for center, height, sigma in peaks:
+        y += height * np.exp(-(x - center)**2 / (2 * sigma**2))
+    return Trace.from_period(y, PERIOD)
+
+
+def gaussian_area(height, sigma):
+    return height * sigma * np.sqrt(2 * np.pi)
+
+
+def synthetic_trace(length, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.arange(length)
+    return 5 + x / length + rng.normal(0, 0.05, length) + 20 * np.exp(-((x - length / 2) / (length / 40))**2)
@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+
+
+class AreaIndexTestCase(TestCase):
+    def setUp(self):
+        self.data = Trace(np.random.default_rng(0).normal(10, 2, 200), 1., 0.1)
+        self.index = AreaIndex(self.data)
+        self.ranges = [(0, 199), (3, 17), (50, 51), (20, 20), (30, 10)]
+
+    def test_trapezoid(self):
+        for i, j in self.ranges:
+            expected = HPLCProcessing.area_peak(self.data[i:j + 1]) if j > i else 0.
+            self.assertAlmostEqual(float(self.index.trapezoid(i, j)), expected)
+        i, j = np.array(self.ranges).T
+        np.testing.assert_allclose(self.index.trapezoid(i, j), [self.index.trapezoid(*o) for o in self.ranges])
+
+    def test_area_lin(self):
+        for i, j in self.ranges:
+            data_slice = self.data[i:j + 1]
+            expected = HPLCProcessing.area_peak(data_slice.with_values(
+                data_slice.values - HPLCProcessing.baseline_lin(data_slice))) if j > i else 0.
+            self.assertAlmostEqual(float(self.index.area_lin(i, j)), expected)
+
+    def test_area_above_line(self):
+        line = np.interp(np.arange(200), [5, 150], [8, 12])
+        expected = HPLCProcessing.area_peak(self.data[40:91].with_values(self.data.values[40:91] - line[40:91]))
+        self.assertAlmostEqual(float(self.index.area_above_line(40, 90, 5, 150, 8, 12)), expected)
+
+    def test_times(self):
+        start, end = self.data.time(3.4), self.data.time(17)
+        self.assertAlmostEqual(float(self.index.area(start, end)),
+                               HPLCProcessing.area_peak(self.data.slice(start, end)))
+        self.assertAlmostEqual(float(self.index.area_manual(start, end, 1, 2)),
+                               HPLCProcessing.area_peak(self.data.slice(start, end)) - (end - start) * 1.5)
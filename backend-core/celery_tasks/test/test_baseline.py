@@ -0,0 +1,84 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import linalg
+
+from celery_tasks.hplc.baseline import als, als_baseline, arpls, airpls, morphological, penalty_bands, ALS, ARPLS, \
+    AIRPLS, MORPHOLOGICAL
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram, synthetic_trace
+
+
+def sparse_als_baseline(y, lam, p, niter):
+    length = len(y)
+    D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(length, length - 2))
+    D = lam * D.dot(D.transpose())
+    w = np.ones(length)
+    z = None
+    for i in range(niter):
+        z = linalg.spsolve(sparse.csc_matrix(sparse.diags(w) + D), w * y)
+        w = p * (y > z) + (1 - p) * (y < z)
+    return z
+
+
+class ALSBaselineTestCase(TestCase):
+    def test_penalty_bands(self):
+        length = 7
+        D = sparse.diags([1, -2, 1], [0, -1, -2], shape=(length, length - 2))
+        dense = 3 * D.dot(D.transpose()).toarray()
+        bands = penalty_bands(length, 3.)
+        np.testing.assert_allclose(bands[2], np.diag(dense))
+        np.testing.assert_allclose(bands[1, 1:], np.diag(dense, 1))
+        np.testing.assert_allclose(bands[0, 2:], np.diag(dense, 2))
+
+    def test_penalty_bands_cached(self):
+        self.assertIs(penalty_bands(100, 167.), penalty_bands(100, 167.))
+
+    def test_matches_sparse_solver(self):
+        y = synthetic_trace(2000)
+        for p in (0, 0.01):
+            np.testing.assert_allclose(als_baseline(y, 167, p, 10), sparse_als_baseline(y, 167, p, 10), atol=1e-6)
+
+    def test_stops_on_convergence(self):
+        y = synthetic_trace(500)
+        result = als(y, 167, 0.5, 50, tol=1e-6)
+        self.assertLess(result.niter, 50)
+        np.testing.assert_allclose(result.baseline, als(y, 167, 0.5, result.niter).baseline)
+
+    def test_runs_niter_without_tol(self):
+        self.assertEqual(als(synthetic_trace(500), 167, 0, 10).niter, 10)
+
+    def test_warm_start(self):
+        y = synthetic_trace(500)
+        cold = als(y, 167, 0.01, 50, tol=1e-8)
+        warm = als(y * 1.01, 167, 0.01, 50, tol=1e-8, weights=cold.weights)
+        self.assertLess(warm.niter, cold.niter)
+        np.testing.assert_allclose(warm.baseline, als(y * 1.01, 167, 0.01, 50, tol=1e-8).baseline, atol=1e-6)
+
+
+class BaselineEnginesTestCase(TestCase):
+    def setUp(self):
+        # peaks a few samples wide, as on the downscaled traces the engines are tuned for
+        x = np.arange(2000)
+        self.truth = 5 + x / len(x)
+        self.y = self.truth + np.random.default_rng(0).normal(0, 0.05, len(x))
+        for center in (500, 520, 1200):
+            self.y += 20 * np.exp(-((x - center) / 4) ** 2)
+
+    def test_engines(self):
+        # within a few noise sigmas of the drift under the peak
+        for result in (arpls(self.y, 1e4, 10, 1e-3), airpls(self.y, 1e5, 10, 1e-3), morphological(self.y, 120)):
+            self.assertLess(np.abs(result.baseline - self.truth).max(), 0.2)
+
+    def test_airpls_stops(self):
+        self.assertLess(airpls(self.y, 1e5, 50).niter, 50)
+
+    def test_processing(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        expected, _ = HPLCProcessing(data).process()
+        for engine in (ALS, ARPLS, AIRPLS, MORPHOLOGICAL):
+            table, baseline = HPLCProcessing(data, baseline_engine=engine).process()
+            self.assertEqual(len(baseline), len(data))
+            np.testing.assert_array_equal(table.apex, expected.apex)
+            np.testing.assert_allclose(table.area, expected.area, rtol=0.05)
@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.fitting import FitExecutor, NNLS
+from celery_tasks.hplc.pool import SERIAL, THREAD, PROCESS
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+
+class FitExecutorTestCase(TestCase):
+    def test_modes_match_serial(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        serial, _ = HPLCProcessing(data, fit_executor=FitExecutor(SERIAL)).process()
+        self.assertEqual(len(serial.mixed), 2)
+        for mode in (THREAD, PROCESS):
+            table, _ = HPLCProcessing(data, fit_executor=FitExecutor(mode, 2)).process()
+            np.testing.assert_array_equal(table.params, serial.params)
+            np.testing.assert_array_equal(table.area, serial.area)
+
+
+class FitBudgetTestCase(TestCase):
+    def setUp(self):
+        self.data = chromatogram(CLUSTERED_PEAKS)
+
+    def assert_fallback(self, table, status):
+        for row in table.mixed:
+            peak = table.peak(row)
+            self.assertEqual([peak.fit_status] + [o.fit_status for o in peak.peaks], [status, status])
+            self.assertIsNone(peak.gaussian_params)
+            # drop-line areas are close to the true ones for these well separated apexes
+            areas = [peak.area] + [o.area for o in peak.peaks]
+            self.assertTrue(all(area > 0 for area in areas))
+        self.assertAlmostEqual(table.area[table.mixed[0]], 80 * 0.08 * np.sqrt(2 * np.pi), delta=1.5)
+
+    def test_converged(self):
+        table, _ = HPLCProcessing(self.data).process()
+        self.assertEqual([table.peak(row).fit_status for row in table.mixed], ['converged', 'converged'])
+
+    def test_evaluation_cap(self):
+        table, _ = HPLCProcessing(self.data, fit_executor=FitExecutor(max_nfev=1)).process()
+        self.assert_fallback(table, 'fallback')
+
+    def test_group_budget(self):
+        table, _ = HPLCProcessing(self.data, fit_executor=FitExecutor(group_budget=0)).process()
+        self.assert_fallback(table, 'timeout')
+
+    def test_run_budget(self):
+        table, _ = HPLCProcessing(self.data, fit_executor=FitExecutor(THREAD, 2, run_budget=0)).process()
+        self.assert_fallback(table, 'timeout')
+
+
+class NNLSEngineTestCase(TestCase):
+    def test_areas(self):
+        table, _ = HPLCProcessing(chromatogram(CLUSTERED_PEAKS), fit_engine=NNLS).process()
+        self.assertEqual(len(table), len(CLUSTERED_PEAKS))
+        for area, (_, height, sigma) in zip(table.area, CLUSTERED_PEAKS):
+            expected = height * sigma * np.sqrt(2 * np.pi)
+            self.assertAlmostEqual(area, expected, delta=0.03 * expected)
+        self.assertTrue((table.params[table.mixed, 1] == 0).all())
@@ -0,0 +1,68 @@
+from typing import List
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.peak_table import PeakTable
+from celery_tasks.hplc_processing import HPLCProcessing
+
+
+def overlap_groups(starts, ends) -> List[np.ndarray]:
+    # reference grouping fold_groups() is checked against, as a list of row arrays
+    # sort-and-sweep: a new group begins where the interval starts at or after
+    # the furthest end seen so far, so nested ([1, 4] [2, 3]) and chained
+    # partial overlaps ([1, 3] [2, 4]) end up in one group
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    if len(starts) == 0:
+        return []
+
+    order = np.argsort(starts, kind='stable')
+    reach = np.maximum.accumulate(ends[order])
+    breaks = np.flatnonzero(starts[order][1:] >= reach[:-1]) + 1
+
+    return np.split(order, breaks)
+
+
+class OverlapGroupsTestCase(TestCase):
+    def test_groups(self):
+        groups = overlap_groups([5, 1, 2, 8, 9], [6, 4, 3, 10, 12])
+        self.assertEqual([sorted(g.tolist()) for g in groups], [[1, 2], [0], [3, 4]])
+
+    def test_touching_intervals_are_separate(self):
+        groups = overlap_groups([1, 2], [2, 3])
+        self.assertEqual(len(groups), 2)
+
+    def test_empty(self):
+        self.assertEqual(overlap_groups([], []), [])
+
+
+class FoldPeaksTestCase(TestCase):
+    def test_nested_peaks(self):
+        peaks = HPLCProcessing.fold_peaks(PeakTable.from_arrays([3, 2, 6], [2, 1, 5], [3, 4, 7]))
+        self.assertEqual(peaks.apex.tolist(), [2, 3, 6])
+        self.assertEqual(peaks.parent.tolist(), [-1, 0, -1])
+
+        outer = peaks.peaks()[0]
+        self.assertEqual([o.apex for o in outer.peaks], [3])
+        self.assertFalse(peaks.peaks()[1].is_mixed_peak)
+
+    def test_partially_overlapping_peaks(self):
+        peaks = HPLCProcessing.fold_peaks(PeakTable.from_arrays([2, 3], [1, 2], [3, 4.5]))
+        self.assertEqual(peaks.apex.tolist(), [3, 2])
+        self.assertEqual(peaks.parent.tolist(), [-1, 0])
+        self.assertEqual((peaks.start[0], peaks.end[0]), (1, 4.5))
+
+    def test_matches_overlap_groups(self):
+        rng = np.random.default_rng(0)
+        apexes = np.sort(rng.uniform(0, 100, 300))
+        table = PeakTable.from_arrays(apexes, apexes - rng.uniform(0.1, 1, 300), apexes + rng.uniform(0.1, 1, 300))
+        groups = overlap_groups(table.start, table.end)
+
+        peaks = HPLCProcessing.fold_peaks(table)
+        self.assertEqual(len(peaks.roots), len(groups))
+        for peak, group in zip(peaks.peaks(), groups):
+            widest = group[np.argmax(table.end[group] - table.start[group])]
+            self.assertEqual(peak.apex, table.apex[widest])
+            self.assertEqual((peak.start, peak.end), (table.start[group].min(), table.end[group].max()))
+            self.assertEqual([o.apex for o in peak.peaks], sorted(table.apex[group[group != widest]]))
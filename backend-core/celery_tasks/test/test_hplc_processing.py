@@ -0,0 +1,139 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.baseline import ARPLS
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import PEAKS, MIXED_PEAKS, chromatogram, gaussian_area
+
+
+class HPLCProcessingTestCase(TestCase):
+    def test_process(self):
+        data = chromatogram(PEAKS)
+        table, baseline = HPLCProcessing(data).process()
+        peaks = table.peaks()
+
+        self.assertEqual(len(baseline), len(data))
+        self.assertEqual(len(peaks), len(PEAKS))
+        for peak, (center, height, sigma) in zip(peaks, PEAKS):
+            self.assertFalse(peak.is_mixed_peak)
+            self.assertAlmostEqual(peak.apex, center, delta=0.01)
+            self.assertAlmostEqual(peak.area, gaussian_area(height, sigma), delta=0.05 * gaussian_area(height, sigma))
+
+    def test_process_mixed_peak(self):
+        table, _ = HPLCProcessing(chromatogram(MIXED_PEAKS)).process()
+
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.parent.tolist(), [-1, 0])
+        peak = table.peaks()[0]
+        self.assertTrue(peak.is_mixed_peak)
+        areas = [peak.area] + [o.area for o in peak.peaks]
+        for area, (_, height, sigma) in zip(areas, MIXED_PEAKS):
+            self.assertAlmostEqual(area, gaussian_area(height, sigma), delta=0.02 * gaussian_area(height, sigma))
+
+    def test_reprocess(self):
+        # processing its own output again and again reuses the fit and finds the same peaks
+        for peaks in (PEAKS, MIXED_PEAKS, MIXED_PEAKS + PEAKS[:1]):
+            data = chromatogram(peaks)
+            processing = HPLCProcessing(data)
+            expected, baseline = processing.process()
+            for _ in range(3):
+                processing = HPLCProcessing(data, prior_baseline=processing.baseline_prior)
+                table, rerun = processing.process()
+                self.assertEqual(processing.baseline_niter, 0)
+                np.testing.assert_array_equal(rerun.values, baseline.values)
+                np.testing.assert_array_equal(table.apex, expected.apex)
+                np.testing.assert_array_equal(table.area, expected.area)
+
+    def test_prior_ignored(self):
+        data = chromatogram(MIXED_PEAKS + PEAKS[:1])
+        cold = HPLCProcessing(data)
+        expected, baseline = cold.process()
+        arpls = HPLCProcessing(data, baseline_engine=ARPLS)
+        arpls.process()
+        other = HPLCProcessing(chromatogram(MIXED_PEAKS + PEAKS[:1], seed=1))
+        other.process()
+        # another engine's fit of the data, and an ALS fit of other data, start cold
+        for prior in (arpls.baseline_prior, other.baseline_prior):
+            processing = HPLCProcessing(data, prior_baseline=prior)
+            table, warm = processing.process()
+            self.assertEqual(processing.baseline_niter, cold.baseline_niter)
+            np.testing.assert_array_equal(warm.values, baseline.values)
+            np.testing.assert_array_equal(table.apex, expected.apex)
+
+    def test_warm_start(self):
+        # engines converging to the tolerance warm start from the fit of the previous injection
+        processing = HPLCProcessing(chromatogram(PEAKS, seed=1), baseline_engine=ARPLS)
+        processing.process()
+        data = chromatogram(PEAKS)
+        cold = HPLCProcessing(data, baseline_engine=ARPLS)
+        expected, baseline = cold.process()
+        warm = HPLCProcessing(data, prior_baseline=processing.baseline_prior, baseline_engine=ARPLS)
+        table, warm_baseline = warm.process()
+        self.assertLess(warm.baseline_niter, cold.baseline_niter)
+        np.testing.assert_allclose(warm_baseline.values, baseline.values, atol=0.01)
+        np.testing.assert_array_equal(table.apex, expected.apex)
+
+    def test_calc_raw_peak(self):
+        data = chromatogram(PEAKS)
+        start, end = data.times[2000], data.times[6000]
+        peak = HPLCProcessing.calc_raw_peak(data.slice(start, end), {'time': start, 'mau': 5}, {'time': end, 'mau': 5})
+        self.assertAlmostEqual(peak.apex, PEAKS[0][0], delta=0.01)
+        self.assertGreater(peak.area, gaussian_area(100, 0.05))
+
+
+class MemoryModeTestCase(TestCase):
+    def test_float32_in_place(self):
+        data = chromatogram(MIXED_PEAKS + PEAKS[:1])
+        reference = HPLCProcessing(data, trace_memory=True)
+        expected, _ = reference.process()
+
+        data32 = Trace(data.values, data.t0, data.dt, dtype=np.float32)
+        processing = HPLCProcessing(data32, overwrite_data=True, trace_memory=True)
+        table, baseline = processing.process()
+
+        self.assertEqual(baseline.values.dtype, np.float32)
+        self.assertIs(processing.corrected_data.values, data32.values)
+        np.testing.assert_array_equal(table.apex, expected.apex)
+        np.testing.assert_allclose(table.area, expected.area, rtol=1e-3)
+        self.assertLess(processing.peak_memory, reference.peak_memory)
+
+
+class PreviewTestCase(TestCase):
+    def test_preview(self):
+        data = chromatogram(MIXED_PEAKS + PEAKS[:1])
+        expected, _ = HPLCProcessing(data).process()
+        table, baseline = HPLCProcessing(data).preview()
+
+        self.assertEqual(len(baseline), len(data))
+        np.testing.assert_array_equal(table.apex, expected.apex)
+        np.testing.assert_array_equal(table.parent, expected.parent)
+        self.assertTrue(np.isnan(table.params).all())
+        peak = table.peak(table.mixed[0])
+        self.assertEqual([peak.fit_status] + [o.fit_status for o in peak.peaks], ['unresolved', 'unresolved'])
+        np.testing.assert_allclose(table.area, expected.area, rtol=0.1)
+
+
+class RawPeaksTestCase(TestCase):
+    def test_calc_raw_peaks(self):
+        data = chromatogram(MIXED_PEAKS + PEAKS)
+        regions = [(6.4, 6.9, 6.4, 6.6), (13.0, 13.8, 7.5, 7.8), (13.45, 13.7, 8.0, 7.9), (23.0, 23.6, 9.6, 9.8),
+                   (13.0, 13.8, 7.5, 7.8)]
+        starts, ends, start_maus, end_maus = map(np.array, zip(*regions))
+        peaks = HPLCProcessing.calc_raw_peaks(data, starts, ends, start_maus, end_maus)
+
+        self.assertEqual(len(peaks), len(regions))
+        self.assertTrue((peaks.parent == -1).all())
+        for row, (start, end, start_mau, end_mau) in enumerate(regions):
+            expected = HPLCProcessing.calc_raw_peak(data.slice(start, end), {'time': start, 'mau': start_mau},
+                                                    {'time': end, 'mau': end_mau})
+            self.assertAlmostEqual(peaks.apex[row], expected.apex, places=9)
+            self.assertAlmostEqual(peaks.area[row], expected.area, places=9)
+
+    def test_empty_regions(self):
+        data = chromatogram(PEAKS)
+        peaks = HPLCProcessing.calc_raw_peaks(data, [6.4, 6.5012, 40], [6.9, 6.5015, 41], [6.4, 6.5, 5], [6.6, 6.5, 5])
+        self.assertFalse(np.isnan(peaks.apex[0]))
+        self.assertTrue(np.isnan(peaks.apex[1:]).all())
+        self.assertEqual(len(HPLCProcessing.calc_raw_peaks(data, [], [], [], [])), 0)
@@ -0,0 +1,123 @@
+import threading
+import time
+from unittest import TestCase
+
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.jobs import MeasurementJob, Superseded, submit_job, FIND_BASELINE, MANUAL_BASELINE, PREVIEW_PEAKS, \
+    PROCESS_PEAKS
+from celery_tasks.test.chromatograms import PEAKS, chromatogram
+
+
+class LocalCache:
+    # the add, get, set and delete of a django cache shared by the workers, timeouts are ignored
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, value, timeout=None):
+        with self.lock:
+            if key in self.values:
+                return False
+            self.values[key] = value
+            return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+    def set_many(self, values, timeout=None):
+        self.values.update(values)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class MeasurementJobTestCase(TestCase):
+    def setUp(self):
+        self.cache = LocalCache()
+
+    def test_latest_wins(self):
+        tokens = [submit_job(self.cache, 1, PROCESS_PEAKS) for _ in range(3)]
+        submit_job(self.cache, 2, PROCESS_PEAKS)
+        for token in tokens[:-1]:
+            with self.assertRaises(Superseded):
+                with MeasurementJob(self.cache, 1, PROCESS_PEAKS, token).locked():
+                    self.fail('a queued duplicate ran')
+        with MeasurementJob(self.cache, 1, PROCESS_PEAKS, tokens[-1]).locked() as job:
+            job.check()
+        # a lost token lets the job run
+        self.cache.delete('hplc-job-1-process_peaks')
+        self.assertTrue(MeasurementJob(self.cache, 1, PROCESS_PEAKS, tokens[0]).latest)
+
+    def test_kinds(self):
+        baseline, preview = submit_job(self.cache, 1, FIND_BASELINE), submit_job(self.cache, 1, PREVIEW_PEAKS)
+        peaks = submit_job(self.cache, 1, PROCESS_PEAKS)
+        manual = submit_job(self.cache, 1, MANUAL_BASELINE)
+        # process_peaks replaces the automatic baseline and the preview, a baseline never drops peaks
+        self.assertEqual([MeasurementJob(self.cache, 1, kind, token).latest for kind, token in
+                          ((FIND_BASELINE, baseline), (PREVIEW_PEAKS, preview), (PROCESS_PEAKS, peaks),
+                           (MANUAL_BASELINE, manual))], [False, False, True, True])
+        submit_job(self.cache, 1, FIND_BASELINE)
+        self.assertTrue(MeasurementJob(self.cache, 1, PROCESS_PEAKS, peaks).latest)
+        self.assertTrue(MeasurementJob(self.cache, 1, MANUAL_BASELINE, manual).latest)
+
+    def test_other_kind_waits(self):
+        running = MeasurementJob(self.cache, 1, PROCESS_PEAKS)
+        started, order = threading.Event(), []
+
+        def baseline():
+            started.wait()
+            with MeasurementJob(self.cache, 1, MANUAL_BASELINE).locked():
+                order.append(MANUAL_BASELINE)
+
+        thread = threading.Thread(target=baseline)
+        thread.start()
+        with running.locked():
+            started.set()
+            time.sleep(0.3)
+            running.check()
+            order.append(PROCESS_PEAKS)
+        thread.join()
+        self.assertEqual(order, [PROCESS_PEAKS, MANUAL_BASELINE])
+
+    def test_supersede_running(self):
+        running = MeasurementJob(self.cache, 1, PROCESS_PEAKS)
+        started, stopped = threading.Event(), []
+
+        def newer():
+            started.wait()
+            with MeasurementJob(self.cache, 1, PROCESS_PEAKS).locked() as job:
+                stopped.append(running.latest)
+                job.check()
+
+        thread = threading.Thread(target=newer)
+        thread.start()
+        with self.assertRaises(Superseded):
+            with running.locked():
+                started.set()
+                while running.latest:
+                    pass
+                running.check()
+        thread.join()
+        # the newer job ran only once the older one had stopped and released the lock
+        self.assertEqual(stopped, [False])
+        self.assertIsNone(self.cache.get('hplc-job-lock-1'))
+
+    def test_checkpoint(self):
+        job = MeasurementJob(self.cache, 1, PROCESS_PEAKS)
+        stages = []
+
+        def checkpoint():
+            stages.append(len(stages))
+            if len(stages) == 2:
+                submit_job(self.cache, 1, PROCESS_PEAKS)
+            job.check()
+
+        processing = HPLCProcessing(chromatogram(PEAKS), checkpoint=checkpoint)
+        with self.assertRaises(Superseded):
+            processing.process()
+        # stopped after the baseline, before the peaks
+        self.assertEqual(stages, [0, 1])
+        self.assertIsNotNone(processing.baseline)
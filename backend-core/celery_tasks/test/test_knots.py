@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from celery_tasks.hplc.knots import BaselineKnots, LINEAR, PCHIP
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+
+class BaselineKnotsTestCase(TestCase):
+    def test_on_grid(self):
+        knots = BaselineKnots.from_series(pd.Series([3., 1., np.nan, 2.], index=[4., 0., 1., 2.]))
+        np.testing.assert_array_equal(knots.times, [0, 2, 4])
+        grid = Trace(np.zeros(7), -1, 1)
+        np.testing.assert_allclose(knots.on_grid(grid).values, [1, 1, 1.5, 2, 2.5, 3, 3])
+        np.testing.assert_allclose(knots.interp([0.5, 3]), [1.25, 2.5])
+        pd.testing.assert_series_equal(BaselineKnots.from_series(knots.to_series()).to_series(), knots.to_series())
+
+    def test_from_points(self):
+        # unsorted, the later of two points at the same time wins
+        knots = BaselineKnots.from_points([2, 0, 1, 1], [0, 0, 5, 1], 0.25)
+        np.testing.assert_array_equal(knots.times, [0, 1, 2])
+        np.testing.assert_array_equal(knots.values, [0, 1, 0])
+
+    def test_few_points(self):
+        with self.assertRaises(ValueError):
+            BaselineKnots.from_points([], [], 0.25, PCHIP, [])
+        knots = BaselineKnots.from_points([1], [3], 0.25, PCHIP)
+        np.testing.assert_array_equal(knots.interp([0, 2]), [3, 3])
+
+    def test_pchip(self):
+        times, values = [0, 1, 2, 4], [0, 1, 1, 3]
+        knots = BaselineKnots.from_points(times, values, 0.1, PCHIP)
+        np.testing.assert_allclose(knots.interp(times), values)
+        # monotone between monotone points, flat where they are
+        inner = knots.values[(knots.times > 1) & (knots.times < 2)]
+        np.testing.assert_allclose(inner, 1)
+        self.assertTrue((np.diff(knots.values) >= 0).all())
+        self.assertEqual(len(knots), 40 + 1)
+
+    def test_segment_modes(self):
+        times, values = [0, 1, 2, 3], [0, 2, 1, 3]
+        knots = BaselineKnots.from_points(times, values, 0.1, LINEAR, [None, PCHIP, None, None])
+        # only the segment [1, 2] is sampled
+        self.assertEqual(len(knots), 4 + 9)
+        self.assertTrue(((knots.times > 1) & (knots.times < 2)).sum() == 9)
+        np.testing.assert_allclose(knots.interp([0.5, 2.5]), [1, 2])
+
+    def test_processing(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        processing = HPLCProcessing(data)
+        _, baseline = processing.process()
+        knots = processing.baseline_knots
+        self.assertEqual(len(knots), len(HPLCProcessing.downscale_data(data)))
+        np.testing.assert_array_equal(np.minimum(data.values, knots.on_grid(data).values), baseline.values)
+        # stored one value per sample, as process() returns it
+        np.testing.assert_array_equal(HPLCProcessing.stored_baseline(data, knots, clip=True).values, baseline.values)
+        np.testing.assert_array_equal(HPLCProcessing.stored_baseline(data, knots).values, knots.on_grid(data).values)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.baseline import als, als_batch
+from celery_tasks.hplc_multichannel import MultiChannelProcessing
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import PERIOD, CLUSTERED_PEAKS, chromatogram, synthetic_trace
+
+
+class ALSBatchTestCase(TestCase):
+    def test_rows_match_als(self):
+        y = np.array([synthetic_trace(300, seed) * scale for seed, scale in enumerate([1, 3, 0.5])])
+        niter = [10, 3, 10]
+        result = als_batch(y, 100, 0.01, niter, 1e-3)
+        for row, iterations in enumerate(niter):
+            expected = als(y[row], 100, 0.01, iterations, 1e-3)
+            np.testing.assert_allclose(result.baseline[row], expected.baseline, rtol=1e-12)
+            self.assertEqual(result.niter[row], expected.niter)
+
+
+class MultiChannelProcessingTestCase(TestCase):
+    def test_channels_match_single_channel(self):
+        # the same peaks with channel specific absorbance, noise and a negative offset on one channel
+        channels = [chromatogram(CLUSTERED_PEAKS, seed=seed).values * scale + offset
+                    for seed, scale, offset in [(0, 1, 0), (1, 0.4, 0), (2, 2, -20)]]
+        processing = MultiChannelProcessing.from_period(np.column_stack(channels), PERIOD)
+        tables, baselines = processing.process()
+        self.assertEqual(len(tables), 3)
+        for values, table, baseline in zip(channels, tables, baselines):
+            expected, expected_baseline = HPLCProcessing(processing.channel(values)).process()
+            np.testing.assert_allclose(baseline.values, expected_baseline.values, rtol=1e-9, atol=1e-9)
+            np.testing.assert_array_equal(table.apex, expected.apex)
+            np.testing.assert_allclose(table.area, expected.area, rtol=1e-6)
+
+    def test_prior_baselines(self):
+        # a channel whose prior is the fit of its own data reuses it, the others are fitted cold
+        channels = [chromatogram(CLUSTERED_PEAKS, seed=seed).values for seed in (0, 1)]
+        priors = []
+        for seed in (0, 2):
+            processing = HPLCProcessing(chromatogram(CLUSTERED_PEAKS, seed=seed))
+            processing.process()
+            priors.append(processing.baseline_prior)
+        cold = MultiChannelProcessing.from_period(np.column_stack(channels), PERIOD)
+        _, expected = cold.process()
+        processing = MultiChannelProcessing.from_period(np.column_stack(channels), PERIOD, prior_baselines=priors)
+        _, baselines = processing.process()
+        np.testing.assert_array_equal(processing.baseline_niter, [0, cold.baseline_niter[1]])
+        for baseline, expected_baseline in zip(baselines, expected):
+            np.testing.assert_allclose(baseline.values, expected_baseline.values, rtol=1e-9, atol=1e-9)
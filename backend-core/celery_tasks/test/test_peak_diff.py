@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.peak_diff import diff_peaks, peak_values
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import PEAKS, MIXED_PEAKS, chromatogram
+
+
+def store(peaks, diff, stored=()):
+    # the rows after applying diff, ids are drawn like a database would
+    rows = {o[0]: o for o in stored if o[0] not in set(diff.delete)}
+    inserted = {}
+    for row in diff.insert:
+        peak_id = max(list(rows) + [0]) + 1
+        parent = peaks.parent[row]
+        parent_id = None if parent < 0 else diff.parent_ids.get(row, inserted.get(parent))
+        rows[peak_id] = (peak_id, parent_id) + peak_values(peaks, row)
+        inserted[row] = peak_id
+    return list(rows.values())
+
+
+class PeakDiffTestCase(TestCase):
+    def setUp(self):
+        self.peaks, _ = HPLCProcessing(chromatogram(MIXED_PEAKS + PEAKS[:1])).process()
+
+    def test_insert(self):
+        diff = diff_peaks(self.peaks)
+        self.assertEqual(diff.keep, [])
+        self.assertEqual(diff.delete, [])
+        self.assertEqual(len(diff.insert), len(self.peaks))
+        # parents before their children
+        parents = self.peaks.parent[diff.insert]
+        self.assertTrue((parents[:len(self.peaks.roots)] < 0).all())
+        stored = store(self.peaks, diff)
+        self.assertEqual(sum(o[1] is not None for o in stored), len(MIXED_PEAKS) - 1)
+
+    def test_unchanged(self):
+        stored = store(self.peaks, diff_peaks(self.peaks))
+        diff = diff_peaks(self.peaks, stored)
+        self.assertEqual(len(diff), 0)
+        self.assertEqual(sorted(diff.keep), sorted(o[0] for o in stored))
+
+    def test_changed(self):
+        stored = store(self.peaks, diff_peaks(self.peaks))
+        changed = self.peaks
+        child = changed.children(changed.mixed[0])[0]
+        changed.area[child] += 1
+        diff = diff_peaks(changed, stored)
+        self.assertEqual(diff.insert, [int(child)])
+        self.assertEqual(len(diff.delete), 1)
+        parent_id = next(o[0] for o in stored if o[1] is None and np.isclose(o[3], changed.apex[changed.mixed[0]]))
+        self.assertEqual(diff.parent_ids, {int(child): parent_id})
+
+        changed.area[changed.mixed[0]] += 1
+        diff = diff_peaks(changed, store(changed, diff, stored))
+        # a rewritten parent takes its children along
+        self.assertEqual(sorted(diff.insert), sorted([int(changed.mixed[0]), int(child)]))
+        self.assertEqual(len(diff.delete), 2)
@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.peak_table import Peak, PeakTable
+
+
+class PeakTableTestCase(TestCase):
+    def setUp(self):
+        self.table = PeakTable.from_arrays([1, 4, 3, 8], [0, 2, 2.5, 7], [2, 5, 3.5, 9])
+        self.table.parent[:] = [-1, -1, 1, -1]
+
+    def test_views(self):
+        peaks = self.table.peaks()
+        self.assertEqual([o.apex for o in peaks], [1, 4, 8])
+        self.assertTrue(peaks[1].is_mixed_peak)
+        self.assertEqual(peaks[1].peaks, [self.table.peak(2)])
+        self.assertIsNone(peaks[0].gaussian_params)
+        self.assertIsNone(peaks[0].start_mau)
+
+    def test_view_writes_through(self):
+        peak = self.table.peak(2)
+        peak.area = 1.5
+        peak.gaussian_params = [1, 2, 3, 4]
+        self.assertEqual(self.table.area[2], 1.5)
+        np.testing.assert_array_equal(self.table.params[2], [1, 2, 3, 4])
+
+    def test_take_remaps_parents(self):
+        table = self.table.take([3, 1, 2])
+        self.assertEqual(table.apex.tolist(), [8, 4, 3])
+        self.assertEqual(table.parent.tolist(), [-1, -1, 1])
+
+    def test_concat(self):
+        table = PeakTable.concat([self.table, self.table])
+        self.assertEqual(len(table), 8)
+        self.assertEqual(table.parent.tolist(), [-1, -1, 1, -1, -1, -1, 5, -1])
+
+    def test_dict_roundtrip(self):
+        table = PeakTable.from_dict(self.table.to_dict())
+        np.testing.assert_array_equal(table.apex, self.table.apex)
+        np.testing.assert_array_equal(table.parent, self.table.parent)
+
+    def test_standalone_peak(self):
+        peak = Peak(2, 1, 3, 0.5, 0.7)
+        self.assertTrue(peak.is_manual_peak)
+        self.assertEqual(len(peak.table), 1)
+        self.assertEqual(peak.end_mau, 0.7)
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.baseline import ALS
+from celery_tasks.hplc.peak_table import FIT_CONVERGED
+from celery_tasks.hplc.priors import SequencePrior, PRIOR_APEX_TOLERANCE
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+
+class SequencePriorTestCase(TestCase):
+    def setUp(self):
+        params = np.array([[1, 0, 5, 0.1], [2, 0, 7, 0.1], [3, 0, 9, 0.1]], dtype=float)
+        self.prior = SequencePrior(np.array([9, 5, 7.]), params[[2, 0, 1]], np.array([0.3, 0.1, 0.2]))
+
+    def test_match(self):
+        apexes = [5.01, 7 - PRIOR_APEX_TOLERANCE / 2, 8, 9.2, 4]
+        np.testing.assert_array_equal(self.prior.match(apexes), [0, 1, -1, -1, -1])
+        np.testing.assert_array_equal(SequencePrior(np.empty(0), np.empty(0), np.empty(0)).match([1.]), [-1])
+
+    def test_seed(self):
+        baseline, params = self.prior.seed([5.02, 8])
+        self.assertAlmostEqual(baseline, 0.1)
+        np.testing.assert_allclose(params[0], [1, 0, 5.02, 0.1])
+        self.assertTrue(np.isnan(params[1]).all())
+
+    def test_dict(self):
+        processing = HPLCProcessing(chromatogram(CLUSTERED_PEAKS))
+        table, _ = processing.process()
+        prior = HPLCProcessing.sequence_prior(table, processing.baseline_prior)
+        self.assertEqual(len(prior), (table.fit_status == FIT_CONVERGED).sum())
+        restored = SequencePrior.from_dict(prior.to_dict())
+        np.testing.assert_array_equal(restored.params, prior.params)
+        np.testing.assert_array_equal(restored.baseline.knots.times, prior.baseline.knots.times)
+        np.testing.assert_array_equal(restored.baseline.knots.values, prior.baseline.knots.values)
+        self.assertTrue(restored.baseline.matches(ALS, HPLCProcessing.baseline_params(ALS)))
+        self.assertEqual(restored.baseline.digest, prior.baseline.digest)
+
+
+class SequenceProcessingTestCase(TestCase):
+    def test_warm_start(self):
+        processing = HPLCProcessing(chromatogram(CLUSTERED_PEAKS))
+        table, _ = processing.process()
+        prior = HPLCProcessing.sequence_prior(table, processing.baseline_prior)
+        # the next injection, drifted by a few samples with fresh noise
+        drifted = [(center + 0.01, height, sigma) for center, height, sigma in CLUSTERED_PEAKS]
+        data = chromatogram(drifted, seed=1)
+        cold, _ = HPLCProcessing(data).process()
+        processing = HPLCProcessing(data, sequence_prior=prior)
+        warm, _ = processing.process()
+        self.assertIs(processing.prior, prior)
+        self.assertIs(processing.prior_baseline, prior.baseline)
+        # the next prior, built on the instance as well
+        self.assertEqual(len(processing.sequence_prior(warm, processing.baseline_prior)), len(prior))
+        np.testing.assert_array_equal(warm.apex, cold.apex)
+        self.assertTrue((warm.fit_status[warm.mixed] == FIT_CONVERGED).all())
+        np.testing.assert_allclose(warm.area, cold.area, rtol=0.01)
+
+    def test_empty_prior(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        cold, _ = HPLCProcessing(data).process()
+        prior = SequencePrior(np.empty(0), np.empty(0), np.empty(0))
+        warm, _ = HPLCProcessing(data, sequence_prior=prior).process()
+        np.testing.assert_array_equal(warm.params, cold.params)
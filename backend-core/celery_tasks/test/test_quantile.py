@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.quantile import QuantileSketch
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing, THRESHOLD_QUANTILES, QUANTILE_MAX_DIFF
+
+
+def legacy_find_threshold(values):
+    quantiles = np.array([np.quantile(values, i) for i in THRESHOLD_QUANTILES])
+    index = np.argmax((quantiles[1:] - quantiles[:-1]) > QUANTILE_MAX_DIFF)
+    return quantiles[index]
+
+
+class FindThresholdTestCase(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = np.abs(np.concatenate([rng.normal(0, 0.2, 50000), rng.exponential(20, 5000)]))
+
+    def test_exact(self):
+        self.assertEqual(HPLCProcessing.find_threshold(Trace(self.values)), legacy_find_threshold(self.values))
+
+    def test_sketch(self):
+        sketch = QuantileSketch()
+        for chunk in np.array_split(self.values, 7):
+            sketch.update(chunk)
+        threshold = HPLCProcessing.find_threshold_sketch(sketch)
+        self.assertAlmostEqual(threshold, legacy_find_threshold(self.values), delta=2 * sketch.resolution)
+
+
+class QuantileSketchTestCase(TestCase):
+    def test_quantiles(self):
+        values = np.random.default_rng(1).normal(10, 3, 20000)
+        sketch = QuantileSketch.from_values(values)
+        q = np.linspace(0, 1, 21)
+        np.testing.assert_allclose(sketch.quantile(q), np.quantile(values, q), atol=sketch.resolution)
+
+    def test_merge(self):
+        rng = np.random.default_rng(2)
+        a, b = rng.normal(0, 1, 1000), rng.normal(50, 1, 1000)
+        merged = QuantileSketch.from_values(a).merge(QuantileSketch.from_values(b))
+        whole = QuantileSketch.from_values(np.concatenate([a, b]))
+        self.assertEqual(merged.offset, whole.offset)
+        np.testing.assert_array_equal(merged.counts, whole.counts)
+
+    def test_outliers(self):
+        # a spike in large units grows the bins by the decades it spans, not by its value
+        rng = np.random.default_rng(3)
+        values = np.concatenate([np.abs(rng.normal(0, 0.2, 50000)), rng.exponential(20, 5000), [1e9, -1e6]])
+        sketch = QuantileSketch.from_values(values)
+        self.assertLess(len(sketch.counts), 40000)
+        self.assertAlmostEqual(HPLCProcessing.find_threshold_sketch(sketch), legacy_find_threshold(values),
+                               delta=2 * sketch.resolution)
+        np.testing.assert_allclose(sketch.quantile([0, 1]), [-1e6, 1e9], rtol=sketch.resolution / 10)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+from unittest import TestCase, mock, skipIf
+
+import numpy as np
+
+from celery_tasks.hplc import result_cache
+from celery_tasks.hplc.result_cache import ResultCache, DiskResultCache, RedisResultCache, result_key
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+try:
+    import redis
+    redis.Redis().ping()
+except Exception:
+    redis = None
+
+
+class ResultKeyTestCase(TestCase):
+    def setUp(self):
+        self.y = np.arange(1000, dtype=np.int32)
+
+    def test_key(self):
+        key = result_key('peaks', self.y, 100, fit_engine='nnls', segments=False)
+        self.assertEqual(key, result_key('peaks', self.y.copy(), 100, segments=False, fit_engine='nnls'))
+        changed = self.y.copy()
+        changed[500] += 1
+        for other in (result_key('peaks', changed, 100, fit_engine='nnls', segments=False),
+                      result_key('peaks', self.y.astype(np.int64), 100, fit_engine='nnls', segments=False),
+                      result_key('peaks', self.y, 200, fit_engine='nnls', segments=False),
+                      result_key('peaks', self.y, 100, fit_engine='curve_fit', segments=False),
+                      result_key('baseline', self.y, 100, fit_engine='nnls', segments=False)):
+            self.assertNotEqual(key, other)
+
+    def test_algorithm_version(self):
+        key = result_key('peaks', self.y, 100)
+        with mock.patch.object(result_cache, 'ALGORITHM_VERSION', result_cache.ALGORITHM_VERSION + 1):
+            self.assertNotEqual(result_key('peaks', self.y, 100), key)
+
+
+class ResultCacheTestCase(TestCase):
+    def test_incomplete_backend(self):
+        class GetOnly(ResultCache):
+            def _get(self, key):
+                return None
+
+        # fails when created, not on the first miss
+        with self.assertRaises(TypeError):
+            GetOnly()
+
+
+class DiskResultCacheTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_results(self):
+        cache = DiskResultCache(self.directory.name)
+        processing = HPLCProcessing(chromatogram(CLUSTERED_PEAKS))
+        table, _ = processing.process()
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {'peaks': table, 'baseline': processing.baseline_knots})
+        result = cache.get('a')
+        np.testing.assert_array_equal(result['peaks'].area, table.area)
+        np.testing.assert_array_equal(result['peaks'].parent, table.parent)
+        np.testing.assert_array_equal(result['baseline'].values, processing.baseline_knots.values)
+
+    def test_lru_eviction(self):
+        cache = DiskResultCache(self.directory.name, max_bytes=3 * 1100)
+        for age, key in zip((30, 20, 10), 'abc'):
+            cache.set(key, b'x' * 1000)
+            # distinct modification times on coarse clocks
+            os.utime(os.path.join(self.directory.name, key), (time.time() - age,) * 2)
+        cache.get('a')
+        cache.set('d', b'x' * 1000)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(key) is not None for key in 'acd'], [True, True, True])
+
+
+@skipIf(redis is None, 'no redis server')
+class RedisResultCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+        client = redis.Redis()
+        prefix = f'test-hplc-result-{os.getpid()}-'
+        self.addCleanup(lambda: client.delete(*(client.keys(prefix + '*') or [prefix])))
+        cache = RedisResultCache(client, max_entries=2, prefix=prefix)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual([cache.get(key) for key in 'abc'], [1, None, 3])
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.fitting import FitExecutor
+from celery_tasks.hplc.pool import SERIAL, THREAD, PROCESS
+from celery_tasks.hplc.segments import SegmentExecutor, find_segments
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+
+class FindSegmentsTestCase(TestCase):
+    def test_cuts_at_the_lowest_sample_of_long_gaps(self):
+        values = np.ones(100)
+        values[10:20] = values[50:55] = values[60:70] = 5
+        values[30] = 0
+        values[35] = 0.5
+        # the gap 20..50 is long enough, 55..60 is not, the leading and trailing gaps are not cut
+        self.assertEqual(find_segments(Trace(values), 2, 10), [(0, 31), (30, 100)])
+        # no cut closer than margin to the signal
+        self.assertEqual(find_segments(Trace(values), 2, 10, margin=12), [(0, 36), (35, 100)])
+        self.assertEqual(find_segments(Trace(values), 2, 10, margin=20), [(0, 100)])
+
+    def test_short_excursions_do_not_break_gaps(self):
+        values = np.ones(100)
+        values[10:20] = values[60:70] = 5
+        values[40] = values[45:47] = 5
+        self.assertEqual(find_segments(Trace(values), 2, 25), [(0, 100)])
+        self.assertEqual(find_segments(Trace(values), 2, 25, max_excursion=3), [(0, 21), (20, 100)])
+
+    def test_open_end(self):
+        values = np.ones(100)
+        values[10:20] = 5
+        self.assertEqual(find_segments(Trace(values), 2, 10), [(0, 100)])
+        self.assertEqual(find_segments(Trace(values), 2, 10, margin=5, open_end=True), [(0, 26), (25, 100)])
+        self.assertEqual(find_segments(Trace(values), 2, 10, margin=40, open_end=True), [(0, 100)])
+
+    def test_no_gaps(self):
+        self.assertEqual(find_segments(Trace(np.ones(10)), 0.5, 3), [(0, 10)])
+        self.assertEqual(find_segments(Trace(np.zeros(10)), 0.5, 3), [(0, 10)])
+        self.assertEqual(find_segments(Trace(np.zeros(0)), 0.5, 3), [(0, 0)])
+
+
+class SegmentExecutorTestCase(TestCase):
+    def test_modes_match_whole_trace(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        processing = HPLCProcessing(data)
+        whole, _ = processing.process()
+        corrected = processing.corrected_data
+        self.assertGreaterEqual(len(SegmentExecutor().segments(corrected, processing.find_threshold(corrected))), 3)
+        for mode in (SERIAL, THREAD, PROCESS):
+            table, _ = HPLCProcessing(data, fit_executor=FitExecutor(THREAD, 2),
+                                      segment_executor=SegmentExecutor(mode, 2)).process()
+            for name in ('apex', 'start', 'end', 'width', 'area', 'parent', 'fit_status'):
+                np.testing.assert_allclose(getattr(table, name), getattr(whole, name), rtol=1e-6)
+            # segment times are recomputed from their own t0, fits agree up to rounding
+            np.testing.assert_allclose(table.params, whole.params, rtol=1e-6, atol=1e-6)
@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+import numpy as np
+from scipy import stats, optimize
+
+from celery_tasks.hplc.skew_gaussian import skew_gaussian, skew_gaussian_sum, skew_gaussian_jac
+from celery_tasks.hplc_processing import HPLCProcessing
+
+PARAMS = np.array([10, 1, 5, 0.3, 4, -2, 5.5, 0.2, 1, 0, 7, 0.5])
+
+
+class SkewGaussianTestCase(TestCase):
+    def setUp(self):
+        self.x = np.linspace(3, 9, 500)
+
+    def test_matches_scipy(self):
+        components = skew_gaussian(self.x, PARAMS)
+        for i, (h, a, b, c) in enumerate(PARAMS.reshape(-1, 4)):
+            np.testing.assert_allclose(components[:, i], h * stats.skewnorm.pdf(self.x, -a, b, c), atol=1e-12)
+
+    def test_non_positive_scale(self):
+        self.assertTrue(np.isnan(skew_gaussian(self.x, [1, 0, 5, -0.1])).all())
+
+    def test_jacobian(self):
+        def func(p):
+            return skew_gaussian_sum(self.x, p[0], p[1:])
+
+        p = np.concatenate([[0.5], PARAMS])
+        numeric = optimize.approx_fprime(p, func, 1e-7)
+        np.testing.assert_allclose(skew_gaussian_jac(self.x, p[0], p[1:]), numeric, atol=1e-4)
+
+    def test_fit_func_cached(self):
+        self.assertIs(HPLCProcessing.gen_fit_func(3), HPLCProcessing.gen_fit_func(3))
+        self.assertIs(HPLCProcessing.gen_fit_jac(3), HPLCProcessing.gen_fit_jac(3))
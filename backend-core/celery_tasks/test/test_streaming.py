@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.hplc_streaming import StreamingProcessor, STREAM_TOLERANCE
+from celery_tasks.test.chromatograms import PERIOD, CLUSTERED_PEAKS, chromatogram
+
+
+class StreamingProcessorTestCase(TestCase):
+    def setUp(self):
+        self.data = chromatogram(CLUSTERED_PEAKS)
+        self.expected, _ = HPLCProcessing(self.data).process()
+
+    def feed(self, stream: StreamingProcessor, size: int):
+        return [stream.feed(self.data.values[i:i + size]) for i in range(0, len(self.data), size)]
+
+    def test_confirmed_peaks(self):
+        stream = StreamingProcessor(PERIOD)
+        confirmed = self.feed(stream, 300)
+        # peaks come out as their gaps close, not all at the end
+        self.assertGreater(sum(len(o) > 0 for o in confirmed), 1)
+        self.assertEqual(len(stream.peaks), len(self.expected))
+        np.testing.assert_array_equal(stream.peaks.apex, self.expected.apex)
+        np.testing.assert_array_equal(stream.peaks.parent, self.expected.parent)
+        np.testing.assert_allclose(stream.peaks.area, self.expected.area, rtol=0.02)
+
+    def test_finish_matches_batch(self):
+        stream = StreamingProcessor(PERIOD)
+        self.feed(stream, 1000)
+        table, baseline = stream.finish()
+        np.testing.assert_array_equal(table.apex, self.expected.apex)
+        np.testing.assert_allclose(table.area, self.expected.area, rtol=1e-9)
+        self.assertEqual(len(baseline), len(self.data))
+
+    def test_finish_reuses_confirmed_segments(self):
+        # four runs of the clusters, confirmed segments the final baseline leaves alone keep their peaks
+        peaks = [(center + 30 * run, height, sigma) for run in range(4) for center, height, sigma in CLUSTERED_PEAKS]
+        self.data = chromatogram(peaks, 80000)
+        expected, expected_baseline = HPLCProcessing(self.data).process()
+        for tolerance, rtol in ((STREAM_TOLERANCE, 1e-3), (0, 1e-9)):
+            stream = StreamingProcessor(PERIOD, tolerance=tolerance)
+            self.feed(stream, 1000)
+            table, baseline = stream.finish()
+            if tolerance:
+                self.assertGreater(stream.reused_segments, 0)
+            else:
+                self.assertEqual(stream.reused_segments, 0)
+            # segment times are recomputed from their own t0
+            np.testing.assert_allclose(table.apex, expected.apex, rtol=1e-12)
+            np.testing.assert_array_equal(table.parent, expected.parent)
+            np.testing.assert_allclose(table.area, expected.area, rtol=rtol)
+            np.testing.assert_array_equal(baseline.values, expected_baseline.values)
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from celery_tasks.hplc.trace import Trace
+
+
+class TraceTestCase(TestCase):
+    def setUp(self):
+        self.period = 100
+        self.y = np.arange(1000, dtype=float)
+        self.trace = Trace.from_period(self.y, self.period)
+        self.series = pd.Series(self.y, index=[(i * self.period) / 1000 / 60 for i in range(len(self.y))])
+
+    def test_times(self):
+        np.testing.assert_allclose(self.trace.times, self.series.index.values)
+        self.assertAlmostEqual(self.trace.mps, 10)
+
+    def test_slice_matches_series_loc(self):
+        for start, end in [(0, 0.5), (0.1, 0.2), (0.10001, 0.19999), (1.2, 5), (-1, 0.01), (2, 1)]:
+            expected = self.series.loc[start:end]
+            data_slice = self.trace.slice(start, end)
+            np.testing.assert_array_equal(data_slice.values, expected.values)
+            np.testing.assert_allclose(data_slice.times, expected.index.values)
+
+    def test_slice_shares_memory(self):
+        self.assertTrue(np.shares_memory(self.trace.slice(0.1, 0.2).values, self.trace.values))
+
+    def test_downscale(self):
+        downscaled = self.trace[::4]
+        np.testing.assert_allclose(downscaled.times, self.series.index.values[::4])
+
+    def test_series_roundtrip(self):
+        trace = Trace.from_series(self.series)
+        self.assertAlmostEqual(trace.dt, self.trace.dt)
+        pd.testing.assert_series_equal(trace.to_series(), self.series, check_index_type=False)
+
+    def test_dtype(self):
+        self.assertEqual(Trace(np.arange(3)).values.dtype, np.float64)
+        self.assertEqual(Trace(np.arange(3, dtype=np.float32)).values.dtype, np.float32)
+        trace = Trace.from_period(np.arange(3), self.period, np.float32)
+        self.assertEqual(trace.values.dtype, np.float32)
+        self.assertEqual(trace[1:].values.dtype, np.float32)
+        self.assertFalse(np.shares_memory(trace.copy().values, trace.values))
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+import numpy as np
+
+from celery_tasks.hplc.area import AreaIndex
+from celery_tasks.hplc.trace import Trace
+from celery_tasks.hplc.trace_cache import TraceCache
+from celery_tasks.hplc_processing import HPLCProcessing
+from celery_tasks.test.chromatograms import CLUSTERED_PEAKS, chromatogram
+
+
+class TraceCacheTestCase(TestCase):
+    def setUp(self):
+        self.loads = []
+
+    def loader(self, length=1000):
+        def load():
+            self.loads.append(length)
+            return Trace(np.zeros(length))
+        return load
+
+    def test_tokens(self):
+        cache = TraceCache()
+        first = cache.trace(1, 'a', self.loader())
+        self.assertIs(cache.trace(1, 'a', self.loader()), first)
+        self.assertIsNot(cache.trace(1, 'b', self.loader()), first)
+        cache.invalidate(1)
+        cache.trace(1, 'b', self.loader())
+        self.assertEqual(len(self.loads), 3)
+        self.assertEqual(cache.nbytes, 8000)
+
+    def test_derived(self):
+        cache = TraceCache()
+        index = cache.derived(1, 'a', self.loader(), 'area_index', AreaIndex)
+        self.assertIs(cache.derived(1, 'a', self.loader(), 'area_index', AreaIndex), index)
+        self.assertEqual(len(self.loads), 1)
+        # the cumulative sums, the trace is not counted twice
+        self.assertEqual(cache.nbytes, 8000 + 8008)
+
+    def test_lru_eviction(self):
+        cache = TraceCache(max_bytes=20000)
+        cache.trace(1, 'a', self.loader())
+        cache.trace(2, 'a', self.loader())
+        cache.trace(1, 'a', self.loader())
+        cache.trace(3, 'a', self.loader(1500))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.nbytes, 20000)
+        cache.trace(1, 'a', self.loader())
+        cache.trace(2, 'a', self.loader())
+        self.assertEqual(self.loads, [1000, 1000, 1500, 1000])
+
+    def test_raw_peak(self):
+        data = chromatogram(CLUSTERED_PEAKS)
+        start, end = {'time': 6.4, 'mau': 6.5}, {'time': 6.9, 'mau': 6.7}
+        expected = HPLCProcessing.calc_raw_peak(data.slice(6.4, 6.9), start, end)
+        peak = HPLCProcessing.calc_raw_peak(data.slice(6.4, 6.9), start, end, AreaIndex(data))
+        self.assertEqual(peak.apex, expected.apex)
+        self.assertAlmostEqual(peak.area, expected.area, places=9)